@@ -0,0 +1,242 @@
+import argparse
+import copy
+import time
+import numpy as np
+
+def squared_distances(queries, points, point_sq_norms=None):
+    """Squared Euclidean distances between two sets of float32 vectors"""
+    if point_sq_norms is None:
+        point_sq_norms = np.einsum("ij,ij->i", points, points)
+    query_sq_norms = np.einsum("ij,ij->i", queries, queries)
+    squared = query_sq_norms[:, None] + point_sq_norms[None, :] - 2.0 * (queries @ points.T)
+    return np.maximum(squared, 0.0, out=squared)
+
+def assign_to_centroids(data, centroids, chunk_size=65536):
+    """Index of the nearest centroid for every row, computed in chunks to bound memory"""
+    centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmin(squared_distances(chunk, centroids, centroid_sq_norms), axis=1)
+    return assignments
+
+def kmeans(data, num_clusters, iterations=20, max_train_points=None, seed=0):
+    """Plain Lloyd k-means, returns (centroids, assignments for every row of data)"""
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    num_clusters = max(1, min(num_clusters, len(data)))
+
+    # Train on a random sample when the data set is large
+    train = data
+    if max_train_points and len(data) > max_train_points:
+        train = data[rng.choice(len(data), max_train_points, replace=False)]
+
+    centroids = train[rng.choice(len(train), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_to_centroids(train, centroids)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, train)
+
+        # Keep the old centroid for empty clusters, move the others to their mean
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+
+    return centroids, assign_to_centroids(data, centroids)
+
+class ExactIndex:
+    def __init__(self, gallery):
+        """Brute-force index, used as the reference for approximate search"""
+        self.gallery = np.ascontiguousarray(gallery, dtype=np.float32)
+        self.gallery_sq_norms = np.einsum("ij,ij->i", self.gallery, self.gallery)
+
+    def search(self, queries, k=1):
+        """Return (distances, rows) of the k nearest gallery rows for every query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.gallery.shape[1])
+        k = min(k, len(self.gallery))
+        squared = squared_distances(queries, self.gallery, self.gallery_sq_norms)
+        rows = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(squared, rows, axis=1)
+        order = np.argsort(top, axis=1)
+        return np.sqrt(np.take_along_axis(top, order, axis=1)), np.take_along_axis(rows, order, axis=1)
+
+class IVFIndex:
+    def __init__(self, gallery, num_lists=None, num_probes=8, pq_subvectors=0, pq_bits=8,
+                 rerank=64, iterations=20, seed=0):
+        """Inverted-file index over k-means partitions with optional product quantization
+
+        num_probes controls recall: more probed lists means more candidates.
+        With pq_subvectors > 0 candidates are pre-scored with PQ codes and only
+        the best `rerank` are re-scored exactly against the full vectors.
+        """
+        self.gallery = np.ascontiguousarray(gallery, dtype=np.float32)
+        self.gallery_sq_norms = np.einsum("ij,ij->i", self.gallery, self.gallery)
+        self.num_probes = num_probes
+        self.rerank = rerank
+
+        if num_lists is None:
+            # Rule of thumb: about sqrt(N) partitions
+            num_lists = max(1, int(np.sqrt(len(self.gallery))))
+        self.centroids, self.assignments = kmeans(self.gallery, num_lists, iterations=iterations,
+                                                  max_train_points=256 * num_lists, seed=seed)
+        self._build_lists()
+
+        self.pq_codebooks = None
+        self.pq_codes = None
+        if pq_subvectors:
+            self._train_pq(pq_subvectors, pq_bits, iterations, seed)
+
+    def _build_lists(self):
+        """Group rows by assigned centroid"""
+        # Inverted lists stored CSR style: rows of list i are list_rows[offsets[i]:offsets[i + 1]]
+        self.list_rows = np.argsort(self.assignments, kind="stable").astype(np.int64)
+        self.list_offsets = np.searchsorted(self.assignments[self.list_rows], np.arange(len(self.centroids) + 1))
+
+    def _train_pq(self, num_subvectors, bits, iterations, seed):
+        """Train one codebook per sub-vector and encode the gallery"""
+        dim = self.gallery.shape[1]
+        if dim % num_subvectors:
+            raise ValueError(f"pq_subvectors must divide the encoding size {dim}")
+        self.pq_subdim = dim // num_subvectors
+        num_codes = 2 ** bits
+
+        codebooks = []
+        codes = np.empty((len(self.gallery), num_subvectors), dtype=np.uint8 if bits <= 8 else np.uint16)
+        for m in range(num_subvectors):
+            sub = self.gallery[:, m * self.pq_subdim:(m + 1) * self.pq_subdim]
+            codebook, codes[:, m] = kmeans(sub, num_codes, iterations=iterations,
+                                           max_train_points=64 * num_codes, seed=seed + m)
+            codebooks.append(codebook)
+        self.pq_codebooks = np.stack(codebooks)
+        self.pq_codes = codes
+
+    def _encode_pq(self, vectors):
+        """PQ codes of vectors with the trained codebooks"""
+        codes = np.empty((len(vectors), len(self.pq_codebooks)), dtype=self.pq_codes.dtype)
+        for m, codebook in enumerate(self.pq_codebooks):
+            codes[:, m] = assign_to_centroids(vectors[:, m * self.pq_subdim:(m + 1) * self.pq_subdim], codebook)
+        return codes
+
+    def updated(self, keep, new_vectors):
+        """Copy of the index holding the kept rows followed by new_vectors, without retraining
+
+        keep is a boolean mask over the current rows. Centroids and PQ codebooks
+        are reused, new rows are only assigned to their nearest list and encoded.
+        The original index is left untouched.
+        """
+        new_vectors = np.asarray(new_vectors, dtype=np.float32).reshape(-1, self.gallery.shape[1])
+        index = copy.copy(self)
+        index.gallery = np.ascontiguousarray(np.concatenate([self.gallery[keep], new_vectors]))
+        index.gallery_sq_norms = np.concatenate([self.gallery_sq_norms[keep],
+                                                 np.einsum("ij,ij->i", new_vectors, new_vectors)])
+        index.assignments = np.concatenate([self.assignments[keep],
+                                            assign_to_centroids(new_vectors, self.centroids)])
+        index._build_lists()
+        if self.pq_codes is not None:
+            index.pq_codes = np.concatenate([self.pq_codes[keep], self._encode_pq(new_vectors)])
+        return index
+
+    def _candidate_rows(self, query_centroid_distances, query_index):
+        """Gallery rows stored in the lists probed for one query"""
+        num_probes = min(self.num_probes, len(self.centroids))
+        probes = np.argpartition(query_centroid_distances[query_index], num_probes - 1)[:num_probes]
+        return np.concatenate([self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+
+    def search(self, queries, k=1):
+        """Return (distances, rows) of the k approximate nearest rows for every query
+
+        Rows are padded with -1 and distances with inf when fewer than k
+        candidates were found in the probed lists.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.gallery.shape[1])
+        centroid_distances = squared_distances(queries, self.centroids)
+
+        out_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for query_index, query in enumerate(queries):
+            candidates = self._candidate_rows(centroid_distances, query_index)
+
+            if self.pq_codes is not None and len(candidates) > self.rerank:
+                # Asymmetric distance: one lookup table per query, summed over sub-vectors
+                sub_queries = query.reshape(len(self.pq_codebooks), 1, self.pq_subdim)
+                tables = ((self.pq_codebooks - sub_queries) ** 2).sum(axis=2)
+                codes = self.pq_codes[candidates]
+                approx = tables[np.arange(tables.shape[0]), codes].sum(axis=1)
+                keep = min(max(self.rerank, k), len(candidates))
+                candidates = candidates[np.argpartition(approx, keep - 1)[:keep]]
+
+            # Exact re-ranking of the surviving candidates
+            exact = squared_distances(query[None, :], self.gallery[candidates],
+                                      self.gallery_sq_norms[candidates])[0]
+            count = min(k, len(candidates))
+            best = np.argsort(exact)[:count]
+            out_distances[query_index, :count] = np.sqrt(exact[best])
+            out_rows[query_index, :count] = candidates[best]
+
+        return out_distances, out_rows
+
+def build_index(gallery, kind="exact", **options):
+    """Create a search index of the requested kind over a gallery matrix"""
+    if kind == "exact":
+        return ExactIndex(gallery)
+    if kind == "ivf":
+        return IVFIndex(gallery, **options)
+    raise ValueError(f"Unknown index kind: {kind}")
+
+def evaluate_index(index, reference, queries, k=10):
+    """Compare an approximate index with exact search on the same queries
+
+    Returns recall@1, recall@k and mean per-query latency of both indexes.
+    """
+    start = time.perf_counter()
+    _, exact_rows = reference.search(queries, k)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, approx_rows = index.search(queries, k)
+    approx_seconds = time.perf_counter() - start
+
+    recall_at_1 = np.mean(approx_rows[:, 0] == exact_rows[:, 0])
+    recall_at_k = np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx_rows, exact_rows)])
+
+    return {
+        "queries": len(queries),
+        "k": k,
+        "recall_at_1": float(recall_at_1),
+        f"recall_at_{k}": float(recall_at_k),
+        "exact_ms_per_query": 1000.0 * exact_seconds / len(queries),
+        "approx_ms_per_query": 1000.0 * approx_seconds / len(queries),
+    }
+
+# Recall/latency report on the enrolled gallery
+if __name__ == "__main__":
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='Recall/latency report for approximate face search')
+    parser.add_argument('--lists', type=int, default=None, help='Number of IVF lists (default sqrt(N))')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16], help='Probe counts to evaluate')
+    parser.add_argument('--pq', type=int, default=0, help='PQ sub-vectors (0 disables PQ)')
+    parser.add_argument('--queries', type=int, default=500, help='Number of sampled queries')
+    parser.add_argument('--noise', type=float, default=0.02, help='Noise added to sampled gallery rows')
+    args = parser.parse_args()
+
+    db = Database()
+    students = db.get_all_student_encodings()
+    gallery = np.array([student["face_encoding"] for student in students], dtype=np.float32)
+    print(f"Gallery: {len(gallery)} encodings")
+
+    # Queries are perturbed gallery rows, like a new capture of an enrolled face
+    rng = np.random.default_rng(0)
+    queries = gallery[rng.choice(len(gallery), min(args.queries, len(gallery)), replace=False)]
+    queries = queries + rng.normal(scale=args.noise, size=queries.shape).astype(np.float32)
+
+    reference = ExactIndex(gallery)
+    start = time.perf_counter()
+    index = IVFIndex(gallery, num_lists=args.lists, pq_subvectors=args.pq)
+    print(f"Built IVF index with {len(index.centroids)} lists in {time.perf_counter() - start:.2f}s")
+
+    for probes in args.probes:
+        index.num_probes = probes
+        report = evaluate_index(index, reference, queries)
+        print(f"probes={probes:4d} " + " ".join(f"{key}={value:.4f}" if isinstance(value, float) else f"{key}={value}"
+                                             for key, value in report.items()))
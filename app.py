@@ -1,14 +1,83 @@
 import argparse
 import os
-from database import Database
+from datetime import datetime
+from storage import BACKENDS, gallery_snapshot_folder, open_backend
 from register import StudentRegistration
 from recognize import FaceRecognitionAttendance
+from pipeline import RecognitionPipeline
+from attendance_writer import AttendanceWriter
+from journal import AttendanceJournal
+from video_batch import process_videos
+from multi_camera import MultiCameraHost, parse_camera_source
+from bulk_enroll import bulk_enroll, collect_students
+from compaction import compact_gallery, evaluate_compaction
+from metrics import Metrics, MetricsExporter
+from scheduler import AdaptiveScheduler
+from gallery_watcher import GalleryWatcher
+from daemon import LectureDaemon, read_timetable, schedule_lectures
+
+def recognizer_options(args, index_options):
+    """Matching and detection options from the command line"""
+    return {
+        "search": args.search,
+        "index_options": index_options,
+        "snapshot_folder": gallery_snapshot_folder(args.backend, args.db_path),
+        "detect_scale": args.detect_scale,
+        "multiscale": args.multiscale,
+        "min_face_size": args.min_face_size,
+        "tracking": args.track,
+        "reverify_seconds": args.reverify_seconds,
+        "color_regions": args.headless,
+        "motion_gating": args.motion_gate,
+        "gate_options": {"threshold": args.gate_threshold, "refresh_seconds": args.gate_refresh,
+                         "use_cascade": args.face_cascade}
+    }
+
+def scheduler_options(args):
+    """Frame scheduling options from the command line"""
+    return {
+        "base_interval": args.interval,
+        "min_interval": args.min_interval,
+        "max_interval": args.max_interval,
+        "cpu_budget": args.cpu_budget
+    }
+
+def build_recognizer(db, args, index_options, writer):
+    """Create the recognizer with the matching and detection options from the command line"""
+    # Lectures match their course roster first, the daemon switches rosters with the lectures
+    course_code = args.course if args.mode == 'lecture' else None
+    return FaceRecognitionAttendance(db, args.lecture_id, attendance_writer=writer, metrics=db.metrics,
+                                     encode_workers=args.encode_workers, course_code=course_code,
+                                     roster_fallback=args.roster_fallback, **recognizer_options(args, index_options))
+
+def run_recognition(recognition, args):
+    """Run recognition either in the single loop or in the threaded pipeline"""
+    scheduler = AdaptiveScheduler(**scheduler_options(args))
+    
+    # Pick up students enrolled while recognition is running
+    watcher = None
+    if args.watch_gallery:
+        watcher = GalleryWatcher(recognition, recognition.db, poll_interval=args.gallery_poll_seconds).start()
+    
+    try:
+        if args.pipeline:
+            RecognitionPipeline(recognition, num_workers=args.workers, scheduler=scheduler,
+                                headless=args.headless).run(duration=args.duration)
+        elif args.headless:
+            recognition.start_headless_recognition(scheduler=scheduler, duration=args.duration)
+        else:
+            recognition.start_recognition(scheduler=scheduler)
+    finally:
+        if watcher:
+            watcher.stop()
+        recognition.close()
 
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Smart Attendance System')
     parser.add_argument('--mode', type=str, default='recognize',
-                      help='Mode: register, recognize, or lecture')
+                      help='Mode: register, enroll, roster, compact, recognize, lecture, daemon, schedule, video, '
+                           'multicam, migrate, rollups, or report')
     parser.add_argument('--student_id', type=str, default=None,
                       help='Student ID for registration')
     parser.add_argument('--name', type=str, default=None,
@@ -17,20 +86,156 @@ def main():
                       help='Student Department for registration')
     parser.add_argument('--multi_capture', action='store_true',
                       help='Capture multiple face angles during registration')
+    parser.add_argument('--image_dir', type=str, default=None,
+                      help='Folder of <student_id>_<n>.jpg images for bulk enrollment')
+    parser.add_argument('--roster', type=str, default=None,
+                      help='CSV roster (student_id, name, department, image_path) for bulk enrollment, '
+                           'or of the students enrolled in --course in roster mode')
+    parser.add_argument('--reencode', action='store_true',
+                      help='Re-encode every student in enroll mode, ignoring earlier runs')
+    parser.add_argument('--prototypes', type=int, default=0,
+                      help='Keep at most this many prototype encodings per student (0 keeps all)')
+    parser.add_argument('--dedup_threshold', type=float, default=0.0,
+                      help='Drop encodings closer than this distance to one already kept (0 disables)')
+    parser.add_argument('--dry_run', action='store_true',
+                      help='In compact mode, only report the gallery size reduction')
     parser.add_argument('--lecture_id', type=str, default=None,
                       help='Lecture ID for attendance tracking')
     parser.add_argument('--course', type=str, default=None,
                       help='Course code for the lecture')
+    parser.add_argument('--roster_fallback', type=str, default='gallery', choices=['gallery', 'visitor'],
+                      help='In lecture and daemon modes, faces missing the course roster are matched against the whole '
+                           'gallery (gallery) or only flagged as visitors (visitor)')
     parser.add_argument('--instructor', type=str, default=None,
                       help='Instructor name for the lecture')
     parser.add_argument('--room', type=str, default=None,
-                      help='Room number for the lecture')
+                      help='Room number for the lecture (in daemon and schedule modes, only lectures in this room)')
+    parser.add_argument('--timetable', type=str, default=None,
+                      help='Timetable CSV (day, start, end, course_code, instructor, room) for daemon and schedule '
+                           'modes; daemon mode follows the lectures scheduled in the database without it')
+    parser.add_argument('--date_from', type=str, default=None,
+                      help='First date (YYYY-MM-DD) included in the report')
+    parser.add_argument('--date_to', type=str, default=None,
+                      help='Last date (YYYY-MM-DD) included in the report')
+    parser.add_argument('--threshold', type=float, default=75.0,
+                      help='Attendance percentage below which a student is flagged in course reports')
+    parser.add_argument('--search', type=str, default='exact', choices=['exact', 'ivf'],
+                      help='Gallery search: exact or ivf (approximate)')
+    parser.add_argument('--ivf_probes', type=int, default=8,
+                      help='Number of IVF lists probed per face (higher = better recall)')
+    parser.add_argument('--ivf_pq', type=int, default=0,
+                      help='PQ sub-vectors for the IVF index (0 disables product quantization)')
+    parser.add_argument('--detect_scale', type=float, default=1.0,
+                      help='Run face detection on the frame resized by this factor (e.g. 0.5 for speed)')
+    parser.add_argument('--multiscale', action='store_true',
+                      help='With --detect_scale, re-detect small faces at full resolution')
+    parser.add_argument('--min_face_size', type=int, default=80,
+                      help='Faces smaller than this many pixels are refined in multiscale mode')
+    parser.add_argument('--track', action='store_true',
+                      help='Track faces between frames and only encode new or unconfirmed faces')
+    parser.add_argument('--reverify_seconds', type=float, default=30.0,
+                      help='Re-encode confirmed tracked faces this often to verify their identity')
+    parser.add_argument('--motion_gate', action='store_true',
+                      help='Only run face detection on frames or regions that changed, unchanged faces keep their results')
+    parser.add_argument('--gate_threshold', type=int, default=25,
+                      help='Gray level difference (0-255) counted as a change by the motion gate')
+    parser.add_argument('--gate_refresh', type=float, default=30.0,
+                      help='Seconds between full-frame detections with --motion_gate, whatever changed')
+    parser.add_argument('--face_cascade', action='store_true',
+                      help='With --motion_gate, skip changed regions in which a Haar cascade finds no face')
+    parser.add_argument('--encode_workers', type=int, default=0,
+                      help='Encode the faces of a frame in parallel on this many worker processes (0 or 1 disables)')
+    parser.add_argument('--interval', type=float, default=1.0,
+                      help='Starting seconds between processed frames, adapted while running')
+    parser.add_argument('--min_interval', type=float, default=0.1,
+                      help='Shortest seconds between processed frames, used when new faces appear')
+    parser.add_argument('--max_interval', type=float, default=3.0,
+                      help='Longest seconds between processed frames while the scene is stable')
+    parser.add_argument('--cpu_budget', type=float, default=0.5,
+                      help='Share of one CPU core that frame processing may use (e.g. 0.5, or 2.0 with --pipeline)')
+    parser.add_argument('--headless', action='store_true',
+                      help='Run without a window: no display copy, drawing or GUI calls; stop with SIGINT/SIGTERM')
+    parser.add_argument('--duration', type=float, default=None,
+                      help='Stop recognition after this many seconds')
+    parser.add_argument('--watch_gallery', action='store_true',
+                      help='Apply student enrollments and updates to the running gallery without restarting')
+    parser.add_argument('--gallery_poll_seconds', type=float, default=5.0,
+                      help='Polling interval for gallery changes when MongoDB change streams are unavailable')
+    parser.add_argument('--pipeline', action='store_true',
+                      help='Run capture, detection, attendance writes and display on separate threads')
+    parser.add_argument('--workers', type=int, default=2,
+                      help='Number of worker threads in pipeline mode, or worker processes in video and enroll modes')
+    parser.add_argument('--videos', type=str, nargs='+', default=[],
+                      help='Recorded lecture videos to process in video mode')
+    parser.add_argument('--cameras', type=str, nargs='+', default=[],
+                      help='Camera indexes or stream URLs served by one host in multicam mode (daemon mode '
+                           'uses the first)')
+    parser.add_argument('--lecture_ids', type=str, nargs='+', default=[],
+                      help='Lecture ID for each camera in multicam mode (same order as --cameras)')
+    parser.add_argument('--chunk_seconds', type=float, default=300,
+                      help='Length of the video chunks handed to each worker process')
+    parser.add_argument('--sample_interval', type=float, default=1.0,
+                      help='Seconds of video between frames analysed in video mode')
+    parser.add_argument('--min_sightings', type=int, default=2,
+                      help='Sampled frames a student must appear on to be marked present in video mode')
+    parser.add_argument('--batch_writes', action='store_true',
+                      help='Buffer attendance marks and write them with bulk upserts')
+    parser.add_argument('--flush_ms', type=int, default=500,
+                      help='Flush interval of the batched attendance writer in milliseconds')
+    parser.add_argument('--flush_records', type=int, default=200,
+                      help='Flush the batched attendance writer once this many marks are buffered')
+    parser.add_argument('--journal', type=str, default=None,
+                      help='Append attendance marks to this local journal and replay them to the database in the background')
+    parser.add_argument('--backend', type=str, default='mongo', choices=BACKENDS,
+                      help='Storage backend: mongo (server), sqlite (embedded file) or memory (nothing persisted)')
+    parser.add_argument('--db_path', type=str, default=None,
+                      help='SQLite file (default data/attendance.db) or MongoDB connection string for --backend')
+    parser.add_argument('--metrics_jsonl', type=str, default=None,
+                      help='Append a snapshot of the recognition metrics to this JSONL file periodically')
+    parser.add_argument('--metrics_port', type=int, default=None,
+                      help='Serve the metrics in Prometheus text format on http://127.0.0.1:<port>/metrics')
+    parser.add_argument('--metrics_interval', type=float, default=10.0,
+                      help='Seconds between metrics snapshots written to --metrics_jsonl')
     
     args = parser.parse_args()
     
-    # Initialize database connection
-    db = Database()
+    # Only the live recognition modes mark attendance through the journal or the batched writer
+    writer_modes = ('recognize', 'lecture', 'daemon')
+    if (args.journal or args.batch_writes) and args.mode not in writer_modes:
+        parser.error(f"--journal and --batch_writes only apply to the {', '.join(writer_modes)} modes")
+    
+    # Instrumentation is a no-op unless an export target is given
+    metrics = None
+    exporter = None
+    if args.metrics_jsonl or args.metrics_port:
+        metrics = Metrics()
+        exporter = MetricsExporter(metrics, args.metrics_jsonl, args.metrics_interval, args.metrics_port).start()
+    
+    # Initialize the storage backend
+    db = open_backend(args.backend, args.db_path, metrics=metrics)
     
+    # Options for the approximate gallery index
+    index_options = {"num_probes": args.ivf_probes, "pq_subvectors": args.ivf_pq}
+    
+    # Optional journal or buffered attendance writer, flushed explicitly on shutdown
+    writer = None
+    if args.journal:
+        writer = AttendanceJournal(db, args.journal, metrics=metrics)
+    elif args.batch_writes:
+        writer = AttendanceWriter(db, flush_interval_ms=args.flush_ms, max_batch=args.flush_records,
+                                  metrics=metrics)
+    
+    try:
+        run_mode(db, args, index_options, writer)
+    finally:
+        if writer:
+            writer.close()
+        db.close_connection()
+        if exporter:
+            exporter.stop()
+
+def run_mode(db, args, index_options, writer):
+    """Dispatch to the selected mode"""
     if args.mode == 'register':
         # Check required arguments
         if not args.student_id or not args.name or not args.department:
@@ -39,7 +244,8 @@ def main():
             return
         
         # Initialize registration module
-        registration = StudentRegistration(db)
+        registration = StudentRegistration(db, max_prototypes=args.prototypes,
+                                           dedup_threshold=args.dedup_threshold)
         
         if args.multi_capture:
             # Register with multiple face angles
@@ -56,6 +262,36 @@ def main():
             else:
                 print(f"Failed to register student {args.student_id}")
     
+    elif args.mode == 'enroll':
+        # Bulk enrollment from stored images, resumable and idempotent
+        if not args.image_dir and not args.roster:
+            print("Error: image_dir or roster is required for bulk enrollment")
+            print("Example: python app.py --mode enroll --image_dir data/student_images --workers 8")
+            return
+        bulk_enroll(db, image_dir=args.image_dir, roster_csv=args.roster, workers=args.workers,
+                    reencode=args.reencode, max_prototypes=args.prototypes,
+                    dedup_threshold=args.dedup_threshold)
+    
+    elif args.mode == 'roster':
+        # Replace the students enrolled in a course, lectures of the course match them first
+        if not args.course or not args.roster:
+            print("Error: course and roster are required to set a course roster")
+            print("Example: python app.py --mode roster --course CS101 --roster data/cs101_roster.csv")
+            return
+        print(db.set_course_roster(args.course, collect_students(roster_csv=args.roster)))
+    
+    elif args.mode == 'compact':
+        # Reduce every stored student to a few prototype encodings
+        if not args.prototypes and not args.dedup_threshold:
+            print("Error: prototypes or dedup_threshold is required to compact the gallery")
+            print("Example: python app.py --mode compact --prototypes 5 --image_dir data/student_images")
+            return
+        compact_gallery(db, args.prototypes, args.dedup_threshold, dry_run=args.dry_run)
+        
+        # Accuracy impact measured on the stored images
+        if args.image_dir:
+            evaluate_compaction(args.image_dir, args.prototypes, args.dedup_threshold, workers=args.workers)
+    
     elif args.mode == 'lecture':
         # Create new lecture for attendance tracking
         if not args.lecture_id or not args.course or not args.instructor or not args.room:
@@ -68,21 +304,109 @@ def main():
         print(result)
         
         # Start recognition for this lecture
-        recognition = FaceRecognitionAttendance(db, args.lecture_id)
-        recognition.start_recognition()
+        recognition = build_recognizer(db, args, index_options, writer)
+        run_recognition(recognition, args)
         
         # End the lecture when recognition finishes
         db.end_lecture(args.lecture_id)
         print(f"Ended lecture {args.lecture_id}")
     
+    elif args.mode == 'daemon':
+        # Long-running recognizer opening and closing lectures from the timetable
+        recognition = build_recognizer(db, args, index_options, writer)
+        daemon = LectureDaemon(db, recognition, timetable=args.timetable, room=args.room)
+        watcher = None
+        if args.watch_gallery:
+            watcher = GalleryWatcher(recognition, db, poll_interval=args.gallery_poll_seconds).start()
+        try:
+            daemon.run(parse_camera_source(args.cameras[0]) if args.cameras else 0,
+                       scheduler=AdaptiveScheduler(**scheduler_options(args)))
+        finally:
+            if watcher:
+                watcher.stop()
+            recognition.close()
+    
+    elif args.mode == 'schedule':
+        # Store the timetable lectures of a date range, daemon mode picks them up from the database
+        if not args.timetable or not args.date_from or not args.date_to:
+            print("Error: timetable, date_from and date_to are required to schedule lectures")
+            print("Example: python app.py --mode schedule --timetable data/timetable.csv --date_from 2025-01-06 --date_to 2025-05-30")
+            return
+        count = schedule_lectures(db, read_timetable(args.timetable), datetime.strptime(args.date_from, "%Y-%m-%d").date(),
+                                  datetime.strptime(args.date_to, "%Y-%m-%d").date(), room=args.room)
+        print(f"Scheduled {count} lectures")
+    
     elif args.mode == 'recognize':
         # Regular attendance recognition (not lecture-specific)
-        recognition = FaceRecognitionAttendance(db, args.lecture_id)
-        recognition.start_recognition()
+        recognition = build_recognizer(db, args, index_options, writer)
+        run_recognition(recognition, args)
+    
+    elif args.mode == 'video':
+        # Offline attendance from recorded lectures, one lecture per video unless --lecture_id is given
+        if not args.videos or not args.course:
+            print("Error: at least one video and the course are required in video mode")
+            print("Example: python app.py --mode video --videos MATH101_23MAR.mp4 --course MATH101 --workers 4")
+            return
+        process_videos(db, args.videos, lecture_id=args.lecture_id, workers=args.workers,
+                       chunk_seconds=args.chunk_seconds, sample_interval=args.sample_interval,
+                       min_sightings=args.min_sightings, recognizer_options=recognizer_options(args, index_options),
+                       course_code=args.course, instructor=args.instructor, room=args.room)
+    
+    elif args.mode == 'multicam':
+        # One supervisor, one worker process per camera, one shared gallery
+        if not args.cameras:
+            print("Error: at least one camera is required in multicam mode")
+            print("Example: python app.py --mode multicam --cameras 0 1 rtsp://cam3/stream --lecture_ids L1 L2 L3")
+            return
+        if args.lecture_ids and len(args.lecture_ids) != len(args.cameras):
+            print("Error: --lecture_ids needs one lecture ID per camera")
+            return
+        if args.backend == 'memory':
+            print("Error: camera processes cannot share the memory backend, use --backend sqlite or mongo")
+            return
+
+        # Generate a distinct lecture ID per camera if none were given
+        lecture_ids = args.lecture_ids or [f"L_{datetime.now().strftime('%Y%m%d_%H%M')}_CAM{index}"
+                                           for index in range(len(args.cameras))]
+        host = MultiCameraHost(db, list(zip(args.cameras, lecture_ids)), recognizer_options(args, index_options),
+                               scheduler_options=scheduler_options(args),
+                               storage_options={"kind": args.backend, "path": args.db_path},
+                               course_code=args.course, instructor=args.instructor, room=args.room)
+        host.run()
+    
+    elif args.mode == 'migrate':
+        # Convert stored face encodings to the compact binary format
+        print(db.migrate_encodings_to_binary())
+    
+    elif args.mode == 'rollups':
+        # Recompute the attendance rollups from the raw records
+        print(db.rollups.rebuild())
+    
+    elif args.mode == 'report' and args.course:
+        # Course analytics answered from the rollups, no scan of the raw records
+        print(f"Attendance in {args.course}:")
+        for row in db.rollups.course_attendance(args.course, args.date_from, args.date_to):
+            flag = " (below threshold)" if row['percentage'] < args.threshold else ""
+            print(f"- {row['student_id']}: {row['attended']}/{row['lectures_held']} "
+                  f"lectures, {row['percentage']}%{flag}")
+        print("Lectures and attendance per day:")
+        for row in db.rollups.course_trend(args.course, args.date_from, args.date_to):
+            print(f"- {row['date']}: {row['lectures_held']} lectures, {row['present']} present")
+    
+    elif args.mode == 'report':
+        # Attendance counts computed on the database server
+        print("Present students per date:")
+        for row in db.count_attendance_by_date(args.date_from, args.date_to, args.lecture_id):
+            print(f"- {row['date']}: {row['present']}")
+        if not args.lecture_id:
+            print("Present students per lecture:")
+            for row in db.count_attendance_by_lecture(args.date_from, args.date_to):
+                print(f"- {row['lecture_id']} ({row['date']}): {row['present']}")
     
     else:
         print(f"Unknown mode: {args.mode}")
-        print("Available modes: register, recognize, lecture")
+        print("Available modes: register, enroll, roster, compact, recognize, lecture, daemon, schedule, video, "
+              "multicam, migrate, rollups, report")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
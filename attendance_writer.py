@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime
+from metrics import NULL_METRICS
+
+class AttendanceWriter:
+    def __init__(self, db, flush_interval_ms=500, max_batch=200, metrics=None):
+        """Buffer attendance marks in memory and write them with bulk upserts
+
+        Marks are flushed every flush_interval_ms or as soon as max_batch
+        marks are waiting, whichever comes first. Deduplication happens in
+        the database through the unique attendance indexes.
+        """
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()  # Serializes background and explicit flushes
+        self.stopped = False
+        self.retrying = False  # Last flush failed, wait a full interval before retrying
+        self.records_written = 0
+        self.metrics = metrics or NULL_METRICS
+
+        self.db.ensure_attendance_indexes()
+
+        self.thread = threading.Thread(target=self.run, name="attendance-writer", daemon=True)
+        self.thread.start()
+
+    def mark_attendance(self, student_id, lecture_id=None):
+        """Queue an attendance mark, same call as Database.mark_attendance"""
+        with self.condition:
+            self.pending.append((student_id, lecture_id, datetime.now()))
+            self.metrics.set_gauge("attendance_writer_pending", len(self.pending))
+            if len(self.pending) >= self.max_batch:
+                self.condition.notify()
+        return f"Queued attendance for student {student_id}"
+
+    def flush(self):
+        """Write all pending marks now, returns the number of new attendance records"""
+        with self.flush_lock:
+            with self.condition:
+                batch = self.pending
+                self.pending = []
+            if not batch:
+                return 0
+
+            try:
+                inserted = self.db.mark_attendance_bulk(batch)
+            except Exception as error:
+                # Keep the marks for the next flush instead of losing them
+                print(f"Attendance flush failed, will retry: {error}")
+                with self.condition:
+                    self.pending = batch + self.pending
+                    self.retrying = True
+                self.metrics.inc("attendance_writer_flush_failures_total")
+                return 0
+
+            self.retrying = False
+            self.records_written += len(batch)
+            self.metrics.inc("attendance_writer_records_total", len(batch))
+            with self.condition:
+                self.metrics.set_gauge("attendance_writer_pending", len(self.pending))
+            return inserted
+
+    def backlog(self):
+        """Marks buffered but not yet written to the database"""
+        with self.condition:
+            return {"pending_marks": len(self.pending), "written": self.records_written, "retrying": self.retrying}
+
+    def run(self):
+        """Background loop flushing on the interval or when the batch is full"""
+        while True:
+            with self.condition:
+                deadline = time.time() + self.flush_interval
+                while not self.stopped and (self.retrying or len(self.pending) < self.max_batch):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                stopped = self.stopped
+            self.flush()
+            if stopped:
+                break
+
+    def close(self):
+        """Stop the background thread and flush whatever is still pending"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
@@ -0,0 +1,310 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from database import ENCODING_SIZE
+from matcher import FaceMatcher, UNKNOWN
+from memory_backend import MemoryDatabase
+from storage import open_backend
+
+def latency_summary(samples):
+    """Count, mean and p50/p95/p99 in milliseconds of a list of durations in seconds"""
+    if not samples:
+        return {"count": 0}
+    milliseconds = np.array(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+    }
+
+def timed(function, *args):
+    """Call function and return (result, seconds)"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def load_student_images(image_dir):
+    """(student_id, image path) for every stored enrollment image"""
+    from bulk_enroll import collect_students
+    students = collect_students(image_dir)
+    return [(student_id, path) for student_id, student in students.items() for path in student["images"]]
+
+def encode_gallery(images):
+    """Encode the stored images into a gallery (encodings, student_ids, names)"""
+    from bulk_enroll import encode_image
+    encodings, student_ids = [], []
+    for student_id, path in images:
+        _, encoding = encode_image(path)
+        if encoding is not None:
+            encodings.append(encoding)
+            student_ids.append(student_id)
+    return np.array(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE), student_ids, list(student_ids)
+
+def build_frames(images, count=20, faces_per_frame=4, width=1280, height=720, face_size=200, seed=0):
+    """Compose classroom-like BGR frames by placing stored face images on a plain canvas"""
+    rng = np.random.default_rng(seed)
+    columns = max(1, width // face_size)
+    rows = max(1, height // face_size)
+    frames = []
+    for _ in range(count):
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        slots = rng.choice(columns * rows, min(faces_per_frame, columns * rows), replace=False)
+        for slot in slots:
+            _, path = images[rng.integers(len(images))]
+            face = cv2.resize(cv2.imread(path), (face_size, face_size))
+            top, left = (slot // columns) * face_size, (slot % columns) * face_size
+            frame[top:top + face_size, left:left + face_size] = face
+        frames.append(frame)
+    return frames
+
+def synthetic_gallery(num_encodings, encodings_per_student=20, seed=0):
+    """Random clustered gallery: one center per student plus per-angle noise"""
+    rng = np.random.default_rng(seed)
+    num_students = max(1, num_encodings // encodings_per_student)
+    centers = rng.normal(scale=0.1, size=(num_students, ENCODING_SIZE)).astype(np.float32)
+    owners = np.arange(num_encodings) % num_students
+    encodings = centers[owners] + rng.normal(scale=0.02, size=(num_encodings, ENCODING_SIZE)).astype(np.float32)
+    student_ids = [f"S{owner}" for owner in owners]
+    return encodings, student_ids, centers
+
+def bench_stages(recognizer, frames):
+    """Time every stage of the recognition loop separately on the given frames"""
+    import face_recognition
+
+    stages = {"color_convert": [], "detect": [], "encode": [], "match": [], "mark_attendance": [], "draw": []}
+    faces_per_frame = []
+    for frame in frames:
+        rgb_frame, seconds = timed(cv2.cvtColor, frame, cv2.COLOR_BGR2RGB)
+        stages["color_convert"].append(seconds)
+
+        face_locations, seconds = timed(recognizer.detect_faces, rgb_frame)
+        stages["detect"].append(seconds)
+        faces_per_frame.append(len(face_locations))
+
+        face_encodings, seconds = timed(face_recognition.face_encodings, rgb_frame, face_locations)
+        stages["encode"].append(seconds)
+
+        matches, seconds = timed(recognizer.identify_faces, face_encodings)
+        stages["match"].append(seconds)
+
+        for student_id, _, _ in matches:
+            if student_id != UNKNOWN:
+                _, seconds = timed(recognizer.db.mark_attendance, student_id, recognizer.lecture_id)
+                stages["mark_attendance"].append(seconds)
+
+        display_frame = frame.copy()
+        _, seconds = timed(recognizer.draw_results, display_frame, face_locations,
+                           [match[0] for match in matches], [match[1] for match in matches])
+        stages["draw"].append(seconds)
+
+    report = {stage: latency_summary(samples) for stage, samples in stages.items()}
+    report["faces_per_frame"] = round(float(np.mean(faces_per_frame)), 2) if faces_per_frame else 0.0
+    return report
+
+def bench_encoding(images, worker_counts, faces_per_frame=60, frames=5, face_size=120):
+    """Time encoding all faces of crowded frames inline and on encoding pools of growing size"""
+    import face_recognition
+    from encoding_pool import EncodingPool
+
+    # Detect once, every run encodes the same faces
+    crowd = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+             for frame in build_frames(images, frames, faces_per_frame, face_size=face_size, seed=2)]
+    locations = [face_recognition.face_locations(rgb_frame) for rgb_frame in crowd]
+    faces = sum(len(frame_locations) for frame_locations in locations)
+    print(f"encode: {faces} faces on {frames} frames")
+
+    samples = [timed(face_recognition.face_encodings, rgb_frame, frame_locations)[1]
+               for rgb_frame, frame_locations in zip(crowd, locations)]
+    inline = latency_summary(samples)
+    results = [dict(inline, workers=0, faces_per_frame=round(faces / frames, 1), speedup=1.0)]
+    for workers in worker_counts:
+        pool = EncodingPool(workers)
+        try:
+            # The first frame also waits for the workers to load the models
+            pool.encode(crowd[0], locations[0])
+            samples = [timed(pool.encode, rgb_frame, frame_locations)[1]
+                       for rgb_frame, frame_locations in zip(crowd, locations)]
+        finally:
+            pool.close()
+        result = dict(latency_summary(samples), workers=workers, faces_per_frame=round(faces / frames, 1))
+        result["speedup"] = round(inline["mean_ms"] / result["mean_ms"], 2) if result["mean_ms"] else 0.0
+        results.append(result)
+        print(f"encode: {workers} workers: {result['mean_ms']} ms per frame, {result['speedup']}x")
+    return results
+
+def bench_matching(sizes, faces_per_query=60, repeats=20, searches=("exact",), reduce="min"):
+    """Time gallery matching of one crowded frame on synthetic galleries of growing size"""
+    results = []
+    for size in sizes:
+        encodings, student_ids, centers = synthetic_gallery(size)
+        rng = np.random.default_rng(1)
+        queries = centers[rng.integers(len(centers), size=faces_per_query)]
+        queries = queries + rng.normal(scale=0.02, size=queries.shape).astype(np.float32)
+
+        for search in searches:
+            matcher, build_seconds = timed(FaceMatcher, encodings, student_ids, student_ids, 0.5, reduce, 3, search)
+            samples = [timed(matcher.match, queries)[1] for _ in range(repeats)]
+            result = {"gallery_size": size, "search": search, "faces": faces_per_query,
+                      "build_seconds": round(build_seconds, 3)}
+            result.update(latency_summary(samples))
+            results.append(result)
+            print(f"match: {size} encodings, {search}: p50 {result['p50_ms']} ms")
+    return results
+
+def bench_storage(backends, marks=2000, students=200):
+    """Time single attendance marks and bulk writes on each storage backend"""
+    results = []
+    for kind in backends:
+        # A throwaway SQLite file (and its -wal/-shm files) removed after the run
+        with tempfile.TemporaryDirectory() as folder:
+            result = bench_backend(kind, os.path.join(folder, "benchmark.db") if kind == "sqlite" else None,
+                                   marks, students)
+        results.append(result)
+        print(f"storage: {kind}: mark_attendance p50 {result['mark_attendance'].get('p50_ms')} ms, "
+              f"bulk {result['bulk_marks_per_second']} marks/s")
+    return results
+
+def bench_backend(kind, path, marks, students):
+    """Time single and bulk attendance marks on one backend"""
+    db = open_backend(kind, path)
+    try:
+        lecture_id = f"BENCH_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        db.create_lecture(lecture_id, "BENCH", "benchmark", "none")
+
+        # One round trip per recognized student, as in the recognition loop
+        samples = [timed(db.mark_attendance, f"S{index % students}", lecture_id)[1] for index in range(marks)]
+        result = {"backend": kind, "mark_attendance": latency_summary(samples)}
+
+        # The batched writers' path: one write for many marks
+        now = datetime.now()
+        batch = [(f"B{index}", lecture_id, now) for index in range(marks)]
+        inserted, seconds = timed(db.mark_attendance_bulk, batch)
+        result["bulk_marks_per_second"] = round(inserted / seconds, 1) if seconds else 0.0
+        return result
+    finally:
+        db.close_connection()
+
+def frame_source(video=None, frames=None):
+    """Yield BGR frames from a recorded video, or from prepared frames"""
+    if video:
+        cap = cv2.VideoCapture(video)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+        cap.release()
+    else:
+        for frame in frames:
+            yield frame
+
+def bench_loop(recognizer, frames, process_every=1):
+    """Run the start_recognition loop without camera or window and time every frame"""
+    recognizer.begin_session()
+    frame_times = []
+    processed_times = []
+    prev_face_locations, prev_face_ids, prev_face_names = [], [], []
+    start = time.perf_counter()
+    for frame_count, frame in enumerate(frames):
+        frame_start = time.perf_counter()
+        display_frame = frame.copy()
+
+        if frame_count % process_every == 0:
+            face_locations, matches = recognizer.process_frame(frame)
+            for student_id, name, _ in matches:
+                if student_id != UNKNOWN:
+                    recognizer.handle_recognized_student(student_id, name)
+            prev_face_locations = face_locations
+            prev_face_ids = [match[0] for match in matches]
+            prev_face_names = [match[1] for match in matches]
+            processed_times.append(time.perf_counter() - frame_start)
+
+        recognizer.draw_results(display_frame, prev_face_locations, prev_face_ids, prev_face_names)
+        frame_times.append(time.perf_counter() - frame_start)
+
+    elapsed = time.perf_counter() - start
+    recognizer.flush_attendance()
+    return {
+        "frames": len(frame_times),
+        "fps": round(len(frame_times) / elapsed, 2) if elapsed else 0.0,
+        "processed_fps": round(len(processed_times) / sum(processed_times), 2) if processed_times else 0.0,
+        "frame_latency": latency_summary(frame_times),
+        "processed_frame_latency": latency_summary(processed_times),
+        "students_marked": len(recognizer.marked_students),
+    }
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Attendance system performance benchmark (no camera or MongoDB needed)')
+    parser.add_argument('--image_dir', type=str, default='data/student_images', help='Stored student images')
+    parser.add_argument('--frames', type=int, default=20, help='Number of composed test frames')
+    parser.add_argument('--faces_per_frame', type=int, default=4, help='Faces placed on each composed frame')
+    parser.add_argument('--video', type=str, default=None, help='Recorded video used for the loop benchmark')
+    parser.add_argument('--process_every', type=int, default=1, help='Process every Nth frame in the loop benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Synthetic gallery sizes for the matching benchmark')
+    parser.add_argument('--search', type=str, nargs='+', default=['exact', 'ivf'], help='Search modes to compare')
+    parser.add_argument('--detect_scale', type=float, default=1.0, help='Detection scale of the recognizer')
+    parser.add_argument('--encode_workers', type=int, nargs='+',
+                        default=[count for count in (1, 2, 4, 8, 16) if count < cpus] + [cpus],
+                        help='Encoding pool sizes for the encoding scaling benchmark')
+    parser.add_argument('--encode_faces', type=int, default=60, help='Faces per frame in the encoding benchmark')
+    parser.add_argument('--backends', type=str, nargs='+', default=['memory', 'sqlite'],
+                        help='Storage backends to compare (add mongo to include a MongoDB server)')
+    parser.add_argument('--skip', type=str, nargs='*', default=[],
+                        help='Sections to skip: stages, matching, loop, encoding, storage')
+    parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpus": os.cpu_count(), "numpy": np.__version__, "opencv": cv2.__version__},
+        "options": vars(args),
+    }
+
+    # Progress lines (including the recognizer's own) go to stderr, stdout carries only the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        if "stages" not in args.skip or "loop" not in args.skip or "encoding" not in args.skip:
+            from recognize import FaceRecognitionAttendance
+
+            images = load_student_images(args.image_dir)
+            gallery = encode_gallery(images)
+            frames = build_frames(images, args.frames, args.faces_per_frame)
+            recognizer = FaceRecognitionAttendance(MemoryDatabase(), "BENCHMARK", gallery=gallery,
+                                                   detect_scale=args.detect_scale)
+            recognizer.cooldown_seconds = 0
+
+            if "stages" not in args.skip:
+                report["stages"] = bench_stages(recognizer, frames)
+            if "loop" not in args.skip:
+                report["loop"] = bench_loop(recognizer, frame_source(args.video, frames), args.process_every)
+            if "encoding" not in args.skip:
+                report["encoding"] = bench_encoding(images, args.encode_workers, args.encode_faces)
+
+        if "matching" not in args.skip:
+            report["matching"] = bench_matching(args.sizes, searches=args.search)
+
+        if "storage" not in args.skip:
+            report["storage"] = bench_storage(args.backends)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+        print(f"Wrote benchmark report to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from multiprocessing import Pool
+from compaction import compact_encodings
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Bump when the detector/encoder changes so every student gets re-encoded
+ENCODER_VERSION = "face_recognition-hog-v1"
+
+def collect_students(image_dir=None, roster_csv=None):
+    """Group enrollment images per student
+
+    Images named <student_id>_<n>.jpg are read from image_dir. A CSV roster
+    with student_id, name, department and optional image_path columns adds
+    names and departments, and may list the images itself.
+    """
+    students = {}
+
+    def student(student_id):
+        return students.setdefault(student_id, {"student_id": student_id, "name": None,
+                                                "department": None, "images": []})
+
+    if image_dir:
+        for file_name in sorted(os.listdir(image_dir)):
+            stem, extension = os.path.splitext(file_name)
+            if extension.lower() not in IMAGE_EXTENSIONS or "_" not in stem:
+                continue
+            student_id = stem.rsplit("_", 1)[0]
+            student(student_id)["images"].append(os.path.join(image_dir, file_name))
+
+    if roster_csv:
+        with open(roster_csv, newline="") as file:
+            for row in csv.DictReader(file):
+                entry = student(row["student_id"].strip())
+                entry["name"] = (row.get("name") or "").strip() or entry["name"]
+                entry["department"] = (row.get("department") or "").strip() or entry["department"]
+                image_path = (row.get("image_path") or "").strip()
+                if image_path and image_path not in entry["images"]:
+                    entry["images"].append(image_path)
+
+    return students
+
+def fingerprint(student):
+    """Hash of the encoder version and of every image path, size and mtime of a student"""
+    digest = hashlib.sha1(ENCODER_VERSION.encode())
+    for path in sorted(student["images"]):
+        stat = os.stat(path) if os.path.exists(path) else None
+        digest.update(f"{path}:{stat.st_size if stat else 0}:{stat.st_mtime if stat else 0}".encode())
+    return digest.hexdigest()
+
+def encode_image(path):
+    """Detect and encode the face of one enrollment image, returns (path, encoding or None)
+
+    Images without a detectable face return None rather than a guessed box,
+    a blurred or wrong image must not become a gallery encoding.
+    """
+    import face_recognition
+
+    try:
+        image = face_recognition.load_image_file(path)
+    except Exception as error:
+        print(f"Could not read {path}: {error}")
+        return path, None
+
+    face_locations = face_recognition.face_locations(image)
+    if not face_locations:
+        return path, None
+    if len(face_locations) > 1:
+        # Keep the largest face
+        face_locations = [max(face_locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))]
+
+    encodings = face_recognition.face_encodings(image, face_locations)
+    return path, encodings[0] if encodings else None
+
+def load_state(state_file):
+    """Fingerprints of the students already enrolled by earlier runs"""
+    state = {}
+    if state_file and os.path.exists(state_file):
+        with open(state_file, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Ignore a line cut short by a crash
+                    continue
+                state[entry["student_id"]] = entry["fingerprint"]
+    return state
+
+def append_state(state_file, entries):
+    """Record enrolled students so an interrupted run can resume"""
+    if not state_file:
+        return
+    folder = os.path.dirname(state_file)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(state_file, "a") as file:
+        for entry in entries:
+            file.write(json.dumps(entry) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+def bulk_enroll(db, image_dir=None, roster_csv=None, workers=None, batch_size=200,
+                state_file="data/bulk_enroll_state.jsonl", reencode=False, max_prototypes=0, dedup_threshold=0.0):
+    """Enroll or re-encode many students from image folders across a process pool
+
+    Students are encoded and written in batches. Each finished batch is
+    recorded in state_file, so a rerun skips students whose images and encoder
+    are unchanged. reencode ignores the state and encodes everyone again.
+    Writes are upserts, so running twice gives the same result. With
+    max_prototypes or dedup_threshold each student is compacted before writing.
+    """
+    start_time = time.time()
+    students = collect_students(image_dir, roster_csv)
+    done = {} if reencode else load_state(state_file)
+
+    pending = []
+    for student in students.values():
+        if not student["images"]:
+            print(f"No images for student {student['student_id']}, skipping")
+            continue
+        student["fingerprint"] = fingerprint(student)
+        if done.get(student["student_id"]) != student["fingerprint"]:
+            pending.append(student)
+
+    print(f"{len(students)} students found, {len(students) - len(pending)} already enrolled, "
+          f"{len(pending)} to encode")
+
+    enrolled = 0
+    images_encoded = 0
+    skipped = []  # Images without a detectable face, or unreadable
+    with Pool(processes=workers) as pool:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            paths = [path for student in batch for path in student["images"]]
+
+            # Encode every image of the batch in parallel
+            encodings = {}
+            for path, encoding in pool.imap_unordered(encode_image, paths, chunksize=8):
+                if encoding is not None:
+                    encodings[path] = encoding
+                else:
+                    skipped.append(path)
+            images_encoded += len(encodings)
+
+            records = []
+            for student in batch:
+                student_encodings = [encodings[path] for path in student["images"] if path in encodings]
+                if not student_encodings:
+                    print(f"No face found in any image of student {student['student_id']}")
+                    continue
+                records.append({
+                    "student_id": student["student_id"],
+                    "name": student["name"],
+                    "department": student["department"],
+                    "face_encodings": compact_encodings(student_encodings, max_prototypes, dedup_threshold)
+                })
+
+            print(db.register_students_bulk(records))
+            append_state(state_file, [{"student_id": record["student_id"],
+                                       "fingerprint": students[record["student_id"]]["fingerprint"]}
+                                      for record in records])
+            enrolled += len(records)
+            print(f"Enrolled {start + len(batch)}/{len(pending)} students")
+
+    elapsed = time.time() - start_time
+    print(f"Enrolled {enrolled} students from {images_encoded} images in {elapsed:.1f}s")
+    if skipped:
+        print(f"Skipped {len(skipped)} images without a detectable face (or unreadable):")
+        for path in sorted(skipped):
+            print(f"- {path}")
+    return enrolled
@@ -0,0 +1,122 @@
+import time
+import numpy as np
+from multiprocessing import Pool
+from ann_index import kmeans
+from database import ENCODING_SIZE
+from matcher import FaceMatcher
+
+def drop_near_duplicates(encodings, threshold):
+    """Greedily drop encodings closer than threshold to one already kept"""
+    kept = []
+    for encoding in encodings:
+        if not kept or np.min(np.linalg.norm(np.array(kept) - encoding, axis=1)) >= threshold:
+            kept.append(encoding)
+    return np.array(kept, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+def compact_encodings(encodings, max_prototypes=5, dedup_threshold=0.0):
+    """Reduce the encodings of one student to a few prototypes
+
+    Near-duplicates (closer than dedup_threshold) are dropped first, then
+    the remaining encodings are clustered into at most max_prototypes
+    k-means centroids. A value of 0 disables either step.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    if dedup_threshold > 0:
+        encodings = drop_near_duplicates(encodings, dedup_threshold)
+    if max_prototypes and len(encodings) > max_prototypes:
+        encodings, _ = kmeans(encodings, max_prototypes, iterations=25)
+    return encodings
+
+def compact_gallery(db, max_prototypes=5, dedup_threshold=0.0, batch_size=500, dry_run=False):
+    """Compact the stored encodings of every student, returns the size report"""
+    encodings_before = 0
+    encodings_after = 0
+    students = 0
+    records = []
+
+    for student in db.iter_student_encodings():
+        compacted = compact_encodings(student["face_encodings"], max_prototypes, dedup_threshold)
+        students += 1
+        encodings_before += len(student["face_encodings"])
+        encodings_after += len(compacted)
+
+        # Only rewrite students that actually shrink
+        if len(compacted) < len(student["face_encodings"]):
+            records.append({"student_id": student["student_id"], "face_encodings": compacted})
+
+        if len(records) >= batch_size:
+            if not dry_run:
+                print(db.register_students_bulk(records))
+            records = []
+
+    if records and not dry_run:
+        print(db.register_students_bulk(records))
+
+    report = {
+        "students": students,
+        "encodings_before": encodings_before,
+        "encodings_after": encodings_after,
+        "reduction": round(1.0 - encodings_after / encodings_before, 3) if encodings_before else 0.0,
+        "gallery_mb_before": round(encodings_before * ENCODING_SIZE * 4 / 1e6, 2),
+        "gallery_mb_after": round(encodings_after * ENCODING_SIZE * 4 / 1e6, 2),
+        "dry_run": dry_run,
+    }
+    print("Gallery compaction:", report)
+    return report
+
+def identification_accuracy(matcher, probes):
+    """Share of (student_id, encoding) probes identified as the right student, and mean match time"""
+    if not probes:
+        return 0.0, 0.0
+    start = time.perf_counter()
+    matches = matcher.match(np.array([encoding for _, encoding in probes]))
+    elapsed = time.perf_counter() - start
+    correct = sum(1 for (student_id, _), (matched_id, _, _) in zip(probes, matches) if matched_id == student_id)
+    return correct / len(probes), 1000.0 * elapsed / len(probes)
+
+def evaluate_compaction(image_dir, max_prototypes=5, dedup_threshold=0.0, workers=None, tolerance=0.5):
+    """Measure the accuracy impact of compaction on the stored student images
+
+    Each student's images are split in two: even images build the gallery,
+    odd images are the probes. The full gallery keeps every enrollment
+    encoding, the compacted one only the prototypes.
+    """
+    from bulk_enroll import collect_students, encode_image
+
+    students = collect_students(image_dir)
+    paths = [path for student in students.values() for path in student["images"]]
+    with Pool(processes=workers) as pool:
+        encodings = {path: encoding for path, encoding in pool.imap_unordered(encode_image, paths, chunksize=8)
+                     if encoding is not None}
+
+    full = ([], [])
+    compacted = ([], [])
+    probes = []
+    for student_id, student in students.items():
+        student_encodings = [encodings[path] for path in student["images"] if path in encodings]
+        enrollment = student_encodings[0::2]
+        probes.extend((student_id, encoding) for encoding in student_encodings[1::2])
+        if not enrollment:
+            continue
+        full[0].extend(enrollment)
+        full[1].extend([student_id] * len(enrollment))
+        prototypes = compact_encodings(enrollment, max_prototypes, dedup_threshold)
+        compacted[0].extend(prototypes)
+        compacted[1].extend([student_id] * len(prototypes))
+
+    full_accuracy, full_ms = identification_accuracy(FaceMatcher(full[0], full[1], full[1], tolerance), probes)
+    compact_accuracy, compact_ms = identification_accuracy(
+        FaceMatcher(compacted[0], compacted[1], compacted[1], tolerance), probes)
+
+    report = {
+        "students": len(students),
+        "probes": len(probes),
+        "gallery_full": len(full[0]),
+        "gallery_compacted": len(compacted[0]),
+        "accuracy_full": round(full_accuracy, 4),
+        "accuracy_compacted": round(compact_accuracy, 4),
+        "match_ms_per_face_full": round(full_ms, 4),
+        "match_ms_per_face_compacted": round(compact_ms, 4),
+    }
+    print("Compaction accuracy:", report)
+    return report
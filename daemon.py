@@ -0,0 +1,141 @@
+import csv
+import time
+from datetime import date, datetime, timedelta
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def read_timetable(path):
+    """Read a timetable CSV with day, start, end, course_code, instructor and room columns
+
+    day is a weekday (Mon, Tuesday, ...) for weekly lectures or a YYYY-MM-DD
+    date for a single one, start and end are HH:MM.
+    """
+    entries = []
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            day = row["day"].strip()
+            entries.append({
+                "day": DAYS.index(day[:3].lower()) if day[:3].lower() in DAYS else date.fromisoformat(day),
+                "start": datetime.strptime(row["start"].strip(), "%H:%M").time(),
+                "end": datetime.strptime(row["end"].strip(), "%H:%M").time(),
+                "course_code": row["course_code"].strip(),
+                "instructor": (row.get("instructor") or "").strip(),
+                "room": (row.get("room") or "").strip()
+            })
+    return entries
+
+def timetable_lectures(entries, day, room=None):
+    """Lectures of the timetable on one date, optionally in one room, by start time"""
+    lectures = []
+    for entry in entries:
+        if entry["day"] != day and entry["day"] != day.weekday():
+            continue
+        if room and entry["room"] != room:
+            continue
+        start_time = datetime.combine(day, entry["start"])
+        lectures.append({
+            "lecture_id": f"{entry['course_code']}_{start_time.strftime('%Y%m%d_%H%M')}",
+            "course_code": entry["course_code"],
+            "instructor": entry["instructor"],
+            "room": entry["room"],
+            "start_time": start_time,
+            "end_time": datetime.combine(day, entry["end"])
+        })
+    return sorted(lectures, key=lambda lecture: lecture["start_time"])
+
+def schedule_lectures(db, entries, date_from, date_to, room=None):
+    """Store the timetable lectures between two dates as scheduled lectures, returns the number stored"""
+    scheduled = 0
+    day = date_from
+    while day <= date_to:
+        for lecture in timetable_lectures(entries, day, room):
+            result = db.create_lecture(lecture["lecture_id"], lecture["course_code"], lecture["instructor"],
+                                       lecture["room"], lecture["start_time"], lecture["end_time"],
+                                       status="scheduled")
+            scheduled += result.startswith("Scheduled")
+        day += timedelta(days=1)
+    return scheduled
+
+class LectureDaemon:
+    def __init__(self, db, recognizer, timetable=None, room=None, refresh_seconds=60.0):
+        """Open and close lectures from a timetable in one long-running recognizer
+
+        timetable is a CSV file (see read_timetable), or None to follow the
+        lectures scheduled in the database. The gallery, models and camera
+        stay loaded; at a lecture boundary only the lecture_id and the course
+        roster of the recognizer are switched. Lectures are only read from the
+        database every refresh_seconds, so a tick is a few comparisons.
+        """
+        self.db = db
+        self.recognizer = recognizer
+        self.entries = read_timetable(timetable) if timetable else None
+        self.room = room
+        self.refresh_seconds = refresh_seconds
+        self.lectures = []       # Today's lectures, by start time
+        self.loaded_at = None    # Time the lectures were last read
+        self.finished = set()    # lecture_ids already ended by this daemon
+        self.current = None      # Lecture being recorded, None between lectures
+
+    def load_lectures(self, now):
+        """Read today's lectures from the timetable file or the database"""
+        day = now.date()
+        if self.entries is not None:
+            self.lectures = timetable_lectures(self.entries, day, self.room)
+        else:
+            start = datetime.combine(day, datetime.min.time())
+            self.lectures = [lecture for lecture in self.db.iter_lectures(start, start + timedelta(days=1), self.room)
+                             if lecture["status"] != "completed" and lecture.get("end_time")]
+        self.loaded_at = now
+
+    def due_lecture(self, now):
+        """The lecture that should be running now, None between lectures"""
+        if self.loaded_at is None or self.loaded_at.date() != now.date() or \
+           (self.entries is None and (now - self.loaded_at).total_seconds() >= self.refresh_seconds):
+            self.load_lectures(now)
+        for lecture in self.lectures:
+            if lecture["start_time"] <= now < lecture["end_time"] and lecture["lecture_id"] not in self.finished:
+                return lecture
+        return None
+
+    def tick(self, now=None):
+        """Switch lectures at their boundaries, returns True while a lecture is running"""
+        now = now or datetime.now()
+        if self.current is not None and now >= self.current["end_time"]:
+            self.finish()
+        if self.current is None:
+            lecture = self.due_lecture(now)
+            if lecture is not None:
+                self.begin(lecture)
+        return self.current is not None
+
+    def begin(self, lecture):
+        """Create (or start the scheduled) lecture and point the recognizer at it"""
+        switch_start = time.perf_counter()
+        print(self.db.create_lecture(lecture["lecture_id"], lecture["course_code"], lecture["instructor"],
+                                     lecture["room"], lecture["start_time"], lecture["end_time"]))
+        self.recognizer.switch_lecture(lecture["lecture_id"], lecture["course_code"])
+        self.current = lecture
+        print(f"Recording lecture {lecture['lecture_id']} until {lecture['end_time'].strftime('%H:%M')} "
+              f"(switched in {1000 * (time.perf_counter() - switch_start):.1f} ms)")
+
+    def finish(self):
+        """End the current lecture and stop marking until the next one"""
+        lecture_id = self.current["lecture_id"]
+        # Buffered or journaled marks of this lecture reach the database before it is ended
+        self.recognizer.flush_attendance()
+        self.recognizer.print_summary()
+        print(self.db.end_lecture(lecture_id))
+        self.recognizer.switch_lecture(None)
+        self.finished.add(lecture_id)
+        self.current = None
+
+    def run(self, camera_source=0, scheduler=None, stop_event=None):
+        """Run headless recognition until stopped, ending a lecture that is still running"""
+        print(f"Attendance daemon following {'the timetable' if self.entries is not None else 'scheduled lectures'}"
+              f"{f' in room {self.room}' if self.room else ''}")
+        try:
+            self.recognizer.start_headless_recognition(camera_source, scheduler=scheduler, stop_event=stop_event,
+                                                       on_tick=self.tick)
+        finally:
+            if self.current is not None:
+                self.finish()
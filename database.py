@@ -1,15 +1,72 @@
 import pymongo
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from bson.binary import Binary
 from datetime import datetime
 import numpy as np
+from metrics import COUNT_BUCKETS, NULL_METRICS
+from rollups import AttendanceRollups
+from storage import ENCODING_SIZE, REPORT_PROJECTION, StorageBackend, blob_encodings, encodings_blob
 
-class Database:
-    def __init__(self, connection_string="mongodb://localhost:27017/"):
-        """Initialize database connection"""
+# Storage formats of students.face_encodings, recorded in students.encoding_format
+ENCODING_FORMAT_LIST = 1    # Legacy: list of 128-element double arrays
+ENCODING_FORMAT_BINARY = 2  # Packed little-endian float32 matrix in one BSON Binary
+
+def pack_encodings(face_encodings):
+    """Pack one or more encodings into a BSON Binary of float32 values"""
+    return Binary(encodings_blob(face_encodings))
+
+def unpack_encodings(student):
+    """Decode the face encodings of a student document in either storage format"""
+    stored = student.get("face_encodings", [])
+    if student.get("encoding_format") == ENCODING_FORMAT_BINARY:
+        # Zero-copy view over the BSON buffer
+        return blob_encodings(stored)
+    return np.array(stored, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+class Database(StorageBackend):
+    def __init__(self, connection_string="mongodb://localhost:27017/", create_indexes=True, metrics=None):
+        """Initialize database connection (the MongoDB storage backend)"""
+        self.metrics = metrics or NULL_METRICS  # Write latencies, no-op unless enabled
         self.client = pymongo.MongoClient(connection_string)
         self.db = self.client["university_attendance"]
         self.students = self.db["students"]
         self.attendance = self.db["attendance"]
         self.lectures = self.db["lectures"]
+        self.course_rosters = self.db["course_rosters"]  # One document per enrolled (course_code, student_id)
+        
+        # Make sure every lookup the app does is backed by an index
+        if create_indexes:
+            self.ensure_indexes()
+        
+        # Per-student/course/day counters kept up to date as attendance is written
+        self.rollups = AttendanceRollups(self.db, create_indexes)
+    
+    def ensure_indexes(self):
+        """Create the indexes used by registration, recognition and reporting (idempotent)"""
+        try:
+            self.students.create_index("student_id", name="unique_student_id", unique=True)
+            self.lectures.create_index("lecture_id", name="unique_lecture_id", unique=True)
+        except OperationFailure as error:
+            # Existing duplicates prevent the unique index, lookups still work without it
+            print(f"Could not create unique student/lecture indexes: {error}")
+        
+        # Incremental gallery loads look up recently updated students
+        self.students.create_index("updated_on", name="updated_on")
+        self.lectures.create_index([("course_code", pymongo.ASCENDING), ("start_time", pymongo.ASCENDING)],
+                                   name="course_start_time")
+        self.lectures.create_index([("start_time", pymongo.ASCENDING), ("room", pymongo.ASCENDING)],
+                                   name="start_time_room")
+        self.course_rosters.create_index([("course_code", pymongo.ASCENDING), ("student_id", pymongo.ASCENDING)],
+                                         name="unique_course_student", unique=True)
+        
+        # Attendance lookups by student, lecture and date
+        self.ensure_attendance_indexes()
+        self.attendance.create_index([("student_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
+                                     name="student_date")
+        self.attendance.create_index([("lecture_id", pymongo.ASCENDING), ("student_id", pymongo.ASCENDING)],
+                                     name="lecture_student")
+        self.attendance.create_index([("date", pymongo.ASCENDING), ("lecture_id", pymongo.ASCENDING)],
+                                     name="date_lecture")
     
     def register_student(self, student_id, name, department, face_encodings):
         """Register a new student with face encodings"""
@@ -17,15 +74,17 @@ class Database:
         if isinstance(face_encodings, np.ndarray) and face_encodings.ndim == 1:
             face_encodings = [face_encodings]
         
-        # Convert all encodings to lists for MongoDB storage
-        face_encodings_list = [encoding.tolist() for encoding in face_encodings]
+        # Pack all encodings into one float32 binary for MongoDB storage
+        face_encodings_binary = pack_encodings(face_encodings)
         
         student_data = {
             "student_id": student_id,
             "name": name,
             "department": department,
-            "face_encodings": face_encodings_list,
-            "registered_on": datetime.now()
+            "face_encodings": face_encodings_binary,
+            "encoding_format": ENCODING_FORMAT_BINARY,
+            "registered_on": datetime.now(),
+            "updated_on": datetime.now()
         }
         
         # Check if student already exists
@@ -35,9 +94,11 @@ class Database:
             self.students.update_one(
                 {"student_id": student_id},
                 {"$set": {
-                    "face_encodings": face_encodings_list,
+                    "face_encodings": face_encodings_binary,
+                    "encoding_format": ENCODING_FORMAT_BINARY,
                     "name": name,
-                    "department": department
+                    "department": department,
+                    "updated_on": datetime.now()
                 }}
             )
             return f"Updated face data for student {student_id}"
@@ -53,33 +114,123 @@ class Database:
         if not existing:
             return f"Student {student_id} not found"
         
-        # Add new encoding to existing encodings
+        # Append to existing encodings, converting legacy list documents on the way
+        encodings = np.vstack([unpack_encodings(existing), np.asarray(face_encoding).reshape(-1, ENCODING_SIZE)])
         self.students.update_one(
             {"student_id": student_id},
-            {"$push": {"face_encodings": face_encoding.tolist()}}
+            {"$set": {
+                "face_encodings": pack_encodings(encodings),
+                "encoding_format": ENCODING_FORMAT_BINARY,
+                "updated_on": datetime.now()
+            }}
         )
         return f"Added new face encoding for student {student_id}"
     
-    def get_all_student_encodings(self):
-        """Retrieve all student face encodings"""
-        students = list(self.students.find({}, {"student_id": 1, "name": 1, "face_encodings": 1}))
-        
-        # Process students for recognition
-        processed_students = []
+    def register_students_bulk(self, students):
+        """Register or update many students with one bulk upsert
         
+        Each student is a dict with student_id, face_encodings and optionally
+        name and department. Missing names only fill in new student records.
+        """
+        operations = []
+        now = datetime.now()
         for student in students:
-            # For each encoding of this student, create a recognition entry
-            for encoding in student.get("face_encodings", []):
-                processed_students.append({
+            update = {
+                "$set": {
+                    "face_encodings": pack_encodings(student["face_encodings"]),
+                    "encoding_format": ENCODING_FORMAT_BINARY,
+                    "updated_on": now
+                },
+                "$setOnInsert": {"registered_on": now}
+            }
+            
+            # Roster data wins, otherwise keep what is already stored
+            for field, default in (("name", student["student_id"]), ("department", "")):
+                if student.get(field):
+                    update["$set"][field] = student[field]
+                else:
+                    update["$setOnInsert"][field] = default
+            
+            operations.append(pymongo.UpdateOne({"student_id": student["student_id"]}, update, upsert=True))
+        
+        if not operations:
+            return "No students to register"
+        
+        with self.metrics.timer("db_write_seconds", {"operation": "register_students_bulk"}):
+            result = self.students.bulk_write(operations, ordered=False)
+        return f"Registered {result.upserted_count} new and updated {result.modified_count} existing students"
+    
+    def iter_student_encodings(self, since=None):
+        """Yield each student with all of its face encodings as one float32 matrix
+        
+        When since is given, only students updated after that time are returned.
+        """
+        query = {}
+        if since:
+            query["updated_on"] = {"$gt": since}
+        
+        projection = {"student_id": 1, "name": 1, "face_encodings": 1, "encoding_format": 1}
+        for student in self.students.find(query, projection):
+            yield {
+                "student_id": student["student_id"],
+                "name": student["name"],
+                "face_encodings": unpack_encodings(student)
+            }
+    
+    def watch_student_encodings(self, stop_event, max_await_ms=1000):
+        """Yield students as they are inserted or updated, through a change stream
+        
+        None is yielded whenever the stream is open but idle, the first time
+        right after it opened. Raises OperationFailure on servers without
+        change streams (standalone mongod). Deleted students are not reported.
+        """
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        with self.students.watch(pipeline, full_document="updateLookup", max_await_time_ms=max_await_ms) as stream:
+            yield None
+            while stream.alive and not stop_event.is_set():
+                change = stream.try_next()
+                student = change.get("fullDocument") if change else None
+                if student is None:
+                    yield None
+                    continue
+                yield {
                     "student_id": student["student_id"],
                     "name": student["name"],
-                    "face_encoding": np.array(encoding)
-                })
+                    "face_encodings": unpack_encodings(student)
+                }
+    
+    def migrate_encodings_to_binary(self, batch_size=500):
+        """Convert legacy list-format face encodings to packed float32 binaries"""
+        query = {"encoding_format": {"$ne": ENCODING_FORMAT_BINARY}}
+        projection = {"_id": 1, "face_encodings": 1, "encoding_format": 1}
+        
+        migrated = 0
+        operations = []
+        for student in self.students.find(query, projection):
+            operations.append(pymongo.UpdateOne(
+                {"_id": student["_id"], "encoding_format": {"$ne": ENCODING_FORMAT_BINARY}},
+                {"$set": {
+                    "face_encodings": pack_encodings(unpack_encodings(student)),
+                    "encoding_format": ENCODING_FORMAT_BINARY
+                }}
+            ))
+            
+            # Write in batches to bound memory and request size
+            if len(operations) >= batch_size:
+                migrated += self.students.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        
+        if operations:
+            migrated += self.students.bulk_write(operations, ordered=False).modified_count
         
-        return processed_students
+        return f"Migrated {migrated} students to binary face encodings"
     
-    def create_lecture(self, lecture_id, course_code, instructor, room, start_time=None):
-        """Create a new lecture session"""
+    def create_lecture(self, lecture_id, course_code, instructor, room, start_time=None, end_time=None,
+                       status="active"):
+        """Create a new lecture session, or a scheduled one (status "scheduled", end_time planned)
+        
+        Creating a lecture that was scheduled before starts it.
+        """
         if not start_time:
             start_time = datetime.now()
         
@@ -89,84 +240,219 @@ class Database:
             "instructor": instructor,
             "room": room,
             "start_time": start_time,
-            "end_time": None,
-            "status": "active"
+            "end_time": end_time,
+            "status": status
         }
         
         # Check if lecture already exists
         existing = self.lectures.find_one({"lecture_id": lecture_id})
         if existing:
+            if existing.get("status") == "scheduled" and status == "active":
+                # Only the creator that actually starts it counts the lecture as held
+                if self.lectures.update_one({"lecture_id": lecture_id, "status": "scheduled"},
+                                            {"$set": {"status": "active"}}).modified_count:
+                    self.record_lecture_start(existing)
+                return f"Started scheduled lecture {lecture_id}"
             return f"Lecture {lecture_id} already exists"
         
         # Insert new lecture
         self.lectures.insert_one(lecture_data)
-        return f"Created lecture {lecture_id}"
+        if status != "scheduled":
+            self.record_lecture_start(lecture_data)
+        return f"Scheduled lecture {lecture_id}" if status == "scheduled" else f"Created lecture {lecture_id}"
+    
+    def iter_lectures(self, start_from, start_to, room=None):
+        """Lectures starting in [start_from, start_to), optionally in one room, by start time"""
+        query = {"start_time": {"$gte": start_from, "$lt": start_to}}
+        if room:
+            query["room"] = room
+        return self.lectures.find(query, {"_id": 0}).sort("start_time", pymongo.ASCENDING)
+    
+    def get_lecture(self, lecture_id):
+        """The lecture record of a lecture_id, None when there is none"""
+        return self.lectures.find_one({"lecture_id": lecture_id}, {"_id": 0})
+    
+    def set_course_roster(self, course_code, student_ids):
+        """Replace the students enrolled in a course"""
+        student_ids = sorted(set(student_ids))
+        
+        # Drop students no longer enrolled, then add the new ones without touching the rest
+        removed = self.course_rosters.delete_many({"course_code": course_code,
+                                                   "student_id": {"$nin": student_ids}}).deleted_count
+        added = 0
+        if student_ids:
+            now = datetime.now()
+            operations = [pymongo.UpdateOne({"course_code": course_code, "student_id": student_id},
+                                            {"$setOnInsert": {"enrolled_on": now}}, upsert=True)
+                          for student_id in student_ids]
+            added = self.course_rosters.bulk_write(operations, ordered=False).upserted_count
+        return f"Roster of {course_code}: {len(student_ids)} students ({added} added, {removed} removed)"
+    
+    def get_course_roster(self, course_code):
+        """Sorted student_ids enrolled in a course, empty when it has no roster"""
+        cursor = self.course_rosters.find({"course_code": course_code}, {"_id": 0, "student_id": 1})
+        return sorted(document["student_id"] for document in cursor)
     
     def end_lecture(self, lecture_id):
         """End a lecture session"""
         # Update lecture end time
-        self.lectures.update_one(
+        lecture = self.lectures.find_one_and_update(
             {"lecture_id": lecture_id},
-            {"$set": {"end_time": datetime.now(), "status": "completed"}}
+            {"$set": {"end_time": datetime.now(), "status": "completed"}},
+            return_document=pymongo.ReturnDocument.BEFORE
         )
+        
+        # Started lectures were counted as held when they started, scheduled ones are counted now
+        if lecture and lecture.get("status") == "scheduled":
+            self.record_lecture_start(lecture)
         return f"Ended lecture {lecture_id}"
     
+    def record_lecture_start(self, lecture):
+        """Count a started lecture in the rollups, a failure only leaves them to be rebuilt"""
+        try:
+            self.rollups.record_lecture_start(lecture)
+        except PyMongoError as error:
+            print(f"Could not update attendance rollups, rebuild them with --mode rollups: {error}")
+    
     def mark_attendance(self, student_id, lecture_id=None):
-        """Mark attendance for a student"""
-        timestamp = datetime.now()
-        date_str = timestamp.strftime("%Y-%m-%d")
+        """Mark attendance for a student
         
-        # If lecture_id not provided, use date-based attendance
-        if not lecture_id:
-            # Check if attendance already marked today
-            existing = self.attendance.find_one({
-                "student_id": student_id,
-                "date": date_str,
-                "lecture_id": None
-            })
+        Safe against other recognizers or a journal replay marking the same
+        student at the same time, the unique attendance indexes keep one record.
+        """
+        with self.metrics.timer("db_write_seconds", {"operation": "mark_attendance"}):
+            timestamp = datetime.now()
+            date_str = timestamp.strftime("%Y-%m-%d")
             
-            if existing:
+            # If lecture_id not provided, use date-based attendance
+            if not lecture_id:
+                # Check if attendance already marked today
+                existing = self.attendance.find_one({
+                    "student_id": student_id,
+                    "date": date_str,
+                    "lecture_id": None
+                })
+                
+                if not existing:
+                    # Create new attendance record
+                    attendance_data = {
+                        "student_id": student_id,
+                        "date": date_str,
+                        "lecture_id": None,
+                        "entry_time": timestamp,
+                        "exit_time": None,
+                        "status": "present"
+                    }
+                    try:
+                        self.attendance.insert_one(attendance_data)
+                        return f"Marked attendance for student {student_id}"
+                    except DuplicateKeyError:
+                        # Another writer created today's record first, update its exit time instead
+                        pass
+                
                 # Update exit time
                 self.attendance.update_one(
-                    {"_id": existing["_id"]},
+                    {"student_id": student_id, "date": date_str, "lecture_id": None},
                     {"$set": {"exit_time": timestamp}}
                 )
                 return f"Updated exit time for student {student_id}"
             else:
-                # Create new attendance record
-                attendance_data = {
-                    "student_id": student_id,
-                    "date": date_str,
-                    "lecture_id": None,
-                    "entry_time": timestamp,
-                    "exit_time": None,
-                    "status": "present"
-                }
-                self.attendance.insert_one(attendance_data)
-                return f"Marked attendance for student {student_id}"
-        else:
-            # Check if attendance already marked for this lecture
-            existing = self.attendance.find_one({
-                "student_id": student_id,
-                "lecture_id": lecture_id
-            })
-            
-            if existing:
-                return f"Already marked attendance for student {student_id} in lecture {lecture_id}"
-            else:
-                # Create new attendance record
-                attendance_data = {
-                    "student_id": student_id,
-                    "date": date_str,
-                    "lecture_id": lecture_id,
-                    "timestamp": timestamp,
-                    "status": "present"
-                }
-                self.attendance.insert_one(attendance_data)
+                # Create the record only if there is none for this lecture yet, in one round trip
+                try:
+                    result = self.attendance.update_one(
+                        {"student_id": student_id, "lecture_id": lecture_id},
+                        {"$setOnInsert": {"date": date_str, "timestamp": timestamp, "status": "present"}},
+                        upsert=True
+                    )
+                except DuplicateKeyError:
+                    # A concurrent upsert inserted the record first
+                    result = None
+                
+                if result is None or result.upserted_id is None:
+                    return f"Already marked attendance for student {student_id} in lecture {lecture_id}"
+                self.record_rollups([(student_id, lecture_id)])
                 return f"Marked attendance for student {student_id} in lecture {lecture_id}"
     
-    def get_attendance_report(self, date=None, lecture_id=None):
-        """Get attendance report for a specific date or lecture"""
+    def ensure_attendance_indexes(self):
+        """Create the unique indexes that let the database deduplicate attendance marks"""
+        try:
+            # One record per student and lecture
+            self.attendance.create_index(
+                [("student_id", pymongo.ASCENDING), ("lecture_id", pymongo.ASCENDING)],
+                name="unique_student_lecture", unique=True,
+                partialFilterExpression={"lecture_id": {"$type": "string"}}
+            )
+            # One record per student and day for attendance without a lecture
+            self.attendance.create_index(
+                [("student_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
+                name="unique_student_date", unique=True,
+                partialFilterExpression={"lecture_id": {"$type": "null"}}
+            )
+        except OperationFailure as error:
+            # Existing duplicate records prevent the unique index, writes still work without it
+            print(f"Could not create unique attendance indexes: {error}")
+    
+    def attendance_upsert(self, student_id, lecture_id, timestamp):
+        """Build an idempotent upsert for one attendance mark"""
+        date_str = timestamp.strftime("%Y-%m-%d")
+        
+        if not lecture_id:
+            # Date-based attendance keeps the first entry and the last exit time
+            return pymongo.UpdateOne(
+                {"student_id": student_id, "date": date_str, "lecture_id": None},
+                {"$min": {"entry_time": timestamp},
+                 "$max": {"exit_time": timestamp},
+                 "$setOnInsert": {"status": "present"}},
+                upsert=True
+            )
+        
+        # Lecture attendance is only written once
+        return pymongo.UpdateOne(
+            {"student_id": student_id, "lecture_id": lecture_id},
+            {"$setOnInsert": {"date": date_str, "timestamp": timestamp, "status": "present"}},
+            upsert=True
+        )
+    
+    def mark_attendance_bulk(self, marks):
+        """Write many (student_id, lecture_id, timestamp) marks with one bulk upsert
+        
+        Returns the number of new attendance records.
+        """
+        marks = list(marks)
+        operations = [self.attendance_upsert(student_id, lecture_id, timestamp)
+                      for student_id, lecture_id, timestamp in marks]
+        if not operations:
+            return 0
+        
+        self.metrics.observe("db_batch_size", len(operations), {"operation": "mark_attendance_bulk"}, COUNT_BUCKETS)
+        try:
+            with self.metrics.timer("db_write_seconds", {"operation": "mark_attendance_bulk"}):
+                result = self.attendance.bulk_write(operations, ordered=False)
+            upserted = list(result.upserted_ids)
+        except BulkWriteError as error:
+            # Two writers upserting the same new record race on the unique index,
+            # the loser simply retries as an update of the winner's record
+            retry = [operations[failure["index"]] for failure in error.details["writeErrors"]
+                     if failure["code"] == 11000]
+            if len(retry) < len(error.details["writeErrors"]):
+                raise
+            if retry:
+                self.attendance.bulk_write(retry, ordered=False)
+            upserted = [entry["index"] for entry in error.details["upserted"]]
+        
+        # Only records created by this write are counted in the rollups
+        self.record_rollups([(marks[index][0], marks[index][1]) for index in upserted])
+        return len(upserted)
+    
+    def record_rollups(self, new_records):
+        """Count new attendance records in the rollups, a failure only leaves them to be rebuilt"""
+        try:
+            self.rollups.record_attendance(new_records)
+        except PyMongoError as error:
+            print(f"Could not update attendance rollups, rebuild them with --mode rollups: {error}")
+    
+    def attendance_query(self, date=None, lecture_id=None, student_id=None):
+        """Build the filter shared by the attendance report queries"""
         query = {}
         
         if date:
@@ -175,13 +461,65 @@ class Database:
         if lecture_id:
             query["lecture_id"] = lecture_id
         
-        report = list(self.attendance.find(query))
-        return report
+        if student_id:
+            query["student_id"] = student_id
+        
+        return query
+    
+    def iter_attendance_report(self, date=None, lecture_id=None, student_id=None,
+                               projection=REPORT_PROJECTION, batch_size=1000):
+        """Stream attendance records through a cursor instead of loading them all"""
+        query = self.attendance_query(date, lecture_id, student_id)
+        return self.attendance.find(query, projection, batch_size=batch_size)
     
-    def get_student_attendance(self, student_id):
-        """Get attendance history for a specific student"""
-        report = list(self.attendance.find({"student_id": student_id}))
-        return report
+    def get_attendance_report_page(self, date=None, lecture_id=None, student_id=None,
+                                   page_size=100, after_id=None, projection=REPORT_PROJECTION):
+        """Get one page of attendance records, returns (records, after_id for the next page)
+        
+        Pages are keyed on _id, so each page is an index range scan rather than a skip.
+        """
+        query = self.attendance_query(date, lecture_id, student_id)
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        
+        records = list(self.attendance.find(query, projection).sort("_id", pymongo.ASCENDING).limit(page_size))
+        next_after_id = records[-1]["_id"] if len(records) == page_size else None
+        return records, next_after_id
+    
+    def date_range_query(self, date_from=None, date_to=None):
+        """Filter on the date field for an inclusive YYYY-MM-DD range"""
+        date_range = {}
+        if date_from:
+            date_range["$gte"] = date_from
+        if date_to:
+            date_range["$lte"] = date_to
+        return {"date": date_range} if date_range else {}
+    
+    def count_attendance_by_lecture(self, date_from=None, date_to=None):
+        """Count present students per lecture on the server"""
+        match = self.date_range_query(date_from, date_to)
+        match["lecture_id"] = {"$type": "string"}
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": "$lecture_id", "present": {"$sum": 1}, "date": {"$min": "$date"}}},
+            {"$sort": {"date": 1, "_id": 1}},
+            {"$project": {"_id": 0, "lecture_id": "$_id", "date": 1, "present": 1}}
+        ]
+        return list(self.attendance.aggregate(pipeline, allowDiskUse=True))
+    
+    def count_attendance_by_date(self, date_from=None, date_to=None, lecture_id=None):
+        """Count distinct students present per date on the server"""
+        match = self.date_range_query(date_from, date_to)
+        if lecture_id:
+            match["lecture_id"] = lecture_id
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": {"date": "$date", "student_id": "$student_id"}}},
+            {"$group": {"_id": "$_id.date", "present": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "date": "$_id", "present": 1}}
+        ]
+        return list(self.attendance.aggregate(pipeline, allowDiskUse=True))
     
     def close_connection(self):
         """Close the MongoDB connection"""
@@ -0,0 +1,95 @@
+import math
+import multiprocessing
+import os
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+from shared_gallery import attach_shared_memory
+
+# Per-process state of the encoding workers
+worker_memory = None
+
+def init_encoder():
+    """Load the face models once per worker process"""
+    # Importing face_recognition loads the dlib models, the slow part of starting a worker
+    import face_recognition
+
+def encode_crop(task):
+    """Encode one face from a crop in the shared arena, returns the 128-d encoding"""
+    global worker_memory
+    import face_recognition
+
+    name, offset, shape, location = task
+    # The arena is replaced when it grows, map the new one and drop the old mapping
+    if worker_memory is None or worker_memory.name != name:
+        if worker_memory is not None:
+            worker_memory.close()
+        worker_memory = attach_shared_memory(name)
+    crop = np.ndarray(shape, dtype=np.uint8, buffer=worker_memory.buf, offset=offset)
+    return face_recognition.face_encodings(crop, [location])[0]
+
+class EncodingPool:
+    def __init__(self, workers=None, min_parallel=2, arena_bytes=16 * 1024 * 1024):
+        """Encode the faces of one frame in parallel on persistent worker processes
+
+        Workers keep the face models loaded between frames. Each face is cut
+        out with half a face of margin and copied into one shared memory arena,
+        so workers read crops in place and only box coordinates and 128-value
+        encodings are pickled. Frames with fewer than min_parallel faces are
+        encoded in the calling process.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_parallel = min_parallel
+        self.lock = threading.Lock()  # One frame at a time owns the arena
+        self.memory = shared_memory.SharedMemory(create=True, size=arena_bytes)
+
+        # Spawned workers do not inherit camera handles or threads
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(self.workers, initializer=init_encoder)
+
+    def ensure_arena(self, size):
+        """Replace the arena with a larger one when a frame's crops do not fit"""
+        if size <= self.memory.size:
+            return
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 2 * self.memory.size))
+
+    def crop_box(self, image_shape, location):
+        """Crop of a face with half a face of margin, clipped to the image"""
+        top, right, bottom, left = location
+        margin = (bottom - top) // 2
+        return (max(0, top - margin), min(image_shape[1], right + margin),
+                min(image_shape[0], bottom + margin), max(0, left - margin))
+
+    def encode(self, rgb_image, face_locations):
+        """Encodings of the faces at face_locations on an RGB image, in the same order"""
+        if len(face_locations) < self.min_parallel:
+            import face_recognition
+            return face_recognition.face_encodings(rgb_image, face_locations)
+
+        boxes = [self.crop_box(rgb_image.shape, location) for location in face_locations]
+        sizes = [(bottom - top) * (right - left) * rgb_image.shape[2] for top, right, bottom, left in boxes]
+
+        with self.lock:
+            self.ensure_arena(sum(sizes))
+            tasks = []
+            offset = 0
+            for (top, right, bottom, left), (face_top, face_right, face_bottom, face_left), size in zip(
+                    boxes, face_locations, sizes):
+                crop = rgb_image[top:bottom, left:right]
+                np.ndarray(crop.shape, dtype=np.uint8, buffer=self.memory.buf, offset=offset)[:] = crop
+                tasks.append((self.memory.name, offset, crop.shape,
+                              (face_top - top, face_right - left, face_bottom - top, face_left - left)))
+                offset += size
+
+            # One chunk of faces per worker keeps the round trips to a minimum
+            chunksize = math.ceil(len(tasks) / self.workers)
+            return self.pool.map(encode_crop, tasks, chunksize=chunksize)
+
+    def close(self):
+        """Stop the workers and free the arena"""
+        self.pool.close()
+        self.pool.join()
+        self.memory.close()
+        self.memory.unlink()
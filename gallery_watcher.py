@@ -0,0 +1,86 @@
+import threading
+from datetime import datetime
+from pymongo.errors import OperationFailure, PyMongoError
+
+class GalleryWatcher:
+    def __init__(self, recognizer, db, poll_interval=5.0, batch_size=100, use_change_stream=True):
+        """Keep a running recognizer's gallery in sync with the students collection
+
+        Changes come from a MongoDB change stream when the backend supports one
+        (replica set), otherwise from polling students.updated_on every
+        poll_interval seconds. Only changed students are patched into the
+        matcher, which is swapped in without blocking recognition.
+        """
+        self.recognizer = recognizer
+        self.db = db
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.use_change_stream = use_change_stream
+        self.synced_at = recognizer.gallery_synced_at or datetime.now()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def apply(self, changed_students):
+        """Patch the recognizer with a batch of changed students"""
+        if changed_students:
+            self.recognizer.update_gallery(changed_students)
+
+    def poll_once(self):
+        """Apply every student updated since the last sync"""
+        sync_time = datetime.now()
+        self.apply(list(self.db.iter_student_encodings(since=self.synced_at)))
+        self.synced_at = sync_time
+
+    def watch(self):
+        """Apply changes from the change stream, batching those that arrive together"""
+        pending = {}
+        caught_up = False
+        for student in self.db.watch_student_encodings(self.stop_event):
+            if student is not None:
+                pending[student["student_id"]] = student
+                if len(pending) < self.batch_size:
+                    continue
+            if not caught_up:
+                # Changes made between the initial load and opening the stream
+                self.poll_once()
+                caught_up = True
+            self.apply(list(pending.values()))
+            pending = {}
+        # The stream ended (stopped, or closed by the server): keep what it already delivered
+        self.apply(list(pending.values()))
+
+    def run(self):
+        """Background loop, falls back to polling when change streams are unavailable"""
+        while self.use_change_stream and not self.stop_event.is_set():
+            try:
+                self.watch()
+                if not self.stop_event.is_set():
+                    # Closed by the server (e.g. an invalidate event): reopen, the catch-up poll applies the gap
+                    print(f"Gallery change stream closed, reopening in {self.poll_interval:g}s")
+                    self.stop_event.wait(self.poll_interval)
+            except (OperationFailure, NotImplementedError) as error:
+                print(f"Change streams unavailable ({error}), polling for gallery changes instead")
+                break
+            except PyMongoError as error:
+                # Connection reset or timeout: reopen the stream, its catch-up poll applies what was missed
+                print(f"Gallery change stream interrupted ({error}), reopening in {self.poll_interval:g}s")
+                self.stop_event.wait(self.poll_interval)
+
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as error:
+                # Keep watching, the next poll picks up the same changes
+                print(f"Gallery poll failed: {error}")
+
+    def start(self):
+        """Start watching on a background thread"""
+        self.thread = threading.Thread(target=self.run, name="gallery-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop watching"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.poll_interval + 2.0)
@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+from datetime import datetime
+from metrics import NULL_METRICS
+
+class AttendanceJournal:
+    def __init__(self, db, path="data/attendance_journal.jsonl", fsync_interval_ms=200, replay_interval_ms=1000,
+                 replay_batch=500, compact_bytes=16 * 1024 * 1024, metrics=None):
+        """Append attendance marks to a local journal and replay them to the database in the background
+
+        mark_attendance only appends a line to the journal file, it never waits
+        for the database. Appends are fsynced together every fsync_interval_ms.
+        A replay thread sends durable marks to the database with idempotent
+        bulk upserts and records how far it got in <path>.offset, so after a
+        crash replay resumes from there and marks sent twice do no harm.
+        Same interface as AttendanceWriter.
+        """
+        self.db = db
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.replay_interval = replay_interval_ms / 1000.0
+        self.replay_batch = replay_batch
+        self.compact_bytes = compact_bytes
+        self.metrics = metrics or NULL_METRICS
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.lock = threading.Lock()              # Guards appends to the journal file
+        self.sync_lock = threading.Lock()         # Serializes fsyncs and journal truncation
+        self.replay_lock = threading.Lock()       # Serializes background and explicit replays
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.file = open(path, "ab")
+        self.drop_partial_line()
+
+        self.written_size = self.file.tell()   # Bytes appended so far
+        self.synced_size = self.written_size   # Bytes known to be on disk
+        self.offset = self.read_offset()       # Bytes already replayed to the database
+        self.pending_marks = self.count_lines(self.offset, self.synced_size)
+        self.records_written = 0
+        self.last_error = None
+        self.indexes_ready = False
+
+        if self.pending_marks:
+            print(f"Attendance journal has {self.pending_marks} marks waiting to be replayed")
+
+        self.sync_thread = threading.Thread(target=self.sync_loop, name="journal-sync", daemon=True)
+        self.replay_thread = threading.Thread(target=self.replay_loop, name="journal-replay", daemon=True)
+        self.sync_thread.start()
+        self.replay_thread.start()
+
+    def drop_partial_line(self):
+        """Cut a line left incomplete by a crash so new appends start on a fresh line"""
+        size = self.file.tell()
+        if size == 0:
+            return
+        with open(self.path, "rb") as file:
+            file.seek(max(0, size - 65536))
+            tail = file.read()
+        if tail.endswith(b"\n"):
+            return
+        cut = tail.rfind(b"\n")
+        keep = size - len(tail) + cut + 1
+        print(f"Dropping {size - keep} bytes of an incomplete journal line")
+        self.file.truncate(keep)
+        self.file.seek(keep)
+
+    def read_offset(self):
+        """Replay position saved by an earlier run"""
+        try:
+            with open(self.offset_path, "r") as file:
+                offset = int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        # A journal truncated after a full replay leaves a stale, larger offset
+        return offset if offset <= self.synced_size else 0
+
+    def write_offset(self, offset):
+        """Persist the replay position atomically"""
+        temp_path = self.offset_path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(str(offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.offset_path)
+        self.offset = offset
+
+    def count_lines(self, start, end):
+        """Number of journal lines between two byte offsets"""
+        count = 0
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = file.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                count += chunk.count(b"\n")
+                remaining -= len(chunk)
+        return count
+
+    def mark_attendance(self, student_id, lecture_id=None):
+        """Journal an attendance mark, same call as Database.mark_attendance"""
+        line = (json.dumps({"student_id": student_id, "lecture_id": lecture_id,
+                            "timestamp": datetime.now().isoformat()}) + "\n").encode()
+        with self.lock:
+            self.file.write(line)
+            self.written_size += len(line)
+            self.pending_marks += 1
+        self.metrics.set_gauge("journal_backlog_marks", self.pending_marks)
+        return f"Journaled attendance for student {student_id}"
+
+    def sync(self):
+        """Group commit: fsync everything appended since the last sync"""
+        with self.sync_lock:
+            with self.lock:
+                if self.written_size == self.synced_size:
+                    return
+                self.file.flush()
+                size = self.written_size
+            # fsync outside the append lock so appends never wait on the disk
+            os.fsync(self.file.fileno())
+            self.synced_size = size
+        self.wake_event.set()
+
+    def sync_loop(self):
+        """Background loop fsyncing the journal every fsync_interval"""
+        while not self.stop_event.wait(self.fsync_interval):
+            self.sync()
+
+    def read_marks(self):
+        """Durable marks after the replay offset, returns (marks, lines read, end offset)"""
+        end = min(self.synced_size, self.offset + (1 << 20))
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read(end - self.offset)
+
+        marks = []
+        lines = 0
+        position = 0
+        while lines < self.replay_batch:
+            newline = data.find(b"\n", position)
+            if newline < 0:
+                break
+            line = data[position:newline]
+            position = newline + 1
+            lines += 1
+            try:
+                entry = json.loads(line)
+                marks.append((entry["student_id"], entry["lecture_id"], datetime.fromisoformat(entry["timestamp"])))
+            except (ValueError, KeyError):
+                print(f"Skipping unreadable journal line: {line[:80]!r}")
+        return marks, lines, self.offset + position
+
+    def replay(self):
+        """Send durable marks to the database, returns the number of new attendance records"""
+        inserted = 0
+        with self.replay_lock:
+            if not self.indexes_ready:
+                self.db.ensure_attendance_indexes()
+                self.indexes_ready = True
+
+            while self.offset < self.synced_size and not self.stop_event.is_set():
+                marks, lines, end = self.read_marks()
+                if end == self.offset:
+                    break
+                if marks:
+                    with self.metrics.timer("journal_replay_seconds"):
+                        inserted += self.db.mark_attendance_bulk(marks)
+                self.write_offset(end)
+                self.records_written += len(marks)
+                with self.lock:
+                    self.pending_marks -= lines
+                self.metrics.set_gauge("journal_backlog_marks", self.pending_marks)
+
+            self.compact()
+        self.last_error = None
+        return inserted
+
+    def compact(self):
+        """Empty the journal once everything in it was replayed and it grew large"""
+        with self.sync_lock, self.lock:
+            if self.written_size < self.compact_bytes or self.offset < self.written_size:
+                return
+            self.file.flush()
+            self.file.truncate(0)
+            self.file.seek(0)
+            self.written_size = 0
+            self.synced_size = 0
+        # A crash before the offset is reset is detected by read_offset
+        self.write_offset(0)
+
+    def replay_loop(self):
+        """Background loop replaying the journal, backing off while the database is unavailable"""
+        delay = self.replay_interval
+        while not self.stop_event.is_set():
+            self.wake_event.wait(delay)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            try:
+                self.replay()
+                delay = self.replay_interval
+            except Exception as error:
+                self.last_error = str(error)
+                self.metrics.inc("journal_replay_failures_total")
+                print(f"Attendance replay failed, {self.pending_marks} marks kept in the journal: {error}")
+                delay = min(60.0, delay * 2)
+
+    def backlog(self):
+        """Marks and bytes journaled but not yet replayed to the database"""
+        return {
+            "pending_marks": self.pending_marks,
+            "pending_bytes": self.written_size - self.offset,
+            "unsynced_bytes": self.written_size - self.synced_size,
+            "written": self.records_written,
+            "last_error": self.last_error,
+        }
+
+    def flush(self):
+        """Sync the journal and try to replay it now, returns the number of new attendance records"""
+        self.sync()
+        try:
+            return self.replay()
+        except Exception as error:
+            self.last_error = str(error)
+            print(f"Attendance replay failed, marks stay in {self.path} for the next run: {error}")
+            return 0
+
+    def close(self):
+        """Stop the background threads after a final sync and replay attempt"""
+        self.flush()
+        self.stop_event.set()
+        self.wake_event.set()
+        self.sync_thread.join()
+        self.replay_thread.join()
+        self.sync()
+        self.file.close()
+        print("Attendance journal:", self.backlog())
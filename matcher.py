@@ -0,0 +1,199 @@
+import numpy as np
+from ann_index import build_index
+from storage import ENCODING_SIZE
+
+UNKNOWN = "Unknown"
+VISITOR = "Visitor"  # Name of faces outside the course roster when they are not looked up further
+
+class FaceMatcher:
+    def __init__(self, encodings, student_ids, names, tolerance=0.5, reduce="min", top_k=3,
+                 search="exact", index_options=None, prebuilt_index=None):
+        """Build a batched matcher over a gallery of face encodings
+
+        encodings holds one row per stored encoding, student_ids and names hold
+        the owner of each row. Several rows may belong to the same student.
+        search selects brute-force ("exact") or approximate ("ivf") lookup. A
+        prebuilt index over the same rows may be passed in instead of building one.
+        """
+        if reduce not in ("min", "topk"):
+            raise ValueError(f"Unknown reduce mode: {reduce}")
+        if search not in ("exact", "ivf"):
+            raise ValueError(f"Unknown search mode: {search}")
+
+        self.tolerance = tolerance
+        self.reduce = reduce
+        self.top_k = max(1, int(top_k))
+
+        # Keep the whole gallery as one contiguous float32 matrix
+        if len(encodings) > 0:
+            matrix = np.asarray(encodings, dtype=np.float32)
+            self.gallery = np.ascontiguousarray(matrix.reshape(len(matrix), -1))
+        else:
+            self.gallery = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        self.gallery_sq_norms = np.einsum("ij,ij->i", self.gallery, self.gallery)
+
+        # Map every row to a student index so scores can be reduced per student
+        self.student_ids = []
+        self.names = []
+        self.student_index = {}
+        owners = []
+        for student_id, name in zip(student_ids, names):
+            index = self.student_index.get(student_id)
+            if index is None:
+                index = len(self.student_ids)
+                self.student_index[student_id] = index
+                self.student_ids.append(student_id)
+                self.names.append(name)
+            owners.append(index)
+        self.row_owner = np.asarray(owners, dtype=np.int32)
+
+        # Rows of each student, used by the top-k reduction
+        order = np.argsort(self.row_owner, kind="stable")
+        boundaries = np.searchsorted(self.row_owner[order], np.arange(len(self.student_ids) + 1))
+        self.student_rows = [order[boundaries[i]:boundaries[i + 1]] for i in range(len(self.student_ids))]
+
+        # Approximate index, exact search scans the matrix directly
+        self.search = search
+        self.index_options = index_options
+        self.index = prebuilt_index
+        if prebuilt_index is None and search != "exact" and len(self.gallery) > 0:
+            self.index = build_index(self.gallery, search, **(index_options or {}))
+
+    def __len__(self):
+        """Number of encodings in the gallery"""
+        return len(self.gallery)
+
+    @property
+    def num_students(self):
+        """Number of distinct students in the gallery"""
+        return len(self.student_ids)
+
+    def name_of(self, student_id):
+        """Return the name stored for a student id"""
+        index = self.student_index.get(student_id)
+        return self.names[index] if index is not None else UNKNOWN
+
+    def updated(self, changed_students):
+        """New matcher with the rows of the changed students replaced, this one is left untouched
+
+        changed_students are dicts with student_id, name and a face_encodings
+        matrix. A student without encodings is removed. Other rows are kept as
+        they are and an approximate index is patched instead of rebuilt.
+        """
+        changed_ids = {student["student_id"] for student in changed_students}
+        changed_owners = [self.student_index[student_id] for student_id in changed_ids
+                          if student_id in self.student_index]
+        keep = ~np.isin(self.row_owner, changed_owners)
+
+        kept_owners = self.row_owner[keep]
+        student_ids = [self.student_ids[owner] for owner in kept_owners]
+        names = [self.names[owner] for owner in kept_owners]
+        new_rows = [np.zeros((0, self.gallery.shape[1]), dtype=np.float32)]
+        for student in changed_students:
+            encodings = np.asarray(student["face_encodings"], dtype=np.float32).reshape(-1, self.gallery.shape[1])
+            new_rows.append(encodings)
+            student_ids.extend([student["student_id"]] * len(encodings))
+            names.extend([student["name"]] * len(encodings))
+        new_rows = np.concatenate(new_rows)
+
+        index = self.index.updated(keep, new_rows) if self.index is not None else None
+        return FaceMatcher(np.concatenate([self.gallery[keep], new_rows]), student_ids, names,
+                           tolerance=self.tolerance, reduce=self.reduce, top_k=self.top_k,
+                           search=self.search, index_options=self.index_options, prebuilt_index=index)
+
+    def subset(self, student_ids):
+        """New exact matcher over the rows of the given students, e.g. the roster of a course
+
+        A roster is small enough that scanning its rows beats any index, and
+        students without rows in this gallery are left out.
+        """
+        owners = [self.student_index[student_id] for student_id in student_ids if student_id in self.student_index]
+        rows = np.flatnonzero(np.isin(self.row_owner, owners))
+        return FaceMatcher(self.gallery[rows], [self.student_ids[owner] for owner in self.row_owner[rows]],
+                           [self.names[owner] for owner in self.row_owner[rows]],
+                           tolerance=self.tolerance, reduce=self.reduce, top_k=self.top_k)
+
+    def distances(self, face_encodings):
+        """Euclidean distances between every query face and every gallery row"""
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, self.gallery.shape[1])
+        query_sq_norms = np.einsum("ij,ij->i", queries, queries)
+
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, done as a single matrix product
+        squared = query_sq_norms[:, None] + self.gallery_sq_norms[None, :] - 2.0 * (queries @ self.gallery.T)
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared, out=squared)
+
+    def score_students(self, distances):
+        """Reduce per-row distances to the best (student index, score) per face"""
+        num_faces = distances.shape[0]
+        if self.reduce == "min":
+            best_rows = np.argmin(distances, axis=1)
+            scores = distances[np.arange(num_faces), best_rows]
+            return self.row_owner[best_rows], scores
+
+        # Top-k mean: only students owning one of the nearest rows can win
+        num_candidates = min(distances.shape[1], self.top_k * 8)
+        owners = np.empty(num_faces, dtype=np.int32)
+        scores = np.empty(num_faces, dtype=np.float32)
+        for face_index in range(num_faces):
+            row_distances = distances[face_index]
+            nearest = np.argpartition(row_distances, num_candidates - 1)[:num_candidates]
+            best_owner, best_score = -1, np.inf
+            for owner in np.unique(self.row_owner[nearest]):
+                owner_distances = row_distances[self.student_rows[owner]]
+                k = min(self.top_k, len(owner_distances))
+                score = np.partition(owner_distances, k - 1)[:k].mean()
+                if score < best_score:
+                    best_owner, best_score = owner, score
+            owners[face_index] = best_owner
+            scores[face_index] = best_score
+        return owners, scores
+
+    def score_candidates(self, distances, rows):
+        """Reduce the candidates returned by an index to the best (student index, score) per face"""
+        num_faces = distances.shape[0]
+        owners = np.full(num_faces, -1, dtype=np.int32)
+        scores = np.full(num_faces, np.inf, dtype=np.float32)
+        for face_index in range(num_faces):
+            valid = rows[face_index] >= 0
+            candidate_owners = self.row_owner[rows[face_index][valid]]
+            candidate_distances = distances[face_index][valid]
+            if len(candidate_owners) == 0:
+                continue
+
+            # Candidates come sorted by distance, so the first one is the minimum
+            if self.reduce == "min":
+                owners[face_index] = candidate_owners[0]
+                scores[face_index] = candidate_distances[0]
+                continue
+
+            for owner in np.unique(candidate_owners):
+                score = candidate_distances[candidate_owners == owner][:self.top_k].mean()
+                if score < scores[face_index]:
+                    owners[face_index], scores[face_index] = owner, score
+        return owners, scores
+
+    def match(self, face_encodings):
+        """Identify every face of a frame in one batched lookup
+
+        Returns a list of (student_id, name, distance) tuples, one per face.
+        Faces without a match under the tolerance are reported as Unknown.
+        """
+        if len(face_encodings) == 0:
+            return []
+        if len(self.gallery) == 0:
+            return [(UNKNOWN, UNKNOWN, float("inf")) for _ in face_encodings]
+
+        if self.index is None:
+            owners, scores = self.score_students(self.distances(face_encodings))
+        else:
+            distances, rows = self.index.search(face_encodings, k=self.top_k * 8)
+            owners, scores = self.score_candidates(distances, rows)
+
+        results = []
+        for owner, score in zip(owners, scores):
+            if owner >= 0 and score < self.tolerance:
+                results.append((self.student_ids[owner], self.names[owner], float(score)))
+            else:
+                results.append((UNKNOWN, UNKNOWN, float(score)))
+        return results
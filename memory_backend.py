@@ -0,0 +1,305 @@
+import threading
+from datetime import datetime
+import numpy as np
+from metrics import COUNT_BUCKETS, NULL_METRICS
+from rollups import attendance_percentages
+from storage import ENCODING_SIZE, REPORT_PROJECTION, StorageBackend, project
+
+def in_range(date, date_from=None, date_to=None):
+    """True when a YYYY-MM-DD date is in an inclusive range"""
+    return (not date_from or date >= date_from) and (not date_to or date <= date_to)
+
+class MemoryDatabase(StorageBackend):
+    def __init__(self, metrics=None):
+        """In-process storage backend for tests and benchmarks, nothing is persisted
+
+        Same marking and deduplication rules as the database backends.
+        """
+        self.metrics = metrics or NULL_METRICS
+        self.lock = threading.RLock()
+        self.students = {}     # student_id -> student, face_encodings as a float32 matrix
+        self.lectures = {}     # lecture_id -> lecture
+        self.rosters = {}      # course_code -> set of enrolled student_ids
+        self.attendance = []   # Records in insertion order, _id is the position
+        self.marks = {}        # (student_id, lecture_id) or (student_id, None, date) -> record
+        self.rollups = MemoryRollups(self)
+
+    def register_student(self, student_id, name, department, face_encodings, now=None):
+        """Register a new student with face encodings"""
+        now = now or datetime.now()
+        encodings = np.array(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self.lock:
+            existing = self.students.get(student_id)
+            self.students[student_id] = {
+                "student_id": student_id,
+                "name": name or (existing["name"] if existing else student_id),
+                "department": department or (existing["department"] if existing else ""),
+                "face_encodings": encodings,
+                "registered_on": existing["registered_on"] if existing else now,
+                "updated_on": now
+            }
+        if existing:
+            return f"Updated face data for student {student_id}"
+        return f"Registered student {student_id} successfully"
+
+    def add_face_encoding(self, student_id, face_encoding):
+        """Add an additional face encoding for an existing student"""
+        with self.lock:
+            student = self.students.get(student_id)
+            if student is None:
+                return f"Student {student_id} not found"
+            encodings = np.vstack([student["face_encodings"],
+                                   np.asarray(face_encoding, dtype=np.float32).reshape(-1, ENCODING_SIZE)])
+            # Replace rather than modify, readers may hold the old matrix
+            self.students[student_id] = dict(student, face_encodings=encodings, updated_on=datetime.now())
+        return f"Added new face encoding for student {student_id}"
+
+    def register_students_bulk(self, students):
+        """Register or update many students
+
+        Each student is a dict with student_id, face_encodings and optionally
+        name and department. Missing names only fill in new student records.
+        """
+        students = list(students)
+        if not students:
+            return "No students to register"
+
+        now = datetime.now()
+        with self.metrics.timer("db_write_seconds", {"operation": "register_students_bulk"}), self.lock:
+            before = len(self.students)
+            for student in students:
+                self.register_student(student["student_id"], student.get("name"), student.get("department"),
+                                      student["face_encodings"], now)
+            added = len(self.students) - before
+        return f"Registered {added} new and updated {len(students) - added} existing students"
+
+    def iter_student_encodings(self, since=None):
+        """Yield each student (updated after since) with all of its face encodings as one float32 matrix"""
+        with self.lock:
+            students = [student for student in self.students.values() if not since or student["updated_on"] > since]
+        for student in students:
+            yield {
+                "student_id": student["student_id"],
+                "name": student["name"],
+                "face_encodings": student["face_encodings"]
+            }
+
+    def create_lecture(self, lecture_id, course_code, instructor, room, start_time=None, end_time=None,
+                       status="active"):
+        """Create a new lecture session, or a scheduled one (status "scheduled", end_time planned)
+
+        Creating a lecture that was scheduled before starts it.
+        """
+        with self.lock:
+            existing = self.lectures.get(lecture_id)
+            if existing and existing["status"] == "scheduled" and status == "active":
+                existing["status"] = "active"
+                return f"Started scheduled lecture {lecture_id}"
+            if existing:
+                return f"Lecture {lecture_id} already exists"
+            self.lectures[lecture_id] = {
+                "lecture_id": lecture_id,
+                "course_code": course_code,
+                "instructor": instructor,
+                "room": room,
+                "start_time": start_time or datetime.now(),
+                "end_time": end_time,
+                "status": status
+            }
+        return f"Scheduled lecture {lecture_id}" if status == "scheduled" else f"Created lecture {lecture_id}"
+
+    def iter_lectures(self, start_from, start_to, room=None):
+        """Lectures starting in [start_from, start_to), optionally in one room, by start time"""
+        with self.lock:
+            lectures = [dict(lecture) for lecture in self.lectures.values()
+                        if start_from <= lecture["start_time"] < start_to and (not room or lecture["room"] == room)]
+        return sorted(lectures, key=lambda lecture: lecture["start_time"])
+
+    def get_lecture(self, lecture_id):
+        """The lecture record of a lecture_id, None when there is none"""
+        with self.lock:
+            lecture = self.lectures.get(lecture_id)
+            return dict(lecture) if lecture else None
+
+    def set_course_roster(self, course_code, student_ids):
+        """Replace the students enrolled in a course"""
+        student_ids = set(student_ids)
+        with self.lock:
+            before = self.rosters.get(course_code, set())
+            self.rosters[course_code] = student_ids
+        return (f"Roster of {course_code}: {len(student_ids)} students "
+                f"({len(student_ids - before)} added, {len(before - student_ids)} removed)")
+
+    def get_course_roster(self, course_code):
+        """Sorted student_ids enrolled in a course, empty when it has no roster"""
+        with self.lock:
+            return sorted(self.rosters.get(course_code, ()))
+
+    def end_lecture(self, lecture_id):
+        """End a lecture session"""
+        with self.lock:
+            lecture = self.lectures.get(lecture_id)
+            if lecture:
+                lecture.update(end_time=datetime.now(), status="completed")
+        return f"Ended lecture {lecture_id}"
+
+    def insert_record(self, key, record):
+        """Store a new attendance record under its deduplication key"""
+        record["_id"] = len(self.attendance)
+        self.attendance.append(record)
+        self.marks[key] = record
+
+    def mark_attendance(self, student_id, lecture_id=None):
+        """Mark attendance for a student"""
+        timestamp = datetime.now()
+        date_str = timestamp.strftime("%Y-%m-%d")
+
+        with self.lock:
+            if not lecture_id:
+                existing = self.marks.get((student_id, None, date_str))
+                if existing:
+                    existing["exit_time"] = timestamp
+                    return f"Updated exit time for student {student_id}"
+                self.insert_record((student_id, None, date_str), {
+                    "student_id": student_id, "date": date_str, "lecture_id": None,
+                    "entry_time": timestamp, "exit_time": None, "status": "present"})
+                return f"Marked attendance for student {student_id}"
+
+            if (student_id, lecture_id) in self.marks:
+                return f"Already marked attendance for student {student_id} in lecture {lecture_id}"
+            self.insert_record((student_id, lecture_id), {
+                "student_id": student_id, "date": date_str, "lecture_id": lecture_id,
+                "timestamp": timestamp, "status": "present"})
+            return f"Marked attendance for student {student_id} in lecture {lecture_id}"
+
+    def mark_attendance_bulk(self, marks):
+        """Write many (student_id, lecture_id, timestamp) marks, returns the number of new records"""
+        marks = list(marks)
+        if not marks:
+            return 0
+
+        self.metrics.observe("db_batch_size", len(marks), {"operation": "mark_attendance_bulk"}, COUNT_BUCKETS)
+        inserted = 0
+        with self.metrics.timer("db_write_seconds", {"operation": "mark_attendance_bulk"}), self.lock:
+            for student_id, lecture_id, timestamp in marks:
+                date_str = timestamp.strftime("%Y-%m-%d")
+                key = (student_id, lecture_id) if lecture_id else (student_id, None, date_str)
+                existing = self.marks.get(key)
+                if existing and not lecture_id:
+                    # Date-based attendance keeps the first entry and the last exit time
+                    existing["entry_time"] = min(existing["entry_time"], timestamp)
+                    existing["exit_time"] = max(existing["exit_time"] or timestamp, timestamp)
+                elif not existing:
+                    record = {"student_id": student_id, "date": date_str, "lecture_id": lecture_id or None,
+                              "status": "present"}
+                    if lecture_id:
+                        record["timestamp"] = timestamp
+                    else:
+                        record.update(entry_time=timestamp, exit_time=timestamp)
+                    self.insert_record(key, record)
+                    inserted += 1
+        return inserted
+
+    def matching_records(self, date=None, lecture_id=None, student_id=None, after_id=None):
+        """Snapshot of the attendance records matching the report filters"""
+        with self.lock:
+            records = self.attendance[after_id + 1:] if after_id is not None else list(self.attendance)
+            return [dict(record) for record in records
+                    if (not date or record["date"] == date)
+                    and (not lecture_id or record["lecture_id"] == lecture_id)
+                    and (not student_id or record["student_id"] == student_id)]
+
+    def iter_attendance_report(self, date=None, lecture_id=None, student_id=None,
+                               projection=REPORT_PROJECTION, batch_size=1000):
+        """Iterate over the matching attendance records"""
+        return (project(record, projection) for record in self.matching_records(date, lecture_id, student_id))
+
+    def get_attendance_report_page(self, date=None, lecture_id=None, student_id=None,
+                                   page_size=100, after_id=None, projection=REPORT_PROJECTION):
+        """Get one page of attendance records, returns (records, after_id for the next page)"""
+        records = self.matching_records(date, lecture_id, student_id, after_id)[:page_size]
+        next_after_id = records[-1]["_id"] if len(records) == page_size else None
+        return [project(record, projection) for record in records], next_after_id
+
+    def count_attendance_by_lecture(self, date_from=None, date_to=None):
+        """Count present students per lecture"""
+        counts = {}
+        for record in self.matching_records():
+            if record["lecture_id"] and in_range(record["date"], date_from, date_to):
+                row = counts.setdefault(record["lecture_id"], {"lecture_id": record["lecture_id"],
+                                                               "date": record["date"], "present": 0})
+                row["present"] += 1
+                row["date"] = min(row["date"], record["date"])
+        return sorted(counts.values(), key=lambda row: (row["date"], row["lecture_id"]))
+
+    def count_attendance_by_date(self, date_from=None, date_to=None, lecture_id=None):
+        """Count distinct students present per date"""
+        students = {}
+        for record in self.matching_records(lecture_id=lecture_id):
+            if in_range(record["date"], date_from, date_to):
+                students.setdefault(record["date"], set()).add(record["student_id"])
+        return [{"date": date, "present": len(students[date])} for date in sorted(students)]
+
+class MemoryRollups:
+    def __init__(self, database):
+        """Course analytics computed from the in-memory records on every query"""
+        self.database = database
+
+    def rebuild(self):
+        """Nothing is materialized in memory"""
+        return "In-memory rollups are computed on every query"
+
+    def lecture_days(self, course_code, date_from=None, date_to=None):
+        """lecture_id -> start date of the course lectures held (started) in the date range"""
+        with self.database.lock:
+            lectures = list(self.database.lectures.values())
+        days = {}
+        for lecture in lectures:
+            date = lecture["start_time"].strftime("%Y-%m-%d")
+            held = lecture["status"] != "scheduled"
+            if lecture["course_code"] == course_code and held and in_range(date, date_from, date_to):
+                days[lecture["lecture_id"]] = date
+        return days
+
+    def course_students(self, course_code):
+        """student_ids enrolled in a course, every registered student when it has no roster"""
+        with self.database.lock:
+            return self.database.get_course_roster(course_code) or list(self.database.students)
+
+    def course_attendance(self, course_code, date_from=None, date_to=None):
+        """Attendance percentage of every student of a course in a date range, lowest first"""
+        days = self.lecture_days(course_code, date_from, date_to)
+        attended = {}
+        for record in self.database.matching_records():
+            if record["lecture_id"] in days:
+                attended[record["student_id"]] = attended.get(record["student_id"], 0) + 1
+        return attendance_percentages(len(days), attended.items(), self.course_students(course_code))
+
+    def defaulters(self, course_code, date_from=None, date_to=None, threshold=75.0):
+        """Students of a course attending less than threshold percent in the date range"""
+        return [row for row in self.course_attendance(course_code, date_from, date_to)
+                if row["percentage"] < threshold]
+
+    def course_trend(self, course_code, date_from=None, date_to=None):
+        """Lectures held and attendance records per day of a course"""
+        days = self.lecture_days(course_code, date_from, date_to)
+        trend = {}
+        for date in days.values():
+            row = trend.setdefault(date, {"date": date, "lectures_held": 0, "present": 0})
+            row["lectures_held"] += 1
+        for record in self.database.matching_records():
+            if record["lecture_id"] in days:
+                trend[days[record["lecture_id"]]]["present"] += 1
+        return [trend[date] for date in sorted(trend)]
+
+    def student_attendance(self, student_id, course_code=None):
+        """Lectures attended per course by one student"""
+        with self.database.lock:
+            courses = {lecture_id: lecture["course_code"] for lecture_id, lecture in self.database.lectures.items()
+                       if lecture["status"] != "scheduled"}
+        attended = {}
+        for record in self.database.matching_records(student_id=student_id):
+            course = courses.get(record["lecture_id"])
+            if course and (not course_code or course == course_code):
+                attended[course] = attended.get(course, 0) + 1
+        return [{"course_code": course, "attended": attended[course]} for course in sorted(attended)]
@@ -0,0 +1,219 @@
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+DISTANCE_BUCKETS = (0.1, 0.2, 0.3, 0.35, 0.4, 0.45, 0.5, 0.6, 0.7, 0.8, 1.0)
+
+def metric_key(name, labels):
+    """Hashable key of a metric name plus its labels"""
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+def label_text(labels, extra=None):
+    """Prometheus label block, e.g. {stage="detect",le="0.5"}"""
+    pairs = list(labels) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+class Histogram:
+    def __init__(self, buckets):
+        """Cumulative-bucket histogram in the Prometheus style"""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record one value"""
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """Plain dict view of the histogram"""
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts))}
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        """Context manager observing its duration in a seconds histogram"""
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+class NullTimer:
+    """Timer that does nothing, shared by every disabled metric"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class NullMetrics:
+    """Disabled instrumentation, every call is a no-op"""
+    enabled = False
+
+    def inc(self, name, value=1, labels=None):
+        pass
+
+    def set_gauge(self, name, value, labels=None):
+        pass
+
+    def observe(self, name, value, labels=None, buckets=SECONDS_BUCKETS):
+        pass
+
+    def timer(self, name, labels=None):
+        return NULL_TIMER
+
+NULL_METRICS = NullMetrics()
+
+class Metrics:
+    enabled = True
+
+    def __init__(self):
+        """Thread-safe registry of counters, gauges and histograms"""
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, labels=None):
+        """Add to a counter"""
+        key = metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        """Set a gauge to its current value"""
+        with self.lock:
+            self.gauges[metric_key(name, labels)] = value
+
+    def observe(self, name, value, labels=None, buckets=SECONDS_BUCKETS):
+        """Record a value in a histogram, created with the given buckets on first use"""
+        key = metric_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timer(self, name, labels=None):
+        """Time a block into a seconds histogram"""
+        return Timer(self, name, labels)
+
+    def snapshot(self):
+        """All current values as a JSON-friendly dict"""
+        def flat(key):
+            name, labels = key
+            return name + label_text(labels)
+
+        with self.lock:
+            return {
+                "counters": {flat(key): value for key, value in self.counters.items()},
+                "gauges": {flat(key): value for key, value in self.gauges.items()},
+                "histograms": {flat(key): histogram.snapshot() for key, histogram in self.histograms.items()},
+            }
+
+    def prometheus_text(self):
+        """All current values in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (key_name, labels), value in values.items():
+                        if key_name == name:
+                            lines.append(f"{name}{label_text(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (key_name, labels), histogram in self.histograms.items():
+                    if key_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{label_text(labels, {'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{label_text(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    def __init__(self, metrics, jsonl_path=None, interval=10.0, port=None):
+        """Export metrics periodically to a JSONL file and/or on http://127.0.0.1:<port>/metrics"""
+        self.metrics = metrics
+        self.jsonl_path = jsonl_path
+        self.interval = interval
+        self.port = port
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def write_jsonl(self):
+        """Append one snapshot line to the JSONL file"""
+        with open(self.jsonl_path, "a") as file:
+            file.write(json.dumps({"time": datetime.now().isoformat(), **self.metrics.snapshot()}) + "\n")
+
+    def run(self):
+        """Background loop writing a snapshot every interval"""
+        while not self.stop_event.wait(self.interval):
+            self.write_jsonl()
+
+    def start(self):
+        """Start the JSONL writer and the HTTP endpoint that are configured"""
+        if self.jsonl_path:
+            self.thread = threading.Thread(target=self.run, name="metrics-jsonl", daemon=True)
+            self.thread.start()
+
+        if self.port:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus_text().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            # Only reachable from the local host
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        """Write a final snapshot and stop exporting"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.write_jsonl()
+        if self.server:
+            self.server.shutdown()
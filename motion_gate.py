@@ -0,0 +1,137 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+def boxes_overlap(a, b):
+    """True when two (top, right, bottom, left) boxes intersect"""
+    return a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]
+
+def merge_boxes(boxes):
+    """Merge overlapping (top, right, bottom, left) boxes until none overlap"""
+    merged = []
+    for box in boxes:
+        while True:
+            overlapping = [other for other in merged if boxes_overlap(box, other)]
+            if not overlapping:
+                break
+            for other in overlapping:
+                merged.remove(other)
+                box = (min(box[0], other[0]), max(box[1], other[1]), max(box[2], other[2]), min(box[3], other[3]))
+        merged.append(box)
+    return merged
+
+class MotionGate:
+    def __init__(self, scale=0.25, threshold=25, min_changed=0.001, full_changed=0.5, margin=80,
+                 min_region_pixels=16, refresh_seconds=30.0, use_cascade=False, cascade_path=None):
+        """Find the parts of a frame that changed since the face detector last looked at them
+
+        Frames are compared on a small blurred grayscale copy against a reference
+        that only moves on where detection runs, so slow changes still add up.
+        check() returns (full, regions): full when the whole frame needs the
+        detector (first frame, every refresh_seconds, or more than full_changed
+        of it changed), else the changed regions grown by margin pixels; no
+        regions means the previous faces still hold. With use_cascade, a changed
+        region holding no known face is only passed on when an OpenCV Haar
+        cascade finds a face-like object in it.
+        """
+        self.scale = scale
+        self.threshold = threshold                  # Gray level difference counted as a change
+        self.min_changed = min_changed              # Changed share of the frame below which it is unchanged
+        self.full_changed = full_changed            # Changed share above which the whole frame is detected
+        self.margin = margin                        # Pixels added around changed regions, about one face
+        self.min_region_pixels = min_region_pixels  # Smaller changed blobs (at the gate scale) are noise
+        self.refresh_seconds = refresh_seconds
+        self.kernel = np.ones((5, 5), dtype=np.uint8)
+
+        self.cascade = None
+        if use_cascade:
+            if not hasattr(cv2, "CascadeClassifier"):
+                raise ValueError("This OpenCV build has no Haar cascades (removed in OpenCV 5), "
+                                 "use the motion gate without the cascade")
+            path = cascade_path or cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            self.cascade = cv2.CascadeClassifier(path)
+            if self.cascade.empty():
+                raise ValueError(f"Could not load face cascade {path}")
+
+        self.lock = threading.Lock()
+        self.reference = None
+        self.last_full = 0.0
+        self.counts = {"full": 0, "regions": 0, "unchanged": 0, "cascade_rejected": 0}
+
+    def prepare(self, frame):
+        """Small blurred grayscale copy of a BGR frame"""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+    def frame_box(self, rect, frame_shape):
+        """Frame (top, right, bottom, left) box of a gate-scale (x, y, w, h) rectangle, grown by the margin"""
+        x, y, w, h = rect
+        height, width = frame_shape[:2]
+        return (max(0, int(y / self.scale) - self.margin), min(width, int((x + w) / self.scale) + self.margin),
+                min(height, int((y + h) / self.scale) + self.margin), max(0, int(x / self.scale) - self.margin))
+
+    def check(self, frame, face_locations=(), now=None):
+        """Decide what of a BGR frame needs face detection, returns (full, regions)
+
+        face_locations are the faces currently known, a changed region holding
+        one always passes the cascade so faces that move or leave are re-detected.
+        """
+        now = time.time() if now is None else now
+        gray = self.prepare(frame)
+        with self.lock:
+            if self.reference is None or self.reference.shape != gray.shape or \
+               now - self.last_full >= self.refresh_seconds:
+                return self.full(gray, now)
+
+            _, mask = cv2.threshold(cv2.absdiff(gray, self.reference), self.threshold, 255, cv2.THRESH_BINARY)
+            changed = cv2.countNonZero(mask) / mask.size
+            if changed < self.min_changed:
+                self.counts["unchanged"] += 1
+                return False, []
+            if changed >= self.full_changed:
+                # Lights switched or the camera moved
+                return self.full(gray, now)
+
+            # Join the blobs of one moving person before boxing them
+            mask = cv2.dilate(mask, self.kernel, iterations=2)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            regions = merge_boxes([self.frame_box(cv2.boundingRect(contour), frame.shape) for contour in contours
+                                   if cv2.contourArea(contour) >= self.min_region_pixels])
+
+            # The reference follows the frame where the change was looked at
+            for top, right, bottom, left in regions:
+                small = (slice(int(top * self.scale), int(np.ceil(bottom * self.scale))),
+                         slice(int(left * self.scale), int(np.ceil(right * self.scale))))
+                self.reference[small] = gray[small]
+
+        if self.cascade is not None:
+            passed = [region for region in regions
+                      if any(boxes_overlap(region, location) for location in face_locations)
+                      or self.cascade_hit(frame, region)]
+            with self.lock:
+                self.counts["cascade_rejected"] += len(regions) - len(passed)
+            regions = passed
+        with self.lock:
+            self.counts["regions" if regions else "unchanged"] += 1
+        return False, regions
+
+    def full(self, gray, now):
+        """Take the whole frame as the new reference and ask for full detection"""
+        self.reference = gray
+        self.last_full = now
+        self.counts["full"] += 1
+        return True, []
+
+    def cascade_hit(self, frame, region):
+        """True when the Haar cascade finds a face-like object in a frame region"""
+        top, right, bottom, left = region
+        gray = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+        # Half resolution keeps 80 px faces above the cascade's 24 px window
+        gray = cv2.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        return len(self.cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=3, minSize=(24, 24))) > 0
+
+    def stats(self):
+        """Frames per gate decision so far"""
+        with self.lock:
+            return dict(self.counts)
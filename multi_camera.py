@@ -0,0 +1,188 @@
+import cv2
+import multiprocessing
+import queue
+import time
+from datetime import datetime
+from matcher import UNKNOWN
+from scheduler import AdaptiveScheduler
+from shared_gallery import SharedGallery
+
+def parse_camera_source(source):
+    """Camera indexes are given as numbers, anything else is a device path or stream URL"""
+    return int(source) if str(source).isdigit() else source
+
+def percentile(values, fraction):
+    """Simple percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def camera_worker(camera_index, camera_source, lecture_id, descriptor, recognizer_options, stats_queue, stop_event,
+                  scheduler_options=None, storage_options=None, report_interval=5.0):
+    """Run one lecture on one camera in its own process, without a window"""
+    from recognize import FaceRecognitionAttendance
+    from storage import open_backend
+
+    # Each process has its own database connection and attaches to the shared gallery
+    db = open_backend(create_indexes=False, **(storage_options or {}))
+    gallery = SharedGallery.attach(descriptor)
+    recognizer = FaceRecognitionAttendance(db, lecture_id, gallery=gallery.as_gallery(), **recognizer_options)
+    recognizer.begin_session()
+    scheduler = AdaptiveScheduler(**(scheduler_options or {}))
+
+    cap = cv2.VideoCapture(parse_camera_source(camera_source))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+
+    frames = 0
+    processed = 0
+    latencies = []
+    last_report = time.time()
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                raise RuntimeError(f"Failed to grab frame from camera {camera_source}")
+            captured = time.time()
+            frames += 1
+
+            if scheduler.should_process(captured):
+                face_locations, matches = recognizer.process_frame(frame)
+                scheduler.record(time.time() - captured, len(face_locations))
+                for student_id, name, _ in matches:
+                    if student_id != UNKNOWN:
+                        recognizer.handle_recognized_student(student_id, name)
+                processed += 1
+                # Latency from frame capture to attendance decision
+                latencies.append(1000.0 * (time.time() - captured))
+
+            if time.time() - last_report >= report_interval:
+                elapsed = time.time() - last_report
+                stats_queue.put({
+                    "camera": camera_index,
+                    "lecture_id": recognizer.lecture_id,
+                    "fps": round(frames / elapsed, 1),
+                    "processed_fps": round(processed / elapsed, 2),
+                    "interval_seconds": round(scheduler.interval(), 2),
+                    "latency_p50_ms": round(percentile(latencies, 0.50), 1),
+                    "latency_p95_ms": round(percentile(latencies, 0.95), 1),
+                    "marked": len(recognizer.marked_students),
+                })
+                frames, processed, latencies = 0, 0, []
+                last_report = time.time()
+    finally:
+        cap.release()
+        recognizer.flush_attendance()
+        gallery.close()
+        db.close_connection()
+
+class MultiCameraHost:
+    def __init__(self, db, cameras, recognizer_options=None, restart_delay=5.0, report_interval=10.0,
+                 scheduler_options=None, storage_options=None, course_code=None, instructor=None, room=None):
+        """Supervisor running one recognition process per camera over a single shared gallery
+
+        cameras is a list of (camera_source, lecture_id) pairs. A camera whose
+        process dies is restarted after restart_delay seconds without touching
+        the other cameras. storage_options (kind and path for open_backend)
+        tell the workers which database to open. Each camera's lecture is
+        created (with course_code, instructor and room, unless it exists
+        already) when its worker starts, and ended when the host stops.
+        """
+        self.db = db
+        self.cameras = cameras
+        self.recognizer_options = recognizer_options or {}
+        self.scheduler_options = scheduler_options or {}
+        self.storage_options = storage_options or {}
+        self.restart_delay = restart_delay
+        self.report_interval = report_interval
+        self.lecture_details = (course_code, instructor or "", room or "")
+
+        # Spawned workers do not inherit the parent's MongoDB client or camera handles
+        self.context = multiprocessing.get_context("spawn")
+        self.stats_queue = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.processes = {}
+        self.restart_at = {}
+        self.latest_stats = {}
+
+    def start_camera(self, camera_index, descriptor):
+        """Start (or restart) the worker process of one camera"""
+        camera_source, lecture_id = self.cameras[camera_index]
+        worker_options = dict(self.recognizer_options, snapshot_folder=None)
+        process = self.context.Process(
+            target=camera_worker, name=f"camera-{camera_index}",
+            args=(camera_index, camera_source, lecture_id, descriptor, worker_options,
+                  self.stats_queue, self.stop_event, self.scheduler_options, self.storage_options)
+        )
+        process.start()
+        self.processes[camera_index] = process
+        print(f"Started camera {camera_source} for lecture {lecture_id} (pid {process.pid})")
+
+    def print_report(self):
+        """Print the latest per-camera statistics"""
+        print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Camera status:")
+        for camera_index, (camera_source, lecture_id) in enumerate(self.cameras):
+            stats = self.latest_stats.get(camera_index)
+            alive = self.processes[camera_index].is_alive()
+            if stats:
+                print(f"- camera {camera_source} ({lecture_id}): {'up' if alive else 'DOWN'}, "
+                      f"{stats['fps']} fps, {stats['processed_fps']} processed/s "
+                      f"(every {stats['interval_seconds']}s), "
+                      f"latency p50 {stats['latency_p50_ms']} ms / p95 {stats['latency_p95_ms']} ms, "
+                      f"{stats['marked']} marked")
+            else:
+                print(f"- camera {camera_source} ({lecture_id}): {'starting' if alive else 'DOWN'}")
+
+    def run(self, duration=None):
+        """Load the gallery once, start every camera and supervise until interrupted"""
+        from recognize import FaceRecognitionAttendance
+
+        loader = FaceRecognitionAttendance(self.db, **self.recognizer_options)
+        shared = SharedGallery.create(loader.known_face_encodings, loader.known_face_ids, loader.known_face_names)
+        descriptor = shared.descriptor()
+        print(f"Shared gallery of {len(loader.known_face_ids)} encodings with {len(self.cameras)} cameras")
+
+        for camera_index, (_, lecture_id) in enumerate(self.cameras):
+            print(self.db.create_lecture(lecture_id, *self.lecture_details))
+            self.start_camera(camera_index, descriptor)
+
+        start_time = time.time()
+        last_report = start_time
+        try:
+            while duration is None or time.time() - start_time < duration:
+                try:
+                    stats = self.stats_queue.get(timeout=1.0)
+                    self.latest_stats[stats["camera"]] = stats
+                except queue.Empty:
+                    pass
+
+                # Isolate failures: restart only the camera whose process died
+                for camera_index, (camera_source, _) in enumerate(self.cameras):
+                    process = self.processes[camera_index]
+                    if process.is_alive():
+                        continue
+                    if camera_index not in self.restart_at:
+                        print(f"Camera {camera_source} stopped (exit code {process.exitcode}), "
+                              f"restarting in {self.restart_delay}s")
+                        self.restart_at[camera_index] = time.time() + self.restart_delay
+                    elif time.time() >= self.restart_at[camera_index]:
+                        del self.restart_at[camera_index]
+                        self.start_camera(camera_index, descriptor)
+
+                if time.time() - last_report >= self.report_interval:
+                    last_report = time.time()
+                    self.print_report()
+        except KeyboardInterrupt:
+            print("Stopping all cameras...")
+        finally:
+            self.stop_event.set()
+            for process in self.processes.values():
+                process.join(timeout=10.0)
+                if process.is_alive():
+                    process.terminate()
+            shared.close()
+            
+            # Workers flushed their marks on the way out, end every lecture including those of dead cameras
+            for lecture_id in dict.fromkeys(lecture_id for _, lecture_id in self.cameras):
+                print(self.db.end_lecture(lecture_id))
@@ -0,0 +1,255 @@
+import cv2
+import queue
+import threading
+import time
+from matcher import UNKNOWN
+from scheduler import AdaptiveScheduler
+from utils import stop_on_signals
+
+class LatestFrame:
+    def __init__(self):
+        """Single-slot buffer that always holds the newest captured frame"""
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.frame = None
+        self.consumed = True
+        self.overwritten = 0  # Frames replaced before anyone read them
+
+    def put(self, frame):
+        """Store a new frame, replacing the previous one"""
+        with self.condition:
+            if self.frame is not None and not self.consumed:
+                self.overwritten += 1
+            self.sequence += 1
+            self.frame = frame
+            self.consumed = False
+            self.condition.notify_all()
+            return self.sequence
+
+    def get(self, after_sequence, timeout=1.0):
+        """Wait for a frame newer than after_sequence, returns (sequence, frame) or (after_sequence, None)"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > after_sequence, timeout):
+                return after_sequence, None
+            self.consumed = True
+            return self.sequence, self.frame
+
+class RecognitionPipeline:
+    def __init__(self, recognizer, camera_source=0, num_workers=2, recognition_interval=1.0,
+                 work_queue_size=None, attendance_queue_size=256, scheduler=None, headless=False):
+        """Staged capture / detect+encode / attendance / display pipeline around a recognizer
+
+        Each stage runs on its own thread and the stages talk through bounded
+        queues. When detection falls behind, the oldest queued frames are
+        dropped so results always refer to a recent frame. In headless mode
+        there is no display stage and skipped frames are never decoded.
+        """
+        self.recognizer = recognizer
+        self.camera_source = camera_source
+        self.num_workers = max(1, num_workers)
+        self.recognition_interval = recognition_interval
+        self.headless = headless
+        # Frames are dispatched as often as the measured cost and the scene allow
+        self.scheduler = scheduler or AdaptiveScheduler(base_interval=recognition_interval)
+
+        self.stop_event = threading.Event()
+        self.latest_frame = LatestFrame()
+        self.work_queue = queue.Queue(maxsize=work_queue_size or self.num_workers)
+        self.attendance_queue = queue.Queue(maxsize=attendance_queue_size)
+
+        # Newest recognition results, guarded by results_lock
+        self.results_lock = threading.Lock()
+        self.results_sequence = 0
+        self.results = ([], [], [])
+
+        # Counters for the stats overlay
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self.stale_frames_dropped = 0
+        self.marks_dropped = 0
+
+    def stats(self):
+        """Queue depths and drop counters of every stage"""
+        return {
+            "captured": self.frames_captured,
+            "processed": self.frames_processed,
+            "processing_fps": round(self.recognizer.processing_fps(), 1),
+            "capture_overwritten": self.latest_frame.overwritten,
+            "work_queue": self.work_queue.qsize(),
+            "stale_dropped": self.stale_frames_dropped,
+            "attendance_queue": self.attendance_queue.qsize(),
+            "marks_dropped": self.marks_dropped,
+            "effective_rate": round(self.scheduler.effective_rate(), 2),
+            "interval_seconds": round(self.scheduler.interval(), 3),
+        }
+
+    def record_metrics(self):
+        """Publish the queue depths and drop counters as gauges"""
+        metrics = self.recognizer.metrics
+        if not metrics.enabled:
+            return
+        for name, value in self.stats().items():
+            metrics.set_gauge(f"pipeline_{name}", value)
+
+    def print_stats(self):
+        """Print the stage statistics and the attendance backlog"""
+        print("Pipeline stats:", self.stats())
+        if self.recognizer.attendance_writer:
+            print("Attendance backlog:", self.recognizer.attendance_writer.backlog())
+
+    def offer_frame(self, sequence, frame):
+        """Queue a frame for detection, dropping the oldest queued one if the workers are behind"""
+        while True:
+            try:
+                self.work_queue.put_nowait((sequence, frame))
+                return
+            except queue.Full:
+                try:
+                    self.work_queue.get_nowait()
+                    self.stale_frames_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def capture_loop(self, cap):
+        """Capture stage: keep the latest frame and feed the workers when the scheduler allows"""
+        sequence = 0
+        while not self.stop_event.is_set():
+            if self.headless:
+                # Nothing is displayed, only decode the frames handed to the workers
+                ret = cap.grab()
+                frame = None
+            else:
+                ret, frame = cap.read()
+            if not ret:
+                print("Failed to grab frame")
+                self.stop_event.set()
+                break
+            self.frames_captured += 1
+
+            if not self.headless:
+                sequence = self.latest_frame.put(frame)
+            else:
+                sequence += 1
+
+            if self.scheduler.should_process():
+                if frame is None:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        continue
+                self.offer_frame(sequence, frame)
+
+    def worker_loop(self):
+        """Detection stage: detect, encode and identify faces of queued frames"""
+        while not self.stop_event.is_set():
+            try:
+                sequence, frame = self.work_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            start = time.perf_counter()
+            face_locations, matches = self.recognizer.process_frame(frame)
+            self.scheduler.record(time.perf_counter() - start, len(face_locations))
+            self.frames_processed += 1
+
+            # Results of an older frame finishing late must not replace newer ones
+            with self.results_lock:
+                if sequence > self.results_sequence:
+                    self.results_sequence = sequence
+                    self.results = (face_locations,
+                                    [student_id for student_id, _, _ in matches],
+                                    [name for _, name, _ in matches])
+
+            # Hand recognized students to the attendance writer
+            for student_id, name, _ in matches:
+                if student_id == UNKNOWN or student_id in self.recognizer.marked_students:
+                    continue
+                try:
+                    self.attendance_queue.put_nowait((student_id, name))
+                except queue.Full:
+                    # The student will be seen again on a later frame
+                    self.marks_dropped += 1
+
+    def attendance_loop(self):
+        """Attendance stage: write marks so database round-trips never block detection"""
+        while not self.stop_event.is_set() or not self.attendance_queue.empty():
+            try:
+                student_id, name = self.attendance_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.recognizer.handle_recognized_student(student_id, name)
+
+    def draw_stats(self, display_frame):
+        """Overlay the per-stage queue depths on the display frame"""
+        stats = self.stats()
+        text = (f"work q: {stats['work_queue']}  attendance q: {stats['attendance_queue']}  "
+                f"dropped: {stats['stale_dropped']}")
+        cv2.putText(display_frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+
+    def run(self, duration=None):
+        """Start all stages and run the display stage (or just wait, headless) on the calling thread"""
+        cap = cv2.VideoCapture(self.camera_source)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+
+        print(f"Starting pipelined recognition with {self.num_workers} workers...")
+        print("Stop with Ctrl+C or SIGTERM" if self.headless else "Press 'q' to quit")
+
+        self.recognizer.begin_session()
+
+        threads = [threading.Thread(target=self.capture_loop, args=(cap,), name="capture", daemon=True)]
+        for index in range(self.num_workers):
+            threads.append(threading.Thread(target=self.worker_loop, name=f"detect-{index}", daemon=True))
+        attendance_thread = threading.Thread(target=self.attendance_loop, name="attendance", daemon=True)
+        threads.append(attendance_thread)
+        for thread in threads:
+            thread.start()
+
+        restore_signals = stop_on_signals(self.stop_event) if self.headless else None
+        start_time = time.time()
+        last_report = start_time
+        sequence = 0
+        try:
+            while self.headless and not self.stop_event.wait(1.0):
+                self.record_metrics()
+                if duration is not None and time.time() - start_time >= duration:
+                    break
+                if time.time() - last_report >= 5.0:
+                    last_report = time.time()
+                    self.print_stats()
+
+            while not self.headless and not self.stop_event.is_set():
+                sequence, frame = self.latest_frame.get(sequence)
+                if frame is None:
+                    continue
+
+                # Draw the newest results over the newest frame
+                display_frame = frame.copy()
+                with self.results_lock:
+                    face_locations, face_ids, face_names = self.results
+                self.recognizer.draw_results(display_frame, face_locations, face_ids, face_names)
+                self.draw_stats(display_frame)
+                self.record_metrics()
+                cv2.imshow('Face Recognition Attendance System', display_frame)
+
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+                if duration is not None and time.time() - start_time >= duration:
+                    break
+
+                if time.time() - last_report >= 5.0:
+                    last_report = time.time()
+                    self.print_stats()
+        finally:
+            # Stop the stages, the attendance writer drains its queue before exiting
+            self.stop_event.set()
+            for thread in threads:
+                thread.join(timeout=5.0)
+            cap.release()
+            if restore_signals:
+                restore_signals()
+            else:
+                cv2.destroyAllWindows()
+
+        self.recognizer.flush_attendance()
+        self.recognizer.print_summary()
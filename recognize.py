@@ -1,14 +1,32 @@
 import cv2
 import face_recognition
 import numpy as np
+import threading
 import time
 from datetime import datetime
-from database import Database
-from utils import draw_box_with_name
+from database import Database, ENCODING_SIZE
+from encoding_pool import EncodingPool
+from matcher import FaceMatcher, UNKNOWN, VISITOR
+from metrics import COUNT_BUCKETS, DISTANCE_BUCKETS, NULL_METRICS
+from motion_gate import MotionGate, boxes_overlap
+from scheduler import AdaptiveScheduler
+from tracker import FaceTracker
+from utils import (draw_box_with_name, load_gallery_snapshot, save_gallery_snapshot, resize_frame, scale_location,
+                   stop_on_signals)
 
 class FaceRecognitionAttendance:
-    def __init__(self, db_connection=None, lecture_id=None):
-        self.db = db_connection if db_connection else Database()
+    def __init__(self, db_connection=None, lecture_id=None, match_reduce="min", match_top_k=3,
+                 search="exact", index_options=None, snapshot_folder="data/gallery_snapshot",
+                 attendance_writer=None, detect_scale=1.0, multiscale=False, min_face_size=80,
+                 tracking=False, reverify_seconds=30.0, gallery=None, metrics=None, color_regions=False,
+                 motion_gating=False, gate_options=None, encode_workers=0, course_code=None,
+                 roster_fallback="gallery"):
+        # A preloaded (encodings, student_ids, names) gallery, e.g. attached from
+        # shared memory, lets offline workers run without a database connection
+        self.db = db_connection if db_connection or gallery is not None else Database()
+        # Marks go through the buffered writer when one is given, else straight to the database
+        self.attendance_writer = attendance_writer
+        self.attendance_sink = attendance_writer if attendance_writer else self.db
         self.known_face_encodings = []
         self.known_face_ids = []
         self.known_face_names = []
@@ -16,29 +34,522 @@ class FaceRecognitionAttendance:
         self.last_marked_time = {}    # Track time to avoid duplicate marking
         self.cooldown_seconds = 60    # Wait time before remarking the same student
         self.lecture_id = lecture_id  # Current lecture ID for attendance
+        self.tolerance = 0.5          # Maximum face distance accepted as a match
+        self.match_reduce = match_reduce  # Per-student reduction: "min" or "topk"
+        self.match_top_k = match_top_k    # Encodings averaged per student in "topk" mode
+        self.search = search              # Gallery search: "exact" or approximate "ivf"
+        self.index_options = index_options
+        self.snapshot_folder = snapshot_folder  # On-disk gallery snapshot, None disables it
+        self.detect_scale = detect_scale        # Detection runs on the frame resized by this factor
+        self.multiscale = multiscale            # Re-detect small faces at full resolution
+        self.min_face_size = min_face_size      # Faces smaller than this (pixels) are refined in multiscale mode
+        self.color_regions = color_regions      # Detect on BGR and convert only the face region to RGB
+        self.frames_processed = 0
+        self.processing_seconds = 0.0
+        self.faces_encoded = 0
+        self.metrics = metrics or NULL_METRICS  # Stage timings and counters, no-op unless enabled
+        
+        # Track faces between detections so identified faces are not re-encoded every frame
+        self.tracker = FaceTracker(reverify_seconds=reverify_seconds) if tracking else None
+        self.tracker_lock = threading.Lock()
+        
+        # Only run the face detector on frames or regions that changed since it last ran
+        self.motion_gate = MotionGate(**(gate_options or {})) if motion_gating else None
+        self.gate_lock = threading.Lock()
+        self.last_face_locations = []  # Faces of the last gated frame, kept where nothing changed
+        self.last_matches = []
+        
+        # Spread the encoding of crowded frames over worker processes
+        self.encoding_pool = EncodingPool(encode_workers) if encode_workers > 1 else None
+        self.matcher = None
+        self.gallery_synced_at = None  # Time the gallery was last read from the database
+        
+        # Lecture mode matches the course roster first and searches the whole gallery only for misses
+        if roster_fallback not in ("gallery", "visitor"):
+            raise ValueError(f"Unknown roster fallback: {roster_fallback}")
+        self.roster_fallback = roster_fallback  # "gallery" looks misses up, "visitor" only flags them
+        self.roster_cache = {}                  # course_code -> (roster, gallery matcher, roster matcher)
+        self.course_code = None
+        self.roster = frozenset()               # student_ids enrolled in course_code
+        self.roster_matcher = None
+        self.off_roster_students = set()        # Students found outside the roster this session
         
         # Load student data from database
-        self.load_known_faces()
+        if gallery is not None:
+            self.set_gallery(*gallery)
+        else:
+            self.load_known_faces()
+        if course_code:
+            self.use_course_roster(course_code)
     
     def load_known_faces(self):
-        """Load known face encodings from database"""
-        students = self.db.get_all_student_encodings()
+        """Load known face encodings, from the gallery snapshot when one exists"""
+        snapshot = load_gallery_snapshot(self.snapshot_folder) if self.snapshot_folder else None
         
-        self.known_face_encodings = []
-        self.known_face_ids = []
-        self.known_face_names = []
+        if snapshot is None:
+            # No snapshot yet, read the whole students collection once
+            snapshot_time = datetime.now()
+            encodings, student_ids, names = self.read_gallery(self.db.iter_student_encodings())
+            changed = True
+        else:
+            # Open the snapshot and apply only the students changed since it was written
+            encodings, student_ids, names, snapshot_time = snapshot
+            sync_time = datetime.now()
+            changed_students = list(self.db.iter_student_encodings(since=snapshot_time))
+            changed = len(changed_students) > 0
+            if changed:
+                encodings, student_ids, names = self.apply_student_changes(encodings, student_ids, names,
+                                                                           changed_students)
+                snapshot_time = sync_time
+            print(f"Opened gallery snapshot, {len(changed_students)} students changed since it was written")
+        
+        if changed and self.snapshot_folder:
+            save_gallery_snapshot(encodings, student_ids, names, snapshot_time, self.snapshot_folder)
         
+        self.set_gallery(encodings, student_ids, names)
+        self.gallery_synced_at = snapshot_time
+        print(f"Loaded {len(student_ids)} student face encodings")
+    
+    def read_gallery(self, students):
+        """Flatten per-student encoding matrices into one gallery matrix with an id/name per row"""
+        matrices = []
+        student_ids = []
+        names = []
         for student in students:
-            # In real application, convert stored list back to numpy array
-            face_encoding = np.array(student["face_encoding"])
-            self.known_face_encodings.append(face_encoding)
-            self.known_face_ids.append(student["student_id"])
-            self.known_face_names.append(student["name"])
+            matrices.append(student["face_encodings"])
+            student_ids.extend([student["student_id"]] * len(student["face_encodings"]))
+            names.extend([student["name"]] * len(student["face_encodings"]))
+        
+        if matrices:
+            encodings = np.concatenate(matrices).astype(np.float32, copy=False)
+        else:
+            encodings = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        return encodings, student_ids, names
+    
+    def apply_student_changes(self, encodings, student_ids, names, changed_students):
+        """Replace the gallery rows of changed students with their current encodings"""
+        changed_ids = {student["student_id"] for student in changed_students}
+        keep = np.array([student_id not in changed_ids for student_id in student_ids], dtype=bool)
+        
+        new_encodings, new_ids, new_names = self.read_gallery(changed_students)
+        encodings = np.concatenate([np.asarray(encodings)[keep], new_encodings])
+        student_ids = [student_id for student_id, kept in zip(student_ids, keep) if kept] + new_ids
+        names = [name for name, kept in zip(names, keep) if kept] + new_names
+        return encodings, student_ids, names
+    
+    def set_gallery(self, encodings, student_ids, names):
+        """Install a gallery and build the batched matcher over it"""
+        self.known_face_encodings = encodings
+        self.known_face_ids = list(student_ids)
+        self.known_face_names = list(names)
+        
+        # Build the batched matcher over one contiguous gallery matrix
+        self.matcher = FaceMatcher(self.known_face_encodings, self.known_face_ids, self.known_face_names,
+                                   tolerance=self.tolerance, reduce=self.match_reduce, top_k=self.match_top_k,
+                                   search=self.search, index_options=self.index_options)
+    
+    def update_gallery(self, changed_students):
+        """Patch the gallery with changed students and swap the matcher in one step
+        
+        The new matcher is built on the side; frames being matched keep using
+        the old one, so lookups never wait for the update.
+        """
+        matcher = self.matcher.updated(changed_students)
+        known_face_ids = [matcher.student_ids[owner] for owner in matcher.row_owner]
+        known_face_names = [matcher.names[owner] for owner in matcher.row_owner]
+        
+        # Single reference assignment, atomic for the recognition threads
+        self.matcher = matcher
+        self.known_face_encodings = matcher.gallery
+        self.known_face_ids = known_face_ids
+        self.known_face_names = known_face_names
+        
+        # Roster sub-galleries of the old gallery are stale, drop them and rebuild the one in use
+        self.roster_cache = {}
+        if self.roster:
+            self.roster_matcher = self.roster_submatcher(self.course_code, self.roster)
+        self.metrics.inc("gallery_updates_total")
+        self.metrics.set_gauge("gallery_rows", len(matcher))
+        print(f"Gallery updated: {len(changed_students)} students changed, {len(matcher)} encodings")
+    
+    def use_course_roster(self, course_code):
+        """Match faces against the roster of a course first, None matches the whole gallery again
+        
+        Roster sub-galleries are cached per course, so later lectures of the
+        same course reuse them while the roster and the gallery are unchanged.
+        """
+        roster = frozenset(self.db.get_course_roster(course_code)) if course_code else frozenset()
+        self.course_code = course_code
+        self.roster = roster
+        self.roster_matcher = self.roster_submatcher(course_code, roster) if roster else None
+        if self.roster_matcher is not None:
+            print(f"Matching against the {course_code} roster first: {self.roster_matcher.num_students} "
+                  f"students, {len(self.roster_matcher)} encodings")
+        elif course_code:
+            print(f"Course {course_code} has no roster, matching against the whole gallery")
+    
+    def roster_submatcher(self, course_code, roster):
+        """Cached matcher over the gallery rows of a course roster"""
+        matcher = self.matcher
+        cached = self.roster_cache.get(course_code)
+        if cached and cached[0] == roster and cached[1] is matcher:
+            return cached[2]
+        roster_matcher = matcher.subset(roster)
+        self.roster_cache[course_code] = (roster, matcher, roster_matcher)
+        return roster_matcher
+    
+    def match_roster_first(self, roster_matcher, face_encodings):
+        """Match faces against the roster, and only the faces it misses against the whole gallery"""
+        matches = roster_matcher.match(face_encodings)
+        misses = [index for index, (student_id, _, _) in enumerate(matches) if student_id == UNKNOWN]
+        if not misses:
+            return matches
+        self.metrics.inc("roster_misses_total", len(misses))
+        
+        if self.roster_fallback == "visitor":
+            # Nobody outside the roster is looked up or marked
+            for index in misses:
+                matches[index] = (UNKNOWN, VISITOR, matches[index][2])
+            return matches
+        
+        fallback = self.matcher.match(np.asarray(face_encodings)[misses])
+        for index, match in zip(misses, fallback):
+            matches[index] = match
+            if match[0] != UNKNOWN and match[0] not in self.off_roster_students:
+                self.off_roster_students.add(match[0])
+                print(f"{match[1]} ({match[0]}) is not on the {self.course_code} roster")
+        return matches
+    
+    def identify_faces(self, face_encodings):
+        """Match all faces of a frame against the gallery in a single batched call"""
+        roster_matcher = self.roster_matcher
+        with self.metrics.timer("recognition_stage_seconds", {"stage": "match"}):
+            if roster_matcher is None:
+                matches = self.matcher.match(face_encodings)
+            else:
+                matches = self.match_roster_first(roster_matcher, face_encodings)
+        
+        if self.metrics.enabled:
+            for student_id, _, distance in matches:
+                # An empty gallery reports an infinite distance, which would poison the sum
+                if distance != float("inf"):
+                    result = "unknown" if student_id == UNKNOWN else "known"
+                    self.metrics.observe("match_distance", distance, {"result": result}, DISTANCE_BUCKETS)
+        return matches
+    
+    def handle_recognized_student(self, student_id, name):
+        """Mark attendance for a recognized student, respecting the cooldown"""
+        # Mark attendance with cooldown to avoid duplicate marking
+        current_time = time.time()
+        is_already_marked = False
+        
+        if student_id in self.marked_students:
+            is_already_marked = True
+        
+        if student_id not in self.last_marked_time or \
+           (current_time - self.last_marked_time[student_id] > self.cooldown_seconds):
+            # Mark attendance in database
+            if not is_already_marked:
+                with self.metrics.timer("recognition_stage_seconds", {"stage": "mark_attendance"}):
+                    result = self.attendance_sink.mark_attendance(student_id, self.lecture_id)
+                self.metrics.inc("attendance_marks_total")
+                print(f"{result} at {time.strftime('%H:%M:%S')}")
+                
+                # Update last marked time
+                self.last_marked_time[student_id] = current_time
+                self.marked_students.add(student_id)
+            else:
+                print(f"Already marked attendance for {name} ({student_id})")
+    
+    def begin_session(self):
+        """Reset per-session state and make sure a lecture ID exists"""
+        # Reset marked students for new session
+        self.marked_students = set()
+        self.off_roster_students = set()
+        
+        if not self.lecture_id:
+            # Generate lecture ID if not provided
+            self.lecture_id = f"L_{datetime.now().strftime('%Y%m%d_%H%M')}"
+            print(f"Generated Lecture ID: {self.lecture_id}")
+    
+    def switch_lecture(self, lecture_id, course_code=None):
+        """Start marking attendance for another lecture without reloading the gallery or the models
+        
+        None stops marking until the next lecture. Buffered marks keep the
+        lecture they were made in, the roster of course_code is matched first.
+        """
+        self.flush_attendance()
+        self.lecture_id = lecture_id
+        self.marked_students = set()
+        self.last_marked_time = {}
+        self.off_roster_students = set()
+        self.use_course_roster(course_code)
+    
+    def detect_faces(self, rgb_frame):
+        """Find face locations at the detection scale, returned in full-resolution coordinates"""
+        if self.detect_scale >= 1.0:
+            return face_recognition.face_locations(rgb_frame)
+        
+        # Detect on a downscaled frame, then map the boxes back to full resolution
+        small_frame = resize_frame(rgb_frame, self.detect_scale)
+        face_locations = [scale_location(location, 1.0 / self.detect_scale, rgb_frame.shape)
+                          for location in face_recognition.face_locations(small_frame)]
+        
+        if self.multiscale:
+            face_locations = [self.refine_small_face(rgb_frame, location) for location in face_locations]
+        return face_locations
+    
+    def refine_small_face(self, rgb_frame, location):
+        """Re-detect a small face on an upsampled full-resolution crop for an accurate box"""
+        top, right, bottom, left = location
+        if bottom - top >= self.min_face_size:
+            return location
+        
+        # Crop around the coarse box with a margin of one face size
+        margin = bottom - top
+        crop_top = max(0, top - margin)
+        crop_left = max(0, left - margin)
+        crop = rgb_frame[crop_top:min(rgb_frame.shape[0], bottom + margin),
+                         crop_left:min(rgb_frame.shape[1], right + margin)]
+        
+        refined = face_recognition.face_locations(crop, number_of_times_to_upsample=2)
+        if not refined:
+            return location
         
-        print(f"Loaded {len(students)} student face encodings")
+        # Keep the refined box closest to the coarse one
+        center_y, center_x = (top + bottom) / 2 - crop_top, (left + right) / 2 - crop_left
+        r_top, r_right, r_bottom, r_left = min(
+            refined, key=lambda box: ((box[0] + box[2]) / 2 - center_y) ** 2 + ((box[1] + box[3]) / 2 - center_x) ** 2)
+        return (r_top + crop_top, r_right + crop_left, r_bottom + crop_top, r_left + crop_left)
     
-    def start_recognition(self, camera_source=0, recognition_interval=1.0):
+    def process_frame(self, frame):
+        """Detect, encode and identify all faces of a BGR frame
+        
+        Returns the face locations and one (student_id, name, distance) match per face.
+        """
+        start = time.perf_counter()
+        
+        if self.motion_gate:
+            face_locations, matches = self.process_gated_frame(frame)
+        else:
+            face_locations, matches = self.detect_and_identify(frame)
+        
+        self.frames_processed += 1
+        elapsed = time.perf_counter() - start
+        self.processing_seconds += elapsed
+        self.metrics.observe("frame_processing_seconds", elapsed)
+        return face_locations, matches
+    
+    def detect_and_identify(self, frame):
+        """Run the full detector on a whole BGR frame and identify every face"""
+        if self.color_regions:
+            # HOG detection takes the strongest gradient over all channels, so it runs on
+            # the BGR frame as is and only the region holding faces is converted to RGB
+            with self.metrics.timer("recognition_stage_seconds", {"stage": "detect"}):
+                face_locations = self.detect_faces(frame)
+            with self.metrics.timer("recognition_stage_seconds", {"stage": "color_convert"}):
+                rgb_image, origin = self.faces_region_rgb(frame, face_locations)
+        else:
+            # Convert from BGR color (OpenCV) to RGB (face_recognition)
+            with self.metrics.timer("recognition_stage_seconds", {"stage": "color_convert"}):
+                rgb_image, origin = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), (0, 0)
+            
+            # Find face locations and encodings, encodings always use the full-resolution frame
+            with self.metrics.timer("recognition_stage_seconds", {"stage": "detect"}):
+                face_locations = self.detect_faces(rgb_image)
+        self.metrics.observe("faces_per_frame", len(face_locations), buckets=COUNT_BUCKETS)
+        
+        if self.tracker:
+            matches = self.identify_tracked_faces(rgb_image, face_locations, origin)
+        else:
+            face_encodings = self.encode_faces(rgb_image, face_locations, origin)
+            
+            # Score every face in the frame against the gallery at once
+            matches = self.identify_faces(face_encodings)
+        return face_locations, matches
+    
+    def process_gated_frame(self, frame):
+        """Detect only where the frame changed, faces elsewhere keep their previous results
+        
+        Gated frames are processed one at a time, each one builds on the last.
+        """
+        with self.gate_lock:
+            with self.metrics.timer("recognition_stage_seconds", {"stage": "gate"}):
+                full, regions = self.motion_gate.check(frame, self.last_face_locations)
+            
+            if full:
+                self.metrics.inc("gated_frames_total", labels={"result": "full"})
+                face_locations, matches = self.detect_and_identify(frame)
+            elif regions:
+                self.metrics.inc("gated_frames_total", labels={"result": "regions"})
+                face_locations, matches = self.detect_regions(frame, regions)
+            else:
+                # Nothing moved, no detector run at all
+                self.metrics.inc("gated_frames_total", labels={"result": "unchanged"})
+                face_locations, matches = self.last_face_locations, self.last_matches
+            
+            self.last_face_locations, self.last_matches = face_locations, matches
+            return face_locations, matches
+    
+    def detect_regions(self, frame, regions):
+        """Detect faces in the changed regions of a BGR frame and merge them with the unchanged faces"""
+        kept = [index for index, location in enumerate(self.last_face_locations)
+                if not any(boxes_overlap(location, region) for region in regions)]
+        
+        # HOG detection works on BGR as well, only face regions are converted to RGB
+        new_locations = []
+        with self.metrics.timer("recognition_stage_seconds", {"stage": "detect"}):
+            for top, right, bottom, left in regions:
+                new_locations.extend((face_top + top, face_right + left, face_bottom + top, face_left + left)
+                                     for face_top, face_right, face_bottom, face_left
+                                     in self.detect_faces(frame[top:bottom, left:right]))
+        face_locations = [self.last_face_locations[index] for index in kept] + new_locations
+        
+        if self.tracker:
+            # Tracks of the unchanged faces carry their identities over
+            with self.metrics.timer("recognition_stage_seconds", {"stage": "color_convert"}):
+                rgb_image, origin = self.faces_region_rgb(frame, face_locations)
+            return face_locations, self.identify_tracked_faces(rgb_image, face_locations, origin)
+        
+        with self.metrics.timer("recognition_stage_seconds", {"stage": "color_convert"}):
+            rgb_image, origin = self.faces_region_rgb(frame, new_locations)
+        new_matches = self.identify_faces(self.encode_faces(rgb_image, new_locations, origin))
+        return face_locations, [self.last_matches[index] for index in kept] + new_matches
+    
+    def faces_region_rgb(self, frame, face_locations):
+        """RGB copy of the frame region holding every face, returns (image, (top, left) origin in the frame)"""
+        if not face_locations:
+            return None, (0, 0)
+        
+        # Face chips extend past the detected box, keep half a face of margin around it
+        margin = max(bottom - top for top, _, bottom, _ in face_locations) // 2
+        top = max(0, min(location[0] for location in face_locations) - margin)
+        right = min(frame.shape[1], max(location[1] for location in face_locations) + margin)
+        bottom = min(frame.shape[0], max(location[2] for location in face_locations) + margin)
+        left = max(0, min(location[3] for location in face_locations) - margin)
+        return cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2RGB), (top, left)
+    
+    def encode_faces(self, rgb_image, face_locations, origin=(0, 0)):
+        """Encode faces given in frame coordinates on an RGB image whose top-left corner is at origin"""
+        if not face_locations:
+            return []
+        origin_top, origin_left = origin
+        local_locations = [(top - origin_top, right - origin_left, bottom - origin_top, left - origin_left)
+                           for top, right, bottom, left in face_locations]
+        with self.metrics.timer("recognition_stage_seconds", {"stage": "encode"}):
+            if self.encoding_pool:
+                face_encodings = self.encoding_pool.encode(rgb_image, local_locations)
+            else:
+                face_encodings = face_recognition.face_encodings(rgb_image, local_locations)
+        self.faces_encoded += len(face_encodings)
+        self.metrics.inc("faces_encoded_total", len(face_encodings))
+        return face_encodings
+    
+    def identify_tracked_faces(self, rgb_image, face_locations, origin=(0, 0)):
+        """Identify faces through their tracks, encoding only new, unconfirmed or due tracks"""
+        now = time.time()
+        with self.tracker_lock:
+            tracks = self.tracker.update(face_locations, now)
+            pending = [index for index, track in enumerate(tracks) if self.tracker.needs_identification(track, now)]
+        
+        self.metrics.inc("tracked_faces_reused_total", len(tracks) - len(pending))
+        if pending:
+            face_encodings = self.encode_faces(rgb_image, [face_locations[index] for index in pending], origin)
+            with self.tracker_lock:
+                for index, (student_id, name, distance) in zip(pending, self.identify_faces(face_encodings)):
+                    self.tracker.assign(tracks[index], student_id, name, distance, now)
+        
+        return [(track.student_id, track.name, track.distance) for track in tracks]
+    
+    def processing_fps(self):
+        """Frames per second the detect/encode/match step can sustain"""
+        if self.processing_seconds == 0:
+            return 0.0
+        return self.frames_processed / self.processing_seconds
+    
+    def draw_results(self, display_frame, face_locations, face_ids, face_names):
+        """Draw a labelled box for every face on the display frame"""
+        for (top, right, bottom, left), student_id, name in zip(face_locations, face_ids, face_names):
+            # Draw box and name on frame
+            if student_id != UNKNOWN:
+                label = f"{name} ({student_id})"
+                
+                # Add "Already marked" indicator
+                if student_id in self.marked_students:
+                    label += " - Already marked"  # Changed from "✓" to text
+                color = (0, 255, 0)  # Green for recognized faces
+            elif name == VISITOR:
+                label = VISITOR
+                color = (0, 165, 255)  # Orange for faces outside the course roster
+            else:
+                label = UNKNOWN
+                color = (0, 0, 255)  # Red for unknown faces
+            
+            # Scale coordinates if needed for display frame
+            draw_box_with_name(display_frame, (top, right, bottom, left), label, color)
+    
+    def flush_attendance(self):
+        """Write out any attendance marks still buffered in the writer"""
+        if self.attendance_writer:
+            self.attendance_writer.flush()
+    
+    def close(self):
+        """Stop the encoding workers, if any"""
+        if self.encoding_pool:
+            self.encoding_pool.close()
+            self.encoding_pool = None
+    
+    def print_summary(self):
+        """Print the students marked present in this session"""
+        if not self.lecture_id:
+            return
+        print("\nAttendance Summary for Lecture:", self.lecture_id)
+        print(f"Total students marked present: {len(self.marked_students)}")
+        for student_id in self.marked_students:
+            name = self.matcher.name_of(student_id)
+            print(f"- {name} ({student_id})")
+        if self.off_roster_students:
+            print(f"Not on the {self.course_code} roster: {', '.join(sorted(self.off_roster_students))}")
+    
+    def recognize_scheduled_frame(self, frame, scheduler):
+        """Process a frame picked by the scheduler, mark recognized students and feed back the cost"""
+        process_start = time.perf_counter()
+        face_locations, matches = self.process_frame(frame)
+        
+        for student_id, name, distance in matches:
+            if student_id != UNKNOWN:
+                self.handle_recognized_student(student_id, name)
+        
+        scheduler.record(time.perf_counter() - process_start, len(face_locations))
+        self.metrics.set_gauge("scheduler_interval_seconds", scheduler.interval())
+        return face_locations, matches
+    
+    def print_speed_report(self, frame_count, elapsed, scheduler):
+        """Print the capture and processing rates of the session so far"""
+        print(f"FPS: capture {frame_count / elapsed:.1f}, processing {self.processing_fps():.1f}, "
+              f"scheduler {scheduler.stats()}")
+        if self.motion_gate:
+            print("Motion gate:", self.motion_gate.stats())
+        if self.attendance_writer:
+            print("Attendance backlog:", self.attendance_writer.backlog())
+    
+    def print_final_report(self, frame_count, elapsed, scheduler):
+        """Print the average rates of a finished session"""
+        if elapsed <= 0:
+            return
+        print(f"Average FPS: capture {frame_count / elapsed:.1f}, processing {self.processing_fps():.1f} "
+              f"(detection scale {self.detect_scale}{', multiscale' if self.multiscale else ''})")
+        print(f"Faces encoded: {self.faces_encoded} over {self.frames_processed} processed frames")
+        if self.motion_gate:
+            print("Motion gate (frames per decision):", self.motion_gate.stats())
+        print(f"Effective processing rate: {self.frames_processed / elapsed:.2f} frames/s "
+              f"({100.0 * scheduler.cpu_share():.0f}% of one core)")
+    
+    def start_recognition(self, camera_source=0, recognition_interval=1.0, scheduler=None):
         """Start face recognition from webcam"""
+        # Decide which frames to process from wall-clock time and measured cost
+        scheduler = scheduler or AdaptiveScheduler(base_interval=recognition_interval)
+        
         # Initialize webcam
         cap = cv2.VideoCapture(camera_source)
         
@@ -48,6 +559,8 @@ class FaceRecognitionAttendance:
         
         # Variables for processing speed
         frame_count = 0
+        start_time = time.time()
+        last_report_time = start_time
         
         # Store previous face locations and IDs to prevent flashing
         prev_face_locations = []
@@ -57,13 +570,7 @@ class FaceRecognitionAttendance:
         print("Starting face recognition attendance system...")
         print("Press 'q' to quit")
         
-        # Reset marked students for new session
-        self.marked_students = set()
-        
-        if not self.lecture_id:
-            # Generate lecture ID if not provided
-            self.lecture_id = f"L_{datetime.now().strftime('%Y%m%d_%H%M')}"
-            print(f"Generated Lecture ID: {self.lecture_id}")
+        self.begin_session()
         
         while True:
             # Grab a single frame
@@ -75,82 +582,20 @@ class FaceRecognitionAttendance:
             # Make a copy for display (we'll keep full resolution)
             display_frame = frame.copy()
             
-            # Convert from BGR color (OpenCV) to RGB (face_recognition)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Process only every few frames to save CPU
-            process_this_frame = frame_count % int(recognition_interval * 30) == 0
+            # Process only as often as the scheduler allows to save CPU
+            process_this_frame = scheduler.should_process()
+            self.metrics.inc("frames_total", labels={"result": "processed" if process_this_frame else "skipped"})
             
             if process_this_frame:
-                # Find face locations and encodings
-                face_locations = face_recognition.face_locations(rgb_frame)
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                
-                face_ids = []
-                face_names = []
-                
-                # Check each face against known faces
-                for face_encoding in face_encodings:
-                    # Compare with known faces
-                    matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.5)
-                    
-                    student_id = "Unknown"
-                    name = "Unknown"
-                    
-                    # Use the known face with the smallest distance to the new face
-                    face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                    
-                    if len(face_distances) > 0:
-                        best_match_index = np.argmin(face_distances)
-                        # Only accept matches with distance below threshold
-                        if matches[best_match_index] and face_distances[best_match_index] < 0.5:
-                            student_id = self.known_face_ids[best_match_index]
-                            name = self.known_face_names[best_match_index]
-                            
-                            # Mark attendance with cooldown to avoid duplicate marking
-                            current_time = time.time()
-                            is_already_marked = False
-                            
-                            if student_id in self.marked_students:
-                                is_already_marked = True
-                            
-                            if student_id not in self.last_marked_time or \
-                               (current_time - self.last_marked_time[student_id] > self.cooldown_seconds):
-                                # Mark attendance in database
-                                if not is_already_marked:
-                                    result = self.db.mark_attendance(student_id, self.lecture_id)
-                                    print(f"{result} at {time.strftime('%H:%M:%S')}")
-                                    
-                                    # Update last marked time
-                                    self.last_marked_time[student_id] = current_time
-                                    self.marked_students.add(student_id)
-                                else:
-                                    print(f"Already marked attendance for {name} ({student_id})")
-                    
-                    face_ids.append(student_id)
-                    face_names.append(name)
+                face_locations, matches = self.recognize_scheduled_frame(frame, scheduler)
                 
                 # Update previous data
                 prev_face_locations = face_locations
-                prev_face_ids = face_ids
-                prev_face_names = face_names
+                prev_face_ids = [student_id for student_id, _, _ in matches]
+                prev_face_names = [name for _, name, _ in matches]
             
             # Always draw using the most recent detection results, prevents flashing
-            for (top, right, bottom, left), student_id, name in zip(prev_face_locations, prev_face_ids, prev_face_names):
-                # Draw box and name on frame
-                if student_id != "Unknown":
-                    label = f"{name} ({student_id})"
-                    
-                    # Add "Already marked" indicator
-                    if student_id in self.marked_students:
-                        label += " - Already marked"  # Changed from "✓" to text
-                    color = (0, 255, 0)  # Green for recognized faces
-                else:
-                    label = "Unknown"
-                    color = (0, 0, 255)  # Red for unknown faces
-                
-                # Scale coordinates if needed for display frame
-                draw_box_with_name(display_frame, (top, right, bottom, left), label,color)
+            self.draw_results(display_frame, prev_face_locations, prev_face_ids, prev_face_names)
             
             # Display the resulting image (full resolution)
             cv2.imshow('Face Recognition Attendance System', display_frame)
@@ -160,18 +605,87 @@ class FaceRecognitionAttendance:
                 break
             
             frame_count += 1
+            
+            # Report speed regularly so the detection scale can be tuned
+            if time.time() - last_report_time >= 10.0:
+                last_report_time = time.time()
+                self.print_speed_report(frame_count, last_report_time - start_time, scheduler)
+        
+        self.print_final_report(frame_count, time.time() - start_time, scheduler)
         
         # Release resources
         cap.release()
         cv2.destroyAllWindows()
         
+        # Make sure buffered marks reach the database before reporting
+        self.flush_attendance()
+        
         # Print summary
-        print("\nAttendance Summary for Lecture:", self.lecture_id)
-        print(f"Total students marked present: {len(self.marked_students)}")
-        for student_id in self.marked_students:
-            index = self.known_face_ids.index(student_id)
-            name = self.known_face_names[index]
-            print(f"- {name} ({student_id})")
+        self.print_summary()
+    
+    def start_headless_recognition(self, camera_source=0, recognition_interval=1.0, scheduler=None,
+                                   duration=None, stop_event=None, on_tick=None):
+        """Run recognition without a window until stop_event is set, SIGINT/SIGTERM or the duration ends
+        
+        Skipped frames are only grabbed, never decoded or copied, and nothing is drawn.
+        on_tick, when given, is called before every frame and opens and closes
+        the lecture sessions itself; while it returns False frames are grabbed
+        twice a second, to keep the camera open, and not processed.
+        """
+        scheduler = scheduler or AdaptiveScheduler(base_interval=recognition_interval)
+        stop_event = stop_event or threading.Event()
+        restore_signals = stop_on_signals(stop_event)
+        
+        cap = cv2.VideoCapture(camera_source)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        
+        frame_count = 0
+        start_time = time.time()
+        last_report_time = start_time
+        
+        print("Starting headless face recognition attendance system...")
+        print(f"Stop with Ctrl+C or SIGTERM{f', or after {duration:.0f}s' if duration else ''}")
+        
+        if on_tick is None:
+            self.begin_session()
+        
+        try:
+            while not stop_event.is_set():
+                if duration is not None and time.time() - start_time >= duration:
+                    break
+                
+                # Grab without decoding, only frames that will be processed are retrieved
+                if not cap.grab():
+                    print("Failed to grab frame")
+                    break
+                frame_count += 1
+                
+                if on_tick is not None and not on_tick():
+                    # No lecture running, keep the camera warm at a low rate
+                    stop_event.wait(0.5)
+                    continue
+                
+                process_this_frame = scheduler.should_process()
+                self.metrics.inc("frames_total", labels={"result": "processed" if process_this_frame else "skipped"})
+                if process_this_frame:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        print("Failed to decode frame")
+                        break
+                    self.recognize_scheduled_frame(frame, scheduler)
+                
+                if time.time() - last_report_time >= 10.0:
+                    last_report_time = time.time()
+                    self.print_speed_report(frame_count, last_report_time - start_time, scheduler)
+        finally:
+            restore_signals()
+            cap.release()
+        
+        self.print_final_report(frame_count, time.time() - start_time, scheduler)
+        self.flush_attendance()
+        if on_tick is None:
+            self.print_summary()
 
 # Example usage
 if __name__ == "__main__":
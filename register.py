@@ -4,13 +4,16 @@ import numpy as np
 import os
 import time
 from database import Database
+from compaction import compact_encodings
 from utils import save_student_image
 
 class StudentRegistration:
-    def __init__(self, db_connection=None):
+    def __init__(self, db_connection=None, max_prototypes=0, dedup_threshold=0.0):
         self.db = db_connection if db_connection else Database()
         self.num_images = 20  # Number of images to capture
         self.image_folder = "data/student_images"
+        self.max_prototypes = max_prototypes    # Prototype encodings kept per student, 0 keeps all
+        self.dedup_threshold = dedup_threshold  # Drop captures closer than this to one already kept
         
         # Create folder if it doesn't exist
         if not os.path.exists(self.image_folder):
@@ -129,9 +132,16 @@ class StudentRegistration:
         
         # Register student with all face encodings if we captured any
         if len(face_encodings) > 0:
+            captured_count = len(face_encodings)
+            
+            # Compact near-identical angles into a few prototypes
+            if self.max_prototypes or self.dedup_threshold:
+                face_encodings = compact_encodings(face_encodings, self.max_prototypes, self.dedup_threshold)
+                print(f"Compacted {captured_count} captured encodings into {len(face_encodings)} prototypes")
+            
             result = self.db.register_student(student_id, name, department, face_encodings)
             print(result)
-            print(f"Registered student with {len(face_encodings)} different face angles")
+            print(f"Registered student with {captured_count} different face angles")
             return True
         else:
             print("No face encodings captured. Registration failed.")
@@ -0,0 +1,204 @@
+import pymongo
+from pymongo.errors import OperationFailure
+
+def attendance_percentages(held, attended, students=()):
+    """Percentage rows for (student_id, lectures attended) pairs out of held lectures, lowest first
+
+    Every student in students gets a row, with 0 lectures attended unless
+    attended says otherwise.
+    """
+    counts = dict.fromkeys(students, 0)
+    counts.update(attended)
+    report = [{
+        "student_id": student_id,
+        "attended": count,
+        "lectures_held": held,
+        "percentage": round(100.0 * count / held, 1) if held else 0.0
+    } for student_id, count in counts.items()]
+    report.sort(key=lambda row: (row["percentage"], row["student_id"]))
+    return report
+
+class AttendanceRollups:
+    def __init__(self, db, create_indexes=True):
+        """Attendance counters kept next to the raw records for fast course analytics
+
+        attendance_rollups holds one document per student, course and day with
+        the number of lectures attended. lecture_rollups holds one document per
+        course and day with the number of lectures held (started, running or
+        completed) and of attendance records. Counters are incremented as marks
+        are written and lectures start, so a running lecture counts in both,
+        and rebuild() recomputes both collections from the raw records.
+        """
+        self.db = db
+        self.attendance = db["attendance"]
+        self.lectures = db["lectures"]
+        self.students = db["students"]
+        self.course_rosters = db["course_rosters"]
+        self.student_rollups = db["attendance_rollups"]
+        self.lecture_rollups = db["lecture_rollups"]
+        self.lecture_keys = {}  # lecture_id -> (course_code, date), fixed once a lecture exists
+
+        if create_indexes:
+            self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Unique keys of the rollup documents, also serving the course and student queries"""
+        try:
+            self.student_rollups.create_index(
+                [("course_code", pymongo.ASCENDING), ("date", pymongo.ASCENDING), ("student_id", pymongo.ASCENDING)],
+                name="unique_course_date_student", unique=True)
+            self.lecture_rollups.create_index(
+                [("course_code", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
+                name="unique_course_date", unique=True)
+        except OperationFailure as error:
+            print(f"Could not create unique rollup indexes: {error}")
+        self.student_rollups.create_index(
+            [("student_id", pymongo.ASCENDING), ("course_code", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
+            name="student_course_date")
+
+    def lecture_key(self, lecture_id):
+        """(course_code, YYYY-MM-DD start date) of a started lecture, cached"""
+        key = self.lecture_keys.get(lecture_id)
+        if key is None:
+            lecture = self.lectures.find_one({"lecture_id": lecture_id},
+                                             {"course_code": 1, "start_time": 1, "status": 1})
+            if lecture is None or not lecture.get("course_code") or lecture.get("status") == "scheduled":
+                # Not started (yet) or without a course, nothing to roll up
+                return None
+            key = self.lecture_keys[lecture_id] = (lecture["course_code"], lecture["start_time"].strftime("%Y-%m-%d"))
+        return key
+
+    def record_attendance(self, new_records):
+        """Count newly inserted (student_id, lecture_id) attendance records
+        
+        Records are counted on the day their lecture started, so attended and
+        held lectures of a day always refer to the same lectures.
+        """
+        student_counts = {}
+        lecture_counts = {}
+        for student_id, lecture_id in new_records:
+            # Attendance without a lecture belongs to no course
+            key = self.lecture_key(lecture_id) if lecture_id else None
+            if key is None:
+                continue
+            student_counts[key + (student_id,)] = student_counts.get(key + (student_id,), 0) + 1
+            lecture_counts[key] = lecture_counts.get(key, 0) + 1
+
+        if student_counts:
+            self.student_rollups.bulk_write([
+                pymongo.UpdateOne({"course_code": course_code, "date": date, "student_id": student_id},
+                                  {"$inc": {"attended": count}}, upsert=True)
+                for (course_code, date, student_id), count in student_counts.items()
+            ], ordered=False)
+            self.lecture_rollups.bulk_write([
+                pymongo.UpdateOne({"course_code": course_code, "date": date},
+                                  {"$inc": {"present": count}, "$setOnInsert": {"lectures_held": 0}}, upsert=True)
+                for (course_code, date), count in lecture_counts.items()
+            ], ordered=False)
+
+    def record_lecture_start(self, lecture):
+        """Count a lecture that just started, or a scheduled one ended without being started"""
+        if not lecture.get("course_code"):
+            return
+        self.lecture_rollups.update_one(
+            {"course_code": lecture["course_code"], "date": lecture["start_time"].strftime("%Y-%m-%d")},
+            {"$inc": {"lectures_held": 1}, "$setOnInsert": {"present": 0}},
+            upsert=True
+        )
+
+    def rebuild(self):
+        """Recompute both rollup collections from the raw attendance and lecture records"""
+        # Attendance per student, course and day; $out swaps the collection in atomically
+        self.attendance.aggregate([
+            {"$match": {"lecture_id": {"$type": "string"}}},
+            {"$lookup": {"from": "lectures", "localField": "lecture_id", "foreignField": "lecture_id",
+                         "as": "lecture"}},
+            {"$unwind": "$lecture"},
+            {"$match": {"lecture.course_code": {"$type": "string"}, "lecture.status": {"$ne": "scheduled"}}},
+            {"$group": {"_id": {"course_code": "$lecture.course_code",
+                                "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$lecture.start_time"}},
+                                "student_id": "$student_id"},
+                        "attended": {"$sum": 1}}},
+            {"$project": {"_id": 0, "course_code": "$_id.course_code", "date": "$_id.date",
+                          "student_id": "$_id.student_id", "attended": 1}},
+            {"$out": "attendance_rollups"}
+        ], allowDiskUse=True)
+
+        # Started lectures per course and day, plus the attendance records they collected
+        self.lectures.aggregate([
+            {"$match": {"course_code": {"$type": "string"}, "status": {"$ne": "scheduled"}}},
+            {"$lookup": {"from": "attendance", "localField": "lecture_id", "foreignField": "lecture_id",
+                         "as": "records"}},
+            {"$group": {
+                "_id": {"course_code": "$course_code",
+                        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$start_time"}}},
+                "lectures_held": {"$sum": 1},
+                "present": {"$sum": {"$size": "$records"}}
+            }},
+            {"$project": {"_id": 0, "course_code": "$_id.course_code", "date": "$_id.date",
+                          "lectures_held": 1, "present": 1}},
+            {"$out": "lecture_rollups"}
+        ], allowDiskUse=True)
+
+        # A first rebuild creates the collections, and with them no indexes
+        self.ensure_indexes()
+        return (f"Rebuilt {self.student_rollups.estimated_document_count()} student and "
+                f"{self.lecture_rollups.estimated_document_count()} course rollups")
+
+    def date_match(self, course_code, date_from=None, date_to=None):
+        """Filter on a course and an inclusive YYYY-MM-DD range"""
+        match = {"course_code": course_code}
+        if date_from or date_to:
+            match["date"] = {}
+            if date_from:
+                match["date"]["$gte"] = date_from
+            if date_to:
+                match["date"]["$lte"] = date_to
+        return match
+
+    def lectures_held(self, course_code, date_from=None, date_to=None):
+        """Lectures held (running or completed) of a course in the date range"""
+        result = list(self.lecture_rollups.aggregate([
+            {"$match": self.date_match(course_code, date_from, date_to)},
+            {"$group": {"_id": None, "held": {"$sum": "$lectures_held"}}}
+        ]))
+        return result[0]["held"] if result else 0
+
+    def course_students(self, course_code):
+        """student_ids enrolled in a course, every registered student when it has no roster"""
+        roster = [document["student_id"] for document in
+                  self.course_rosters.find({"course_code": course_code}, {"_id": 0, "student_id": 1})]
+        return roster or self.students.distinct("student_id")
+
+    def course_attendance(self, course_code, date_from=None, date_to=None):
+        """Attendance percentage of every student of a course in a date range, lowest first"""
+        held = self.lectures_held(course_code, date_from, date_to)
+        rows = self.student_rollups.aggregate([
+            {"$match": self.date_match(course_code, date_from, date_to)},
+            {"$group": {"_id": "$student_id", "attended": {"$sum": "$attended"}}},
+        ])
+        return attendance_percentages(held, ((row["_id"], row["attended"]) for row in rows),
+                                      self.course_students(course_code))
+
+    def defaulters(self, course_code, date_from=None, date_to=None, threshold=75.0):
+        """Students of a course attending less than threshold percent in the date range"""
+        return [row for row in self.course_attendance(course_code, date_from, date_to)
+                if row["percentage"] < threshold]
+
+    def course_trend(self, course_code, date_from=None, date_to=None):
+        """Lectures held and attendance records per day of a course"""
+        return list(self.lecture_rollups.find(self.date_match(course_code, date_from, date_to),
+                                              {"_id": 0, "date": 1, "lectures_held": 1, "present": 1})
+                    .sort("date", pymongo.ASCENDING))
+
+    def student_attendance(self, student_id, course_code=None):
+        """Lectures attended per course by one student"""
+        match = {"student_id": student_id}
+        if course_code:
+            match["course_code"] = course_code
+        return list(self.student_rollups.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$course_code", "attended": {"$sum": "$attended"}}},
+            {"$project": {"_id": 0, "course_code": "$_id", "attended": 1}},
+            {"$sort": {"course_code": 1}}
+        ]))
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+
+class AdaptiveScheduler:
+    def __init__(self, base_interval=1.0, min_interval=0.1, max_interval=3.0, cpu_budget=0.5,
+                 backoff=1.5, smoothing=0.3, rate_window=10.0):
+        """Decide from wall-clock time and measured processing cost when to process the next frame
+
+        The gap between processed frames is the larger of two intervals:
+        - the budget interval, cost / cpu_budget, so processing keeps to the
+          given share of one core and the display never freezes on a slow host
+        - the scene interval, which drops to min_interval when new faces show up
+          and grows by backoff (up to max_interval) while the scene is stable
+        Processing cost is an exponential moving average of measured frame times.
+        """
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.cpu_budget = cpu_budget
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.rate_window = rate_window
+
+        self.lock = threading.Lock()
+        self.scene_interval = base_interval
+        self.average_cost = 0.0
+        self.last_started = None
+        self.last_face_count = 0
+        self.processed = deque()  # Start times of recently processed frames
+        self.busy_seconds = 0.0
+        self.first_started = None
+
+    def interval(self):
+        """Current seconds between processed frames"""
+        budget_interval = self.average_cost / self.cpu_budget if self.cpu_budget > 0 else 0.0
+        return max(self.min_interval, budget_interval, self.scene_interval)
+
+    def should_process(self, now=None):
+        """True when enough time has passed to process the frame captured now, and claims it"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.last_started is not None and now - self.last_started < self.interval():
+                return False
+            self.last_started = now
+            if self.first_started is None:
+                self.first_started = now
+            self.processed.append(now)
+            while self.processed and now - self.processed[0] > self.rate_window:
+                self.processed.popleft()
+            return True
+
+    def record(self, cost_seconds, face_count):
+        """Feed back the processing time and face count of a processed frame"""
+        with self.lock:
+            if self.average_cost == 0.0:
+                self.average_cost = cost_seconds
+            else:
+                self.average_cost += self.smoothing * (cost_seconds - self.average_cost)
+            self.busy_seconds += cost_seconds
+
+            if face_count > self.last_face_count:
+                # New faces: speed up to identify them quickly
+                self.scene_interval = self.min_interval
+            elif face_count == self.last_face_count:
+                # Stable scene: back off
+                self.scene_interval = min(self.max_interval, self.scene_interval * self.backoff)
+            # Faces leaving keep the current rate
+            self.last_face_count = face_count
+
+    def effective_rate(self, now=None):
+        """Processed frames per second over the last rate_window seconds"""
+        now = time.time() if now is None else now
+        with self.lock:
+            recent = [started for started in self.processed if now - started <= self.rate_window]
+            if not recent:
+                return 0.0
+            return len(recent) / min(self.rate_window, max(now - self.first_started, 1e-6))
+
+    def cpu_share(self, now=None):
+        """Share of wall-clock time spent processing since the first processed frame"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.first_started is None or now <= self.first_started:
+                return 0.0
+            return self.busy_seconds / (now - self.first_started)
+
+    def stats(self, now=None):
+        """Effective rate, interval and processing cost for reports"""
+        return {
+            "effective_rate": round(self.effective_rate(now), 2),
+            "interval_seconds": round(self.interval(), 3),
+            "average_cost_ms": round(1000.0 * self.average_cost, 1),
+            "cpu_share": round(self.cpu_share(now), 3),
+        }
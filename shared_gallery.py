@@ -0,0 +1,56 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+def attach_shared_memory(name):
+    """Map a shared memory segment created by another process, which alone unlinks it"""
+    try:
+        # Python 3.13+: the creating process alone tracks and unlinks the segment
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+class SharedGallery:
+    def __init__(self, memory, shape, student_ids, names, owner):
+        """Gallery encoding matrix living in shared memory, see create() and attach()"""
+        self.memory = memory
+        self.shape = tuple(shape)
+        self.student_ids = student_ids
+        self.names = names
+        self.owner = owner  # Only the creating process unlinks the segment
+        self.encodings = np.ndarray(self.shape, dtype=np.float32, buffer=memory.buf)
+
+    @classmethod
+    def create(cls, encodings, student_ids, names):
+        """Copy a gallery into a new shared memory segment, done once by the supervisor"""
+        encodings = np.asarray(encodings, dtype=np.float32)
+        # Zero-size segments are not allowed, keep at least one byte
+        memory = shared_memory.SharedMemory(create=True, size=max(1, encodings.nbytes))
+        gallery = cls(memory, encodings.shape, list(student_ids), list(names), owner=True)
+        gallery.encodings[:] = encodings
+        return gallery
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Map a gallery created by another process without copying the matrix"""
+        memory = attach_shared_memory(descriptor["name"])
+        return cls(memory, descriptor["shape"], descriptor["student_ids"], descriptor["names"], owner=False)
+
+    def descriptor(self):
+        """Picklable description handed to worker processes"""
+        return {
+            "name": self.memory.name,
+            "shape": self.shape,
+            "student_ids": self.student_ids,
+            "names": self.names,
+        }
+
+    def as_gallery(self):
+        """(encodings, student_ids, names) tuple accepted by FaceRecognitionAttendance"""
+        return self.encodings, self.student_ids, self.names
+
+    def close(self):
+        """Release this process's mapping, and the segment itself in the creating process"""
+        self.encodings = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
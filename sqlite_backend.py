@@ -0,0 +1,506 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+import numpy as np
+from metrics import COUNT_BUCKETS, NULL_METRICS
+from rollups import attendance_percentages
+from storage import ENCODING_SIZE, REPORT_PROJECTION, StorageBackend, blob_encodings, encodings_blob, project
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    student_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    department TEXT NOT NULL DEFAULT '',
+    face_encodings BLOB NOT NULL,  -- little-endian float32 matrix, 128 values per encoding
+    registered_on TEXT NOT NULL,
+    updated_on TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS students_updated_on ON students (updated_on);
+
+CREATE TABLE IF NOT EXISTS lectures (
+    lecture_id TEXT PRIMARY KEY,
+    course_code TEXT,
+    instructor TEXT,
+    room TEXT,
+    start_time TEXT NOT NULL,
+    end_time TEXT,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lectures_course_start_time ON lectures (course_code, start_time);
+CREATE INDEX IF NOT EXISTS lectures_start_time_room ON lectures (start_time, room);
+
+CREATE TABLE IF NOT EXISTS course_rosters (
+    course_code TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    enrolled_on TEXT NOT NULL,
+    PRIMARY KEY (course_code, student_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    lecture_id TEXT,
+    timestamp TEXT,
+    entry_time TEXT,
+    exit_time TEXT,
+    status TEXT NOT NULL
+);
+-- One record per student and lecture, and per student and day without a lecture
+CREATE UNIQUE INDEX IF NOT EXISTS attendance_student_lecture ON attendance (student_id, lecture_id)
+    WHERE lecture_id IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS attendance_student_day ON attendance (student_id, date)
+    WHERE lecture_id IS NULL;
+CREATE INDEX IF NOT EXISTS attendance_student_date ON attendance (student_id, date);
+CREATE INDEX IF NOT EXISTS attendance_lecture_student ON attendance (lecture_id, student_id);
+CREATE INDEX IF NOT EXISTS attendance_date_lecture ON attendance (date, lecture_id);
+
+CREATE TABLE IF NOT EXISTS attendance_rollups (
+    course_code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    student_id TEXT NOT NULL,
+    attended INTEGER NOT NULL,
+    PRIMARY KEY (course_code, date, student_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attendance_rollups_student ON attendance_rollups (student_id, course_code, date);
+
+CREATE TABLE IF NOT EXISTS lecture_rollups (
+    course_code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    lectures_held INTEGER NOT NULL,
+    present INTEGER NOT NULL,
+    PRIMARY KEY (course_code, date)
+) WITHOUT ROWID;
+
+-- Rollups are counted in the transaction that writes the record, on the day the lecture started.
+-- A lecture is held from the moment it starts, and only marks of started lectures are counted,
+-- so a running lecture is in both counters
+CREATE TRIGGER IF NOT EXISTS rollup_attendance AFTER INSERT ON attendance
+WHEN NEW.lecture_id IS NOT NULL
+BEGIN
+    INSERT INTO attendance_rollups (course_code, date, student_id, attended)
+    SELECT course_code, substr(start_time, 1, 10), NEW.student_id, 1 FROM lectures
+    WHERE lecture_id = NEW.lecture_id AND course_code != '' AND status != 'scheduled'
+    ON CONFLICT (course_code, date, student_id) DO UPDATE SET attended = attended + 1;
+    INSERT INTO lecture_rollups (course_code, date, lectures_held, present)
+    SELECT course_code, substr(start_time, 1, 10), 0, 1 FROM lectures
+    WHERE lecture_id = NEW.lecture_id AND course_code != '' AND status != 'scheduled'
+    ON CONFLICT (course_code, date) DO UPDATE SET present = present + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_lecture_create AFTER INSERT ON lectures
+WHEN NEW.status != 'scheduled' AND NEW.course_code != ''
+BEGIN
+    INSERT INTO lecture_rollups (course_code, date, lectures_held, present)
+    VALUES (NEW.course_code, substr(NEW.start_time, 1, 10), 1, 0)
+    ON CONFLICT (course_code, date) DO UPDATE SET lectures_held = lectures_held + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_lecture_start AFTER UPDATE OF status ON lectures
+WHEN OLD.status = 'scheduled' AND NEW.status != 'scheduled' AND NEW.course_code != ''
+BEGIN
+    INSERT INTO lecture_rollups (course_code, date, lectures_held, present)
+    VALUES (NEW.course_code, substr(NEW.start_time, 1, 10), 1, 0)
+    ON CONFLICT (course_code, date) DO UPDATE SET lectures_held = lectures_held + 1;
+END;
+"""
+
+# Trigger of older files that only counted lectures once they completed
+LEGACY_TRIGGER = "rollup_lecture_end"
+
+# Fixed statements, compiled once and reused from the connection's statement cache
+UPSERT_STUDENT = """
+    INSERT INTO students (student_id, name, department, face_encodings, registered_on, updated_on)
+    VALUES (?1, COALESCE(?2, ?1), COALESCE(?3, ''), ?4, ?5, ?5)
+    ON CONFLICT (student_id) DO UPDATE SET
+        name = COALESCE(?2, name), department = COALESCE(?3, department),
+        face_encodings = excluded.face_encodings, updated_on = excluded.updated_on
+"""
+STUDENTS_AFTER = """
+    SELECT rowid, student_id, name, face_encodings FROM students
+    WHERE rowid > ? AND updated_on > ? ORDER BY rowid LIMIT ?
+"""
+INSERT_LECTURE_MARK = """
+    INSERT OR IGNORE INTO attendance (student_id, date, lecture_id, timestamp, status)
+    VALUES (?, ?, ?, ?, 'present')
+"""
+INSERT_DAY_MARK = """
+    INSERT OR IGNORE INTO attendance (student_id, date, lecture_id, entry_time, exit_time, status)
+    VALUES (?, ?, NULL, ?, ?, 'present')
+"""
+UPDATE_DAY_MARK = """
+    UPDATE attendance SET entry_time = min(entry_time, ?3), exit_time = max(COALESCE(exit_time, ?3), ?3)
+    WHERE student_id = ?1 AND date = ?2 AND lecture_id IS NULL
+"""
+ATTENDANCE_COLUMNS = "id, student_id, date, lecture_id, timestamp, entry_time, exit_time, status"
+
+# Columns holding ISO timestamps, returned as datetimes like the MongoDB backend
+TIME_FIELDS = ("timestamp", "entry_time", "exit_time", "start_time", "end_time")
+
+def stamp(value):
+    """ISO text of a datetime, ordered the same way as the datetimes"""
+    return value.isoformat(timespec="microseconds")
+
+def attendance_record(row, projection):
+    """Attendance row as a record dict keyed by _id"""
+    record = {"_id" if field == "id" else field: row[field] for field in row.keys()}
+    for field in TIME_FIELDS:
+        if record.get(field):
+            record[field] = datetime.fromisoformat(record[field])
+    return project(record, projection)
+
+class SQLiteDatabase(StorageBackend):
+    def __init__(self, path="data/attendance.db", metrics=None, cached_statements=256):
+        """Embedded storage backend in one SQLite file, no database server needed
+
+        The file is in WAL mode, so reports and other processes read while
+        attendance is written, with synchronous=NORMAL, so a commit appends to
+        the WAL without waiting for an fsync. Statements are fixed SQL with
+        parameters, compiled once per connection. Bulk writes run in one
+        transaction and face encodings are stored as float32 BLOBs. Rollups are
+        kept by triggers in the same transaction as the records.
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.metrics = metrics or NULL_METRICS  # Write latencies, no-op unless enabled
+        self.lock = threading.RLock()  # One connection shared by the recognition, writer and watcher threads
+        self.connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False,
+                                          cached_statements=cached_statements)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        legacy = self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                                         (LEGACY_TRIGGER,)).fetchone()
+        if legacy:
+            self.connection.execute(f"DROP TRIGGER {LEGACY_TRIGGER}")
+        self.connection.executescript(SCHEMA)
+        self.rollups = SQLiteRollups(self)
+        if legacy:
+            # Counters of the old trigger left out running lectures
+            print(self.rollups.rebuild())
+
+    def query(self, sql, params=()):
+        """Rows of one read statement"""
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def register_student(self, student_id, name, department, face_encodings):
+        """Register a new student with face encodings"""
+        blob = encodings_blob(face_encodings)
+        with self.lock, self.connection:
+            existing = self.connection.execute("SELECT 1 FROM students WHERE student_id = ?", (student_id,)).fetchone()
+            self.connection.execute(UPSERT_STUDENT, (student_id, name, department, blob, stamp(datetime.now())))
+        if existing:
+            return f"Updated face data for student {student_id}"
+        return f"Registered student {student_id} successfully"
+
+    def add_face_encoding(self, student_id, face_encoding):
+        """Add an additional face encoding for an existing student"""
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT face_encodings FROM students WHERE student_id = ?",
+                                          (student_id,)).fetchone()
+            if row is None:
+                return f"Student {student_id} not found"
+            encodings = np.vstack([blob_encodings(row["face_encodings"]),
+                                   np.asarray(face_encoding, dtype=np.float32).reshape(-1, ENCODING_SIZE)])
+            self.connection.execute("UPDATE students SET face_encodings = ?, updated_on = ? WHERE student_id = ?",
+                                    (encodings_blob(encodings), stamp(datetime.now()), student_id))
+        return f"Added new face encoding for student {student_id}"
+
+    def register_students_bulk(self, students):
+        """Register or update many students in one transaction
+
+        Each student is a dict with student_id, face_encodings and optionally
+        name and department. Missing names only fill in new student records.
+        """
+        now = stamp(datetime.now())
+        rows = [(student["student_id"], student.get("name") or None, student.get("department") or None,
+                 encodings_blob(student["face_encodings"]), now) for student in students]
+        if not rows:
+            return "No students to register"
+
+        count = "SELECT COUNT(*) FROM students"
+        with self.metrics.timer("db_write_seconds", {"operation": "register_students_bulk"}):
+            with self.lock, self.connection:
+                before = self.connection.execute(count).fetchone()[0]
+                self.connection.executemany(UPSERT_STUDENT, rows)
+                added = self.connection.execute(count).fetchone()[0] - before
+        return f"Registered {added} new and updated {len(rows) - added} existing students"
+
+    def iter_student_encodings(self, since=None, batch_size=500):
+        """Yield each student with all of its face encodings as one float32 matrix
+
+        When since is given, only students updated after that time are returned.
+        Students are read in rowid batches so writers are never blocked for long.
+        """
+        since_text = stamp(since) if since else ""
+        last_rowid = 0
+        while True:
+            rows = self.query(STUDENTS_AFTER, (last_rowid, since_text, batch_size))
+            for row in rows:
+                yield {
+                    "student_id": row["student_id"],
+                    "name": row["name"],
+                    "face_encodings": blob_encodings(row["face_encodings"])
+                }
+            if len(rows) < batch_size:
+                return
+            last_rowid = rows[-1]["rowid"]
+
+    def create_lecture(self, lecture_id, course_code, instructor, room, start_time=None, end_time=None,
+                       status="active"):
+        """Create a new lecture session, or a scheduled one (status "scheduled", end_time planned)
+
+        Creating a lecture that was scheduled before starts it.
+        """
+        if not start_time:
+            start_time = datetime.now()
+
+        with self.lock, self.connection:
+            if self.connection.execute(
+                    "INSERT OR IGNORE INTO lectures (lecture_id, course_code, instructor, room, start_time, end_time, "
+                    "status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (lecture_id, course_code, instructor, room, stamp(start_time),
+                     stamp(end_time) if end_time else None, status)).rowcount:
+                return f"Scheduled lecture {lecture_id}" if status == "scheduled" else f"Created lecture {lecture_id}"
+            if status == "active" and self.connection.execute(
+                    "UPDATE lectures SET status = 'active' WHERE lecture_id = ? AND status = 'scheduled'",
+                    (lecture_id,)).rowcount:
+                return f"Started scheduled lecture {lecture_id}"
+        return f"Lecture {lecture_id} already exists"
+
+    def iter_lectures(self, start_from, start_to, room=None):
+        """Lectures starting in [start_from, start_to), optionally in one room, by start time"""
+        sql = "SELECT * FROM lectures WHERE start_time >= ? AND start_time < ?"
+        params = [stamp(start_from), stamp(start_to)]
+        if room:
+            sql += " AND room = ?"
+            params.append(room)
+        return [attendance_record(row, None) for row in self.query(sql + " ORDER BY start_time", params)]
+
+    def get_lecture(self, lecture_id):
+        """The lecture record of a lecture_id, None when there is none"""
+        rows = self.query("SELECT * FROM lectures WHERE lecture_id = ?", (lecture_id,))
+        return attendance_record(rows[0], None) if rows else None
+
+    def set_course_roster(self, course_code, student_ids):
+        """Replace the students enrolled in a course in one transaction"""
+        student_ids = sorted(set(student_ids))
+        with self.lock, self.connection:
+            before = {row["student_id"] for row in self.connection.execute(
+                "SELECT student_id FROM course_rosters WHERE course_code = ?", (course_code,))}
+            removed = before.difference(student_ids)
+            self.connection.executemany("DELETE FROM course_rosters WHERE course_code = ? AND student_id = ?",
+                                        [(course_code, student_id) for student_id in removed])
+            added = self.connection.executemany(
+                "INSERT OR IGNORE INTO course_rosters (course_code, student_id, enrolled_on) VALUES (?, ?, ?)",
+                [(course_code, student_id, stamp(datetime.now())) for student_id in student_ids]).rowcount
+        return f"Roster of {course_code}: {len(student_ids)} students ({added} added, {len(removed)} removed)"
+
+    def get_course_roster(self, course_code):
+        """Sorted student_ids enrolled in a course, empty when it has no roster"""
+        rows = self.query("SELECT student_id FROM course_rosters WHERE course_code = ? ORDER BY student_id",
+                          (course_code,))
+        return [row["student_id"] for row in rows]
+
+    def end_lecture(self, lecture_id):
+        """End a lecture session"""
+        # Started lectures were counted by the rollup triggers, a scheduled one ending is counted now
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE lectures SET end_time = ?, status = 'completed' WHERE lecture_id = ?",
+                                    (stamp(datetime.now()), lecture_id))
+        return f"Ended lecture {lecture_id}"
+
+    def mark_attendance(self, student_id, lecture_id=None):
+        """Mark attendance for a student"""
+        timestamp = datetime.now()
+        date_str = timestamp.strftime("%Y-%m-%d")
+
+        with self.lock, self.connection:
+            if not lecture_id:
+                # First sighting of the day creates the record, later ones move the exit time
+                if self.connection.execute(INSERT_DAY_MARK, (student_id, date_str, stamp(timestamp), None)).rowcount:
+                    return f"Marked attendance for student {student_id}"
+                self.connection.execute(
+                    "UPDATE attendance SET exit_time = ? WHERE student_id = ? AND date = ? AND lecture_id IS NULL",
+                    (stamp(timestamp), student_id, date_str))
+                return f"Updated exit time for student {student_id}"
+
+            if self.connection.execute(INSERT_LECTURE_MARK, (student_id, date_str, lecture_id, stamp(timestamp))).rowcount:
+                return f"Marked attendance for student {student_id} in lecture {lecture_id}"
+            return f"Already marked attendance for student {student_id} in lecture {lecture_id}"
+
+    def mark_attendance_bulk(self, marks):
+        """Write many (student_id, lecture_id, timestamp) marks in one transaction
+
+        Returns the number of new attendance records.
+        """
+        lecture_marks = []
+        day_marks = []
+        for student_id, lecture_id, timestamp in marks:
+            if lecture_id:
+                lecture_marks.append((student_id, timestamp.strftime("%Y-%m-%d"), lecture_id, stamp(timestamp)))
+            else:
+                day_marks.append((student_id, timestamp.strftime("%Y-%m-%d"), stamp(timestamp)))
+        if not lecture_marks and not day_marks:
+            return 0
+
+        self.metrics.observe("db_batch_size", len(lecture_marks) + len(day_marks),
+                             {"operation": "mark_attendance_bulk"}, COUNT_BUCKETS)
+        with self.metrics.timer("db_write_seconds", {"operation": "mark_attendance_bulk"}):
+            with self.lock, self.connection:
+                inserted = 0
+                if lecture_marks:
+                    # Lecture attendance is only written once
+                    inserted += self.connection.executemany(INSERT_LECTURE_MARK, lecture_marks).rowcount
+                if day_marks:
+                    # Date-based attendance keeps the first entry and the last exit time
+                    inserted += self.connection.executemany(
+                        INSERT_DAY_MARK, [mark + (mark[2],) for mark in day_marks]).rowcount
+                    self.connection.executemany(UPDATE_DAY_MARK, day_marks)
+        return inserted
+
+    def attendance_filter(self, date=None, lecture_id=None, student_id=None):
+        """WHERE clause and parameters shared by the attendance report queries"""
+        clauses = ["id > ?"]
+        params = []
+        for field, value in (("date", date), ("lecture_id", lecture_id), ("student_id", student_id)):
+            if value:
+                clauses.append(f"{field} = ?")
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def iter_attendance_report(self, date=None, lecture_id=None, student_id=None,
+                               projection=REPORT_PROJECTION, batch_size=1000):
+        """Stream attendance records in id batches instead of loading them all"""
+        after_id = 0
+        while True:
+            records, after_id = self.get_attendance_report_page(date, lecture_id, student_id, batch_size,
+                                                                after_id, projection)
+            yield from records
+            if after_id is None:
+                return
+
+    def get_attendance_report_page(self, date=None, lecture_id=None, student_id=None,
+                                   page_size=100, after_id=None, projection=REPORT_PROJECTION):
+        """Get one page of attendance records, returns (records, after_id for the next page)
+
+        Pages are keyed on the record id, so each page is an index range scan rather than an OFFSET.
+        """
+        where, params = self.attendance_filter(date, lecture_id, student_id)
+        rows = self.query(f"SELECT {ATTENDANCE_COLUMNS} FROM attendance WHERE {where} ORDER BY id LIMIT ?",
+                          [after_id or 0] + params + [page_size])
+        next_after_id = rows[-1]["id"] if len(rows) == page_size else None
+        return [attendance_record(row, projection) for row in rows], next_after_id
+
+    def date_range_filter(self, date_from=None, date_to=None):
+        """Clauses and parameters for an inclusive YYYY-MM-DD range"""
+        clauses, params = [], []
+        if date_from:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date <= ?")
+            params.append(date_to)
+        return clauses, params
+
+    def count_attendance_by_lecture(self, date_from=None, date_to=None):
+        """Count present students per lecture in the database"""
+        clauses, params = self.date_range_filter(date_from, date_to)
+        where = " AND ".join(["lecture_id IS NOT NULL"] + clauses)
+        rows = self.query(f"SELECT lecture_id, MIN(date) AS date, COUNT(*) AS present FROM attendance "
+                          f"WHERE {where} GROUP BY lecture_id ORDER BY date, lecture_id", params)
+        return [dict(row) for row in rows]
+
+    def count_attendance_by_date(self, date_from=None, date_to=None, lecture_id=None):
+        """Count distinct students present per date in the database"""
+        clauses, params = self.date_range_filter(date_from, date_to)
+        if lecture_id:
+            clauses.append("lecture_id = ?")
+            params.append(lecture_id)
+        where = " AND ".join(clauses) or "1"
+        rows = self.query(f"SELECT date, COUNT(DISTINCT student_id) AS present FROM attendance "
+                          f"WHERE {where} GROUP BY date ORDER BY date", params)
+        return [dict(row) for row in rows]
+
+    def close_connection(self):
+        """Close the SQLite file"""
+        with self.lock:
+            self.connection.close()
+
+class SQLiteRollups:
+    def __init__(self, database):
+        """Course analytics over the rollup tables kept by the SQLite triggers"""
+        self.database = database
+
+    def rebuild(self):
+        """Recompute both rollup tables from the raw attendance and lecture records"""
+        connection = self.database.connection
+        with self.database.lock, connection:
+            connection.execute("DELETE FROM attendance_rollups")
+            connection.execute("""
+                INSERT INTO attendance_rollups (course_code, date, student_id, attended)
+                SELECT lectures.course_code, substr(lectures.start_time, 1, 10), attendance.student_id, COUNT(*)
+                FROM attendance JOIN lectures ON lectures.lecture_id = attendance.lecture_id
+                WHERE lectures.course_code != '' AND lectures.status != 'scheduled' GROUP BY 1, 2, 3
+            """)
+            connection.execute("DELETE FROM lecture_rollups")
+            connection.execute("""
+                INSERT INTO lecture_rollups (course_code, date, lectures_held, present)
+                SELECT course_code, substr(start_time, 1, 10), COUNT(*),
+                       SUM((SELECT COUNT(*) FROM attendance WHERE attendance.lecture_id = lectures.lecture_id))
+                FROM lectures WHERE course_code != '' AND status != 'scheduled' GROUP BY 1, 2
+            """)
+            students = connection.execute("SELECT COUNT(*) FROM attendance_rollups").fetchone()[0]
+            courses = connection.execute("SELECT COUNT(*) FROM lecture_rollups").fetchone()[0]
+        return f"Rebuilt {students} student and {courses} course rollups"
+
+    def date_filter(self, course_code, date_from=None, date_to=None):
+        """WHERE clause and parameters for a course and an inclusive YYYY-MM-DD range"""
+        clauses, params = self.database.date_range_filter(date_from, date_to)
+        return " AND ".join(["course_code = ?"] + clauses), [course_code] + params
+
+    def lectures_held(self, course_code, date_from=None, date_to=None):
+        """Lectures held (running or completed) of a course in the date range"""
+        where, params = self.date_filter(course_code, date_from, date_to)
+        return self.database.query(f"SELECT COALESCE(SUM(lectures_held), 0) FROM lecture_rollups WHERE {where}",
+                                   params)[0][0]
+
+    def course_students(self, course_code):
+        """student_ids enrolled in a course, every registered student when it has no roster"""
+        roster = self.database.get_course_roster(course_code)
+        return roster or [row["student_id"] for row in self.database.query("SELECT student_id FROM students")]
+
+    def course_attendance(self, course_code, date_from=None, date_to=None):
+        """Attendance percentage of every student of a course in a date range, lowest first"""
+        held = self.lectures_held(course_code, date_from, date_to)
+        where, params = self.date_filter(course_code, date_from, date_to)
+        rows = self.database.query(f"SELECT student_id, SUM(attended) FROM attendance_rollups WHERE {where} "
+                                   f"GROUP BY student_id", params)
+        return attendance_percentages(held, (tuple(row) for row in rows), self.course_students(course_code))
+
+    def defaulters(self, course_code, date_from=None, date_to=None, threshold=75.0):
+        """Students of a course attending less than threshold percent in the date range"""
+        return [row for row in self.course_attendance(course_code, date_from, date_to)
+                if row["percentage"] < threshold]
+
+    def course_trend(self, course_code, date_from=None, date_to=None):
+        """Lectures held and attendance records per day of a course"""
+        where, params = self.date_filter(course_code, date_from, date_to)
+        rows = self.database.query(f"SELECT date, lectures_held, present FROM lecture_rollups WHERE {where} "
+                                   f"ORDER BY date", params)
+        return [dict(row) for row in rows]
+
+    def student_attendance(self, student_id, course_code=None):
+        """Lectures attended per course by one student"""
+        where, params = "student_id = ?", [student_id]
+        if course_code:
+            where += " AND course_code = ?"
+            params.append(course_code)
+        rows = self.database.query(f"SELECT course_code, SUM(attended) AS attended FROM attendance_rollups "
+                                   f"WHERE {where} GROUP BY course_code ORDER BY course_code", params)
+        return [dict(row) for row in rows]
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import numpy as np
+from metrics import NULL_METRICS
+
+ENCODING_SIZE = 128  # Length of a face_recognition encoding
+ENCODING_DTYPE = np.dtype("<f4")  # Encodings are stored as little-endian float32
+
+BACKENDS = ("mongo", "sqlite", "memory")
+DEFAULT_PATHS = {"mongo": "mongodb://localhost:27017/", "sqlite": "data/attendance.db"}
+
+# Fields returned by the reporting queries
+REPORT_PROJECTION = {
+    "student_id": 1, "lecture_id": 1, "date": 1, "status": 1,
+    "timestamp": 1, "entry_time": 1, "exit_time": 1
+}
+
+def encodings_blob(face_encodings):
+    """Pack one or more encodings into the bytes of a float32 matrix"""
+    matrix = np.asarray(face_encodings, dtype=ENCODING_DTYPE).reshape(-1, ENCODING_SIZE)
+    return np.ascontiguousarray(matrix).tobytes()
+
+def blob_encodings(blob):
+    """Zero-copy float32 matrix view over packed encodings"""
+    return np.frombuffer(blob, dtype=ENCODING_DTYPE).reshape(-1, ENCODING_SIZE)
+
+def project(record, projection):
+    """Copy of a record with only the projected fields and _id, like a MongoDB projection"""
+    if not projection:
+        return dict(record)
+    return {field: value for field, value in record.items() if field == "_id" or projection.get(field)}
+
+class StorageBackend:
+    """Storage operations used by the app, implemented by the MongoDB, SQLite and in-memory backends
+
+    Every backend has metrics (write latencies) and rollups (course analytics
+    with rebuild, course_attendance, defaulters, course_trend and
+    student_attendance). Attendance records are dicts with the same fields in
+    every backend, keyed by an increasing _id used for paging.
+    """
+    metrics = NULL_METRICS
+    rollups = None
+
+    def register_student(self, student_id, name, department, face_encodings):
+        """Register a new student with face encodings"""
+        raise NotImplementedError
+
+    def add_face_encoding(self, student_id, face_encoding):
+        """Add an additional face encoding for an existing student"""
+        raise NotImplementedError
+
+    def register_students_bulk(self, students):
+        """Register or update many students in one write"""
+        raise NotImplementedError
+
+    def iter_student_encodings(self, since=None):
+        """Yield each student (updated after since) with its face encodings as one float32 matrix"""
+        raise NotImplementedError
+
+    def watch_student_encodings(self, stop_event, max_await_ms=1000):
+        """Yield students as they change, only the MongoDB backend can push changes"""
+        raise NotImplementedError("Change notifications need the MongoDB backend")
+
+    def get_all_student_encodings(self):
+        """Retrieve all student face encodings"""
+        # Process students for recognition
+        processed_students = []
+
+        for student in self.iter_student_encodings():
+            # For each encoding of this student, create a recognition entry
+            for encoding in student["face_encodings"]:
+                processed_students.append({
+                    "student_id": student["student_id"],
+                    "name": student["name"],
+                    "face_encoding": encoding
+                })
+
+        return processed_students
+
+    def migrate_encodings_to_binary(self, batch_size=500):
+        """Convert legacy face encodings, only MongoDB has a legacy format"""
+        return "Face encodings are already stored as float32 binaries"
+
+    def create_lecture(self, lecture_id, course_code, instructor, room, start_time=None, end_time=None,
+                       status="active"):
+        """Create a new lecture session, or a scheduled one (status "scheduled", end_time planned)
+
+        Creating a lecture that was scheduled before starts it.
+        """
+        raise NotImplementedError
+
+    def iter_lectures(self, start_from, start_to, room=None):
+        """Lectures starting in [start_from, start_to), optionally in one room, by start time"""
+        raise NotImplementedError
+
+    def end_lecture(self, lecture_id):
+        """End a lecture session"""
+        raise NotImplementedError
+
+    def get_lecture(self, lecture_id):
+        """The lecture record of a lecture_id, None when there is none"""
+        raise NotImplementedError
+
+    def set_course_roster(self, course_code, student_ids):
+        """Replace the students enrolled in a course"""
+        raise NotImplementedError
+
+    def get_course_roster(self, course_code):
+        """Sorted student_ids enrolled in a course, empty when it has no roster"""
+        raise NotImplementedError
+
+    def mark_attendance(self, student_id, lecture_id=None):
+        """Mark attendance for a student"""
+        raise NotImplementedError
+
+    def ensure_attendance_indexes(self):
+        """Make sure attendance marks are deduplicated, backends with a fixed schema already are"""
+
+    def mark_attendance_bulk(self, marks):
+        """Write many (student_id, lecture_id, timestamp) marks idempotently, returns the number of new records"""
+        raise NotImplementedError
+
+    def iter_attendance_report(self, date=None, lecture_id=None, student_id=None,
+                               projection=REPORT_PROJECTION, batch_size=1000):
+        """Stream attendance records instead of loading them all"""
+        raise NotImplementedError
+
+    def get_attendance_report_page(self, date=None, lecture_id=None, student_id=None,
+                                   page_size=100, after_id=None, projection=REPORT_PROJECTION):
+        """Get one page of attendance records, returns (records, after_id for the next page)"""
+        raise NotImplementedError
+
+    def count_attendance_by_lecture(self, date_from=None, date_to=None):
+        """Count present students per lecture"""
+        raise NotImplementedError
+
+    def count_attendance_by_date(self, date_from=None, date_to=None, lecture_id=None):
+        """Count distinct students present per date"""
+        raise NotImplementedError
+
+    def get_attendance_report(self, date=None, lecture_id=None):
+        """Get attendance report for a specific date or lecture"""
+        return list(self.iter_attendance_report(date, lecture_id, projection=None))
+
+    def get_student_attendance(self, student_id):
+        """Get attendance history for a specific student"""
+        return list(self.iter_attendance_report(student_id=student_id, projection=None))
+
+    def iter_student_attendance(self, student_id, projection=REPORT_PROJECTION, batch_size=1000):
+        """Stream the attendance history of a student"""
+        return self.iter_attendance_report(student_id=student_id, projection=projection, batch_size=batch_size)
+
+    def get_student_attendance_page(self, student_id, page_size=100, after_id=None, projection=REPORT_PROJECTION):
+        """Get one page of the attendance history of a student"""
+        return self.get_attendance_report_page(student_id=student_id, page_size=page_size,
+                                               after_id=after_id, projection=projection)
+
+    def close_connection(self):
+        """Release the connection or file, nothing to do for in-process storage"""
+
+def open_backend(kind="mongo", path=None, create_indexes=True, metrics=None):
+    """Open a storage backend: mongo (path is the connection string), sqlite (path is the file) or memory"""
+    if kind == "mongo":
+        from database import Database
+        return Database(path or DEFAULT_PATHS["mongo"], create_indexes=create_indexes, metrics=metrics)
+    if kind == "sqlite":
+        from sqlite_backend import SQLiteDatabase
+        return SQLiteDatabase(path or DEFAULT_PATHS["sqlite"], metrics=metrics)
+    if kind == "memory":
+        from memory_backend import MemoryDatabase
+        return MemoryDatabase(metrics=metrics)
+    raise ValueError(f"Unknown storage backend {kind!r}, expected one of {', '.join(BACKENDS)}")
+
+def gallery_snapshot_folder(kind="mongo", path=None):
+    """Gallery snapshot folder of a storage backend, None for the in-memory backend
+
+    A snapshot only holds the students of the database it was read from, so
+    every backend and database file gets its own folder.
+    """
+    if kind == "memory":
+        return None
+    source = path or DEFAULT_PATHS[kind]
+    if kind == "mongo" and source == DEFAULT_PATHS["mongo"]:
+        return "data/gallery_snapshot"
+    if kind == "sqlite":
+        source = os.path.abspath(source)
+    return f"data/gallery_snapshot_{kind}_{hashlib.sha1(source.encode()).hexdigest()[:12]}"
@@ -0,0 +1,121 @@
+import itertools
+from matcher import UNKNOWN
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top = max(box_a[0], box_b[0])
+    right = min(box_a[1], box_b[1])
+    bottom = min(box_a[2], box_b[2])
+    left = max(box_a[3], box_b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    area_a = (box_a[1] - box_a[3]) * (box_a[2] - box_a[0])
+    area_b = (box_b[1] - box_b[3]) * (box_b[2] - box_b[0])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+def box_center_distance(box_a, box_b):
+    """Distance between box centers relative to the size of box_a"""
+    size = max(1, box_a[2] - box_a[0], box_a[1] - box_a[3])
+    dy = (box_a[0] + box_a[2] - box_b[0] - box_b[2]) / 2
+    dx = (box_a[1] + box_a[3] - box_b[1] - box_b[3]) / 2
+    return (dx * dx + dy * dy) ** 0.5 / size
+
+class Track:
+    def __init__(self, track_id, location, now):
+        """A face followed across processed frames, with its cached identity"""
+        self.track_id = track_id
+        self.location = location
+        self.student_id = None  # None until the face was encoded and matched once
+        self.name = UNKNOWN
+        self.distance = float("inf")
+        self.hits = 0           # Consecutive matches agreeing on the identity
+        self.confirmed = False
+        self.last_seen = now
+        self.last_attempt = 0.0  # Last time the face was encoded and matched
+        self.missed = 0
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_center_distance=0.5, max_missed=3, confirm_hits=2,
+                 reverify_seconds=30.0, unknown_retry_seconds=5.0):
+        """Associate detections between processed frames so known faces are not re-encoded
+
+        A track is encoded and matched until confirm_hits consecutive matches
+        agree on its identity, then only every reverify_seconds. Tracks that
+        stay Unknown are retried every unknown_retry_seconds.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_missed = max_missed
+        self.confirm_hits = confirm_hits
+        self.reverify_seconds = reverify_seconds
+        self.unknown_retry_seconds = unknown_retry_seconds
+        self.tracks = []
+        self.track_ids = itertools.count(1)
+
+    def update(self, face_locations, now):
+        """Associate detections with existing tracks, returns one track per detection"""
+        # Score every (track, detection) pair, IoU first and center distance as fallback
+        pairs = []
+        for track_index, track in enumerate(self.tracks):
+            for detection_index, location in enumerate(face_locations):
+                iou = box_iou(track.location, location)
+                if iou >= self.iou_threshold:
+                    pairs.append((1.0 + iou, track_index, detection_index))
+                else:
+                    distance = box_center_distance(track.location, location)
+                    if distance <= self.max_center_distance:
+                        pairs.append((1.0 - distance, track_index, detection_index))
+
+        # Greedy assignment, best pairs first
+        assigned = [None] * len(face_locations)
+        used_tracks = set()
+        for _, track_index, detection_index in sorted(pairs, reverse=True):
+            if track_index in used_tracks or assigned[detection_index] is not None:
+                continue
+            used_tracks.add(track_index)
+            assigned[detection_index] = self.tracks[track_index]
+
+        # Age tracks without a detection and drop the ones gone for too long
+        survivors = []
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in used_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+
+        # Start new tracks for unmatched detections
+        for detection_index, location in enumerate(face_locations):
+            track = assigned[detection_index]
+            if track is None:
+                track = Track(next(self.track_ids), location, now)
+                survivors.append(track)
+                assigned[detection_index] = track
+            track.location = location
+            track.last_seen = now
+            track.missed = 0
+
+        self.tracks = survivors
+        return assigned
+
+    def needs_identification(self, track, now):
+        """Whether a track must be encoded and matched on this frame"""
+        if track.student_id is None:
+            return True
+        if track.student_id == UNKNOWN:
+            return now - track.last_attempt >= self.unknown_retry_seconds
+        if not track.confirmed:
+            return True
+        return now - track.last_attempt >= self.reverify_seconds
+
+    def assign(self, track, student_id, name, distance, now):
+        """Store a match result on a track and update its confirmation state"""
+        if student_id == track.student_id:
+            track.hits += 1
+        else:
+            track.hits = 1
+        track.student_id = student_id
+        track.name = name
+        track.distance = distance
+        track.last_attempt = now
+        track.confirmed = student_id != UNKNOWN and track.hits >= self.confirm_hits
@@ -1,33 +1,66 @@
 import os
+import signal
+import tempfile
+import threading
 import cv2
 import numpy as np
-import pickle
+import json
 from datetime import datetime
 
-def save_encoding(student_id, encoding, folder="data/encodings"):
-    """Save face encoding to a file"""
+def save_gallery_snapshot(encodings, student_ids, names, snapshot_time, folder="data/gallery_snapshot"):
+    """Save the whole gallery as an encoding matrix plus an id/name table"""
     # Create folder if it doesn't exist
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+    os.makedirs(folder, exist_ok=True)
     
-    # Save encoding as pickle file
-    file_path = os.path.join(folder, f"{student_id}.pkl")
-    with open(file_path, 'wb') as file:
-        pickle.dump(encoding, file)
+    matrix_path = os.path.join(folder, "encodings.npy")
+    table_path = os.path.join(folder, "students.json")
     
-    return file_path
+    # Write to temporary files first so a crash never leaves a half-written snapshot. The
+    # names are unique, so processes saving to the same folder never write the same file
+    matrix_fd, matrix_tmp = tempfile.mkstemp(dir=folder, suffix=".npy.tmp")
+    table_fd, table_tmp = tempfile.mkstemp(dir=folder, suffix=".json.tmp")
+    try:
+        with os.fdopen(matrix_fd, 'wb') as file:
+            np.save(file, np.ascontiguousarray(encodings, dtype=np.float32))
+        with os.fdopen(table_fd, 'w') as file:
+            json.dump({
+                "snapshot_time": snapshot_time.isoformat(),
+                "count": len(student_ids),
+                "student_ids": list(student_ids),
+                "names": list(names)
+            }, file)
+        
+        os.replace(matrix_tmp, matrix_path)
+        os.replace(table_tmp, table_path)
+    finally:
+        # Left over only when writing failed
+        for path in (matrix_tmp, table_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    return folder
 
-def load_encoding(student_id, folder="data/encodings"):
-    """Load face encoding from a file"""
-    file_path = os.path.join(folder, f"{student_id}.pkl")
+def load_gallery_snapshot(folder="data/gallery_snapshot"):
+    """Open a gallery snapshot, returns (encodings, student_ids, names, snapshot_time) or None
     
-    if not os.path.exists(file_path):
+    The encoding matrix is memory-mapped, so opening is near-instant.
+    """
+    matrix_path = os.path.join(folder, "encodings.npy")
+    table_path = os.path.join(folder, "students.json")
+    
+    if not os.path.exists(matrix_path) or not os.path.exists(table_path):
         return None
     
-    with open(file_path, 'rb') as file:
-        encoding = pickle.load(file)
+    with open(table_path, 'r') as file:
+        table = json.load(file)
+    encodings = np.load(matrix_path, mmap_mode='r')
+    
+    # Ignore snapshots whose matrix and table disagree
+    if len(encodings) != table["count"]:
+        return None
     
-    return encoding
+    snapshot_time = datetime.fromisoformat(table["snapshot_time"])
+    return encodings, table["student_ids"], table["names"], snapshot_time
 
 def save_student_image(student_id, image, folder="data/student_images"):
     """Save student face image"""
@@ -48,6 +81,13 @@ def resize_frame(frame, scale=0.5):
     height = int(frame.shape[0] * scale)
     return cv2.resize(frame, (width, height))
 
+def scale_location(location, factor, frame_shape):
+    """Scale a (top, right, bottom, left) box by factor and clip it to the frame"""
+    top, right, bottom, left = location
+    height, width = frame_shape[:2]
+    return (max(0, int(round(top * factor))), min(width, int(round(right * factor))),
+            min(height, int(round(bottom * factor))), max(0, int(round(left * factor))))
+
 def draw_box_with_name(frame, location, name, color=(0, 255, 0)):
     """Draw bounding box and name on the frame"""
     top, right, bottom, left = location
@@ -61,4 +101,21 @@ def draw_box_with_name(frame, location, name, color=(0, 255, 0)):
     # Put text
     cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
     
-    return frame
\ No newline at end of file
+    return frame
+
+def stop_on_signals(stop_event):
+    """Set stop_event on SIGINT or SIGTERM, returns a function restoring the previous handlers"""
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread() is not threading.main_thread():
+        return lambda: None
+    
+    def handle(signum, _):
+        print(f"Received signal {signum}, stopping...")
+        stop_event.set()
+    
+    previous = {signum: signal.signal(signum, handle) for signum in (signal.SIGINT, signal.SIGTERM)}
+    
+    def restore():
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return restore
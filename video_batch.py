@@ -0,0 +1,171 @@
+import cv2
+import os
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from matcher import UNKNOWN
+from shared_gallery import SharedGallery
+
+# Per-process state of the video workers, set up once by init_worker
+worker_gallery = None
+worker_recognizer = None
+
+def plan_chunks(video_paths, chunk_seconds=300):
+    """Split every video into (path, start_frame, end_frame, fps) time chunks"""
+    chunks = []
+    for path in video_paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"Could not open video {path}, skipping it")
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        chunk_frames = max(1, int(chunk_seconds * fps))
+        for start in range(0, total_frames, chunk_frames):
+            chunks.append((path, start, min(total_frames, start + chunk_frames), fps))
+    return chunks
+
+def init_worker(descriptor, recognizer_options):
+    """Attach the shared gallery and build a database-less recognizer in this worker"""
+    global worker_gallery, worker_recognizer
+    from recognize import FaceRecognitionAttendance
+
+    worker_gallery = SharedGallery.attach(descriptor)
+    worker_recognizer = FaceRecognitionAttendance(gallery=worker_gallery.as_gallery(), **recognizer_options)
+
+def process_chunk(chunk, sample_interval=1.0):
+    """Recognize faces on sampled frames of one chunk
+
+    Returns (path, {student_id: sampled frames seen}, frames decoded, frames processed).
+    """
+    path, start_frame, end_frame, fps = chunk
+    step = max(1, int(round(sample_interval * fps)))
+
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    sightings = {}
+    frames_processed = 0
+    frame_index = start_frame
+    while frame_index < end_frame:
+        # grab() skips decoding for frames that are not sampled
+        if not cap.grab():
+            break
+        if (frame_index - start_frame) % step == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                _, matches = worker_recognizer.process_frame(frame)
+                frames_processed += 1
+                for student_id, _, _ in matches:
+                    if student_id != UNKNOWN:
+                        sightings[student_id] = sightings.get(student_id, 0) + 1
+        frame_index += 1
+
+    cap.release()
+    return path, sightings, frame_index - start_frame, frames_processed
+
+def process_chunk_in_worker(args):
+    """Pool entry point"""
+    chunk, sample_interval = args
+    return process_chunk(chunk, sample_interval)
+
+def lecture_for_video(path, lecture_id=None):
+    """Lecture a video belongs to: the given lecture ID, else the file name without extension"""
+    return lecture_id or os.path.splitext(os.path.basename(path))[0]
+
+def create_video_lectures(db, chunks, lecture_id=None, course_code=None, instructor=None, room=None):
+    """Create the lecture of every video, started when its recording started, returns the lecture IDs
+
+    A recording is taken to have started its length before the file was last written.
+    """
+    lengths = {}
+    for path, start, end, fps in chunks:
+        lengths[path] = lengths.get(path, 0.0) + (end - start) / fps
+    lectures = {}
+    for path, seconds in lengths.items():
+        start_time = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=seconds)
+        lecture = lecture_for_video(path, lecture_id)
+        lectures[lecture] = min(lectures.get(lecture, start_time), start_time)
+    for lecture, start_time in lectures.items():
+        print(db.create_lecture(lecture, course_code, instructor or "", room or "", start_time))
+    return list(lectures)
+
+def process_videos(db, video_paths, lecture_id=None, workers=None, chunk_seconds=300, sample_interval=1.0,
+                   min_sightings=2, recognizer_options=None, course_code=None, instructor=None, room=None):
+    """Take attendance from recorded lecture videos faster than real time
+
+    Videos are split into time chunks spread across a process pool. The
+    gallery is loaded once and shared with the workers through shared memory.
+    Students seen on at least min_sightings sampled frames of a lecture are
+    marked present with one bulk write. Every video's lecture is created in
+    course_code before the marks are written and ended after them, so the
+    marks count in the course rollups.
+    """
+    from recognize import FaceRecognitionAttendance
+
+    recognizer_options = recognizer_options or {}
+    start_time = time.time()
+
+    # Load the gallery once in the parent and publish it to the workers
+    loader = FaceRecognitionAttendance(db, **recognizer_options)
+    shared = SharedGallery.create(loader.known_face_encodings, loader.known_face_ids, loader.known_face_names)
+
+    # Workers only identify faces, the snapshot and writes stay in the parent. Chunks
+    # of different videos interleave on a worker, so nothing may carry over between
+    # frames: tracking and the motion gate (which reuses the last frame's faces) are off
+    worker_options = dict(recognizer_options, snapshot_folder=None, tracking=False, motion_gating=False)
+
+    chunks = plan_chunks(video_paths, chunk_seconds)
+    print(f"Processing {len(video_paths)} videos as {len(chunks)} chunks of {chunk_seconds}s")
+    lectures = create_video_lectures(db, chunks, lecture_id, course_code, instructor, room)
+
+    sightings_per_lecture = {}
+    frames_decoded = 0
+    frames_processed = 0
+    video_seconds = 0.0
+    try:
+        with Pool(processes=workers, initializer=init_worker,
+                  initargs=(shared.descriptor(), worker_options)) as pool:
+            jobs = [(chunk, sample_interval) for chunk in chunks]
+            for index, (path, sightings, decoded, processed) in enumerate(
+                    pool.imap_unordered(process_chunk_in_worker, jobs), start=1):
+                lecture_sightings = sightings_per_lecture.setdefault(lecture_for_video(path, lecture_id), {})
+                for student_id, count in sightings.items():
+                    lecture_sightings[student_id] = lecture_sightings.get(student_id, 0) + count
+                frames_decoded += decoded
+                frames_processed += processed
+                print(f"Finished chunk {index}/{len(chunks)} of {os.path.basename(path)}")
+        video_seconds = sum((end - start) / fps for _, start, end, fps in chunks)
+    finally:
+        shared.close()
+
+    # One deduplicated set of marks per lecture, written in bulk
+    timestamp = datetime.now()
+    marks = []
+    for lecture, sightings in sightings_per_lecture.items():
+        present = sorted(student_id for student_id, count in sightings.items() if count >= min_sightings)
+        print(f"Lecture {lecture}: {len(present)} students present")
+        marks.extend((student_id, lecture, timestamp) for student_id in present)
+    inserted = db.mark_attendance_bulk(marks)
+    print(f"Wrote {len(marks)} attendance marks ({inserted} new)")
+    for lecture in lectures:
+        print(db.end_lecture(lecture))
+
+    # Throughput report
+    elapsed = time.time() - start_time
+    report = {
+        "videos": len(video_paths),
+        "chunks": len(chunks),
+        "frames_decoded": frames_decoded,
+        "frames_processed": frames_processed,
+        "video_seconds": round(video_seconds, 1),
+        "wall_seconds": round(elapsed, 1),
+        "frames_per_second": round(frames_decoded / elapsed, 1) if elapsed else 0.0,
+        "processed_frames_per_second": round(frames_processed / elapsed, 1) if elapsed else 0.0,
+        "realtime_factor": round(video_seconds / elapsed, 1) if elapsed else 0.0,
+        "videos_per_hour": round(3600.0 * len(video_paths) / elapsed, 1) if elapsed else 0.0,
+    }
+    print("Throughput:", report)
+    return report